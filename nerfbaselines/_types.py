@@ -286,18 +286,18 @@ class _IncompleteDataset(TypedDict, total=True):
     sampling_mask_paths: Optional[List[str]]
     sampling_mask_paths_root: Optional[str]
     metadata: Dict
-    sampling_masks: Optional[Union[np.ndarray, List[np.ndarray]]]  # [N][H, W]
+    sampling_masks: Optional[Union[np.ndarray, List[np.ndarray], Sequence[np.ndarray]]]  # [N][H, W]
     points3D_xyz: Optional[np.ndarray]  # [M, 3]
     points3D_rgb: Optional[np.ndarray]  # [M, 3]
     images_points3D_indices: Optional[List[np.ndarray]]  # [N][<M]
 
 
 class UnloadedDataset(_IncompleteDataset):
-    images: NotRequired[Optional[Union[np.ndarray, List[np.ndarray]]]]  # [N][H, W, 3]
+    images: NotRequired[Optional[Union[np.ndarray, List[np.ndarray], Sequence[np.ndarray]]]]  # [N][H, W, 3]
 
 
 class Dataset(_IncompleteDataset):
-    images: Union[np.ndarray, List[np.ndarray]]  # [N][H, W, 3]
+    images: Union[np.ndarray, List[np.ndarray], Sequence[np.ndarray]]  # [N][H, W, 3]
 
 
 @overload
@@ -514,6 +514,18 @@ class EvaluationProtocol(Protocol):
     def evaluate(self, predictions: RenderOutput, dataset: Dataset) -> Dict[str, Union[float, int]]:
         ...
 
+    def evaluate_batch(self, predictions: Sequence[RenderOutput], dataset: Dataset) -> List[Dict[str, Union[float, int]]]:
+        """
+        Evaluate multiple predictions of the same size at once (optional, used for batched evaluation).
+        The results must match calling `evaluate` for each prediction (up to floating point precision).
+        If not implemented, the predictions are evaluated one by one.
+
+        Args:
+            predictions: Predictions of the same size.
+            dataset: A dataset with the ground-truth images (one for each prediction).
+        """
+        raise NotImplementedError()
+
     def accumulate_metrics(self, metrics: Iterable[Dict[str, Union[float, int]]]) -> Dict[str, Union[float, int]]:
         ...
 
@@ -15,5 +15,9 @@ from ._common import mount as mount
 from ._common import get_implemented_backends as get_implemented_backends
 from ._common import run_on_host as run_on_host
 from ._common import zero_copy as zero_copy
+from ._common import iterator_prefetch as iterator_prefetch
 from ._common import backend_allocate_ndarray as backend_allocate_ndarray
 from ._common import backend_allocate as backend_allocate
+
+from ._tracing import RPCTracer as RPCTracer
+from ._tracing import rpc_tracing as rpc_tracing
@@ -212,6 +212,10 @@ class ApptainerBackend(RemoteProcessRPCBackend):
         self._applied_mounts = None
         super().__exit__(*args)
 
+    def _get_worker_pool_key(self):
+        # The container is started with the current mounts, therefore, it cannot be reused
+        return None
+
     def _customize_wrapper(self, ns):
         ns = super()._customize_wrapper(ns)
         assert self._tmpdir is not None, "Temporary directory is not initialized"
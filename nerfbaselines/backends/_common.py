@@ -8,6 +8,7 @@ import sys
 from collections import deque
 import threading
 import importlib
+from concurrent.futures import Future
 from pathlib import Path
 import shutil
 from typing import Optional
@@ -78,6 +79,8 @@ class BackendOptions:
     """
     zero_copy: bool = False
     """If True, zero-copy is enabled for the current thread."""
+    iterator_prefetch: int = int(os.environ.get("NERFBASELINES_ITERATOR_PREFETCH", "1"))
+    """Maximum number of items pulled from remote iterators in a single round trip."""
 
 
 def current_backend_options() -> BackendOptions:
@@ -88,6 +91,21 @@ def current_backend_options() -> BackendOptions:
     return _backend_options.get(tid, BackendOptions())
 
 
+@contextlib.contextmanager
+def _use_backend_options(options: BackendOptions):
+    # Applies backend options captured in another thread (e.g., by `current_backend_options`)
+    tid = threading.get_ident()
+    backup = _backend_options.get(tid)
+    _backend_options[tid] = options
+    try:
+        yield
+    finally:
+        if backup is None:
+            _backend_options.pop(tid, None)
+        else:
+            _backend_options[tid] = backup
+
+
 @contextlib.contextmanager
 def zero_copy(zero_copy: bool = True):
     '''
@@ -95,9 +113,11 @@ def zero_copy(zero_copy: bool = True):
     Zero-copy is used for all subsequent calls for all backends.
     A zero-copy mode instructs the backend to reuse the shared memory
     used for data transfer. This is useful when the data is large and
-    speed is important. However, it is important to only use results
-    of backend calls inside the context manager. The data will be
-    overwritten by subsequent calls.
+    speed is important. The results are views into the shared memory,
+    which is only returned to the backend once the results are deleted.
+    Therefore, the results should not be kept longer than needed,
+    otherwise the shared memory pool is exhausted and the data are
+    sent over the (slower) socket connection.
 
     Args:
         zero_copy: If True, zero-copy is enabled for the current thread.
@@ -115,6 +135,33 @@ def zero_copy(zero_copy: bool = True):
         _backend_options[tid] = dataclasses.replace(_backend_options[tid], **backup)
 
 
+@contextlib.contextmanager
+def iterator_prefetch(window: int):
+    '''
+    A context manager that sets how many items are pulled from iterators returned
+    by remote backends (e.g., generators returned by method calls) in a single round trip.
+    The setting applies to iterators returned by calls made inside the context manager.
+    The worker runs the generator ahead of the consumer (by up to `window` items), 
+    therefore it should only be used for generators without side effects depending
+    on the consumer. The worker also stops pulling items early if the
+    pulled items are large (see `_rpc._ITERATOR_PREFETCH_MAX_BYTES`).
+
+    Args:
+        window: Maximum number of items pulled in a single round trip (1 disables prefetching).
+    '''
+    if window < 1:
+        raise ValueError(f"Prefetch window must be at least 1, got {window}")
+    tid = threading.get_ident()
+    if tid not in _backend_options:
+        _backend_options[tid] = BackendOptions()
+    backup = _backend_options[tid].iterator_prefetch
+    _backend_options[tid] = dataclasses.replace(_backend_options[tid], iterator_prefetch=window)
+    try:
+        yield
+    finally:
+        _backend_options[tid] = dataclasses.replace(_backend_options[tid], iterator_prefetch=backup)
+
+
 def mount(ps: Union[str, Path], pd: Union[str, Path]):
     tid = threading.get_ident()
     if _active_backend.get(tid):
@@ -274,6 +321,37 @@ class Backend(metaclass=_BackendMeta):
         del instance
         raise NotImplementedError("instance_del not implemented")
 
+    def static_call_async(self, function: str, *args, **kwargs) -> 'Future':
+        """
+        Same as `static_call`, but returns a future. Backends which support multiple
+        requests in flight (e.g., RPC backends) return before the call is finished.
+        """
+        return _call_as_future(self.static_call, function, *args, **kwargs)
+
+    def instance_call_async(self, instance: int, method: str, *args, **kwargs) -> 'Future':
+        """
+        Same as `instance_call`, but returns a future. Backends which support multiple
+        requests in flight (e.g., RPC backends) return before the call is finished.
+        """
+        return _call_as_future(self.instance_call, instance, method, *args, **kwargs)
+
+
+def _call_as_future(fn, *args, **kwargs) -> 'Future':
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+def is_remote_instance(obj) -> bool:
+    """
+    Returns True if the object is a proxy of an instance living in a backend worker (e.g., a method
+    running in a conda/docker/apptainer backend).
+    """
+    return getattr(type(obj), "__nb_virtual_instance__", None) is not None
+
 
 class SimpleBackend(Backend):
     name = "python"
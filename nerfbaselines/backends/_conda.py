@@ -181,6 +181,12 @@ class CondaBackend(RemoteProcessRPCBackend):
         args = [os.path.join(env_path, ".activate.sh")] + list(args)
         return super()._launch_worker(args, env)
 
+    def _get_worker_pool_key(self):
+        return super()._get_worker_pool_key() + (
+            self._spec.get("environment_name"), 
+            conda_get_environment_hash(self._spec),
+            os.environ.get("NERFBASELINES_CONDA_ENVIRONMENTS"))
+
     def install(self):
         package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         subprocess.check_call(["bash", "-l", "-c", conda_get_install_script(self._spec, package_path=package_path)])
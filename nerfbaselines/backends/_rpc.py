@@ -1,6 +1,14 @@
 import pprint
 from contextlib import nullcontext
 import collections.abc
+import itertools
+import gc
+import time
+import hashlib
+import json
+import stat
+import struct
+import socket
 import threading
 import shutil
 import tempfile
@@ -13,12 +21,15 @@ import dataclasses
 from functools import partial
 import types
 from dataclasses import dataclass
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict, Callable
 import inspect
 import logging
-from queue import Queue
+from queue import Queue, Empty
+from collections import deque
+from concurrent.futures import Future
 from ..utils import CancellationToken, CancelledException
 from . import _common
+from . import _tracing
 
 
 def _remap_error(e: BaseException):
@@ -164,6 +175,22 @@ def _replace_instances(registry, obj):
     return _VirtualInstance.get_virtual_instance(obj)
 
 
+# Name of the call pulling multiple items from remote iterators
+_ITERATOR_NEXT_BATCH = "__nb_next_batch__"
+# The worker stops pulling items from an iterator if the already pulled items exceed this size
+_ITERATOR_PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _get_nbytes(obj) -> int:
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return len(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum(_get_nbytes(x) for x in obj)
+    if isinstance(obj, dict):
+        return sum(_get_nbytes(x) for x in obj.values())
+    return int(getattr(obj, "nbytes", 0) or 0)
+
+
 def _is_generator(out):
     if isinstance(out, types.GeneratorType):
         return True
@@ -186,8 +213,40 @@ class RPCWorker:
         self._backend.instance_del(instance)
         return { "message": "del_ack" }
 
-    def _process_call(self, *, instance=None, name: str, kwargs, args, cancellation_token_id=None, **_):
+    def _pull_items(self, iterator, prefetch: int, cancel_context, errors):
+        # Pulls up to `prefetch` items from the iterator. The number of items is
+        # also bounded by the size of the items (such that large renders are not buffered).
+        items = []
+        nbytes = 0
+        while len(items) < max(1, prefetch) and nbytes < _ITERATOR_PREFETCH_MAX_BYTES:
+            try:
+                with cancel_context:
+                    item = next(iterator)
+            except StopIteration as e:
+                self._instances.pop(id(iterator), None)
+                errors["__next__"] = _remap_error(e)
+                break
+            except BaseException as e:
+                errors["__next__"] = _remap_error(e)
+                break
+            items.append(item)
+            nbytes += _get_nbytes(item)
+        return items
+
+    def _process_call(self, *, instance=None, name: str, kwargs, args, cancellation_token_id=None, iterator_prefetch=1, **_):
         try:
+            if cancellation_token_id is not None:
+                cancel_context = CancellationToken()
+                self._cancellation_tokens[cancellation_token_id] = cancel_context
+            else:
+                cancel_context = nullcontext()
+
+            if instance is not None and name == _ITERATOR_NEXT_BATCH:
+                # Pull the next batch of items from the iterator
+                out = {"message": "iterable_batch", "errors": {}}
+                out["next_results"] = self._pull_items(self._instances[instance], iterator_prefetch, cancel_context, out["errors"])
+                return out
+
             if instance is None:
                 fn = partial(self._backend.static_call, name)
             else:
@@ -197,11 +256,6 @@ class RPCWorker:
             args = tuple(self._instances[x.id] if isinstance(x, _VirtualInstance) else x for x in args)
             kwargs = {k:self._instances[x.id] if isinstance(x, _VirtualInstance) else x for k, x in kwargs.items()}
 
-            if cancellation_token_id is not None:
-                cancel_context = CancellationToken()
-                self._cancellation_tokens[cancellation_token_id] = cancel_context
-            else:
-                cancel_context = nullcontext()
             try:
                 with cancel_context:
                     result: Any = fn(*args, **kwargs)
@@ -221,17 +275,7 @@ class RPCWorker:
                         iterator = iter(result)
                     out["iterator"] = id(iterator)
                     self._instances[id(iterator)] = iterator
-                    try:
-                        with cancel_context:
-                            next_result = next(iterator)
-                        out["next_result"] = next_result,
-                    except StopIteration as e:
-                        self._instances.pop(id(iterator), None)
-                        out["errors"]["__next__"] = _remap_error(e)
-                        return out
-                    except BaseException as e:
-                        out["errors"]["__next__"] = _remap_error(e)
-                        return out
+                    out["next_results"] = self._pull_items(iterator, iterator_prefetch, cancel_context, out["errors"])
                 except BaseException as e:
                     out["errors"]["__iter__"] = _remap_error(e)
                     return out
@@ -266,14 +310,18 @@ class RPCWorker:
         logging.debug(f"Processing message {message}")
         msg_type = message["message"]
         if msg_type == "del":
-            return self._process_del(**message)
+            out = self._process_del(**message)
         elif msg_type == "call":
-            return self._process_call(**message)
+            out = self._process_call(**message)
         else:
-            return {
+            out = {
                 "message": "error",
                 "error": RuntimeError(f"Unknown message type {msg_type}")
             }
+        # The replies are matched to the requests by the request ID
+        if message.get("request_id") is not None:
+            out["request_id"] = message["request_id"]
+        return out
 
 
 def run_worker(*, protocol):
@@ -300,15 +348,27 @@ def run_worker(*, protocol):
         logging.info(f"Connection accepted, protocol: {protocol.protocol_name}")
         interrupt_thread.start()
         while interrupt_thread.is_alive():
-            msg = protocol.receive(channel=0)
+            receive_stats = {}
+            msg = protocol.receive(channel=0, stats=receive_stats)
             if msg.get("message") == "_safe_close":
                 safe_terminate = True
                 protocol.close()
                 break
+            execute_start = time.perf_counter()
             try:
-                outmsg = handle(msg)
+                # Outputs can be allocated directly in the shared memory (see `backend_allocate_ndarray`)
+                with _common.set_allocator(protocol.get_allocator(0)):
+                    outmsg = handle(msg)
             except BaseException as e:
                 outmsg = {"message": "error", "error": RuntimeError("Unhandled error: "+str(e))}
+            if msg.get("trace"):
+                # The caller records the call spans (see `RPCTracer`)
+                outmsg["trace"] = {
+                    "receive": receive_stats.get("transfer", 0.0) + receive_stats.get("deserialize", 0.0),
+                    "execute": time.perf_counter() - execute_start,
+                }
+            if msg.get("request_id") is not None:
+                outmsg["request_id"] = msg["request_id"]
             protocol.send(outmsg)
         interrupt_thread.join()
         if not safe_terminate:
@@ -327,12 +387,241 @@ def get_safe_environment():
     return os.environ.copy()
 
 
+def _worker_pool_enabled() -> bool:
+    return os.environ.get("NERFBASELINES_WORKER_POOL", "0") == "1" and sys.platform != "win32"
+
+
+def _get_worker_pool_dir() -> str:
+    path = os.environ.get("NERFBASELINES_WORKER_POOL_DIR")
+    if not path and os.environ.get("XDG_RUNTIME_DIR"):
+        path = os.path.join(os.environ["XDG_RUNTIME_DIR"], "nerfbaselines")
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"nerfbaselines-{os.getuid()}")
+    return path
+
+
+def _get_worker_pool_path(*key_parts) -> Optional[str]:
+    """
+    Returns the path of the worker pool socket, or None if the pool directory cannot be used safely.
+    The directory must be owned by the current user and must not be accessible to other users
+    (otherwise, another user could impersonate the pool worker).
+    """
+    from nerfbaselines import __version__
+    key = hashlib.sha256(repr((__version__,) + key_parts).encode("utf8")).hexdigest()[:16]
+    path = _get_worker_pool_dir()
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+    except OSError as e:
+        logging.warning(f"Worker pool disabled, cannot create the directory {path}: {e}")
+        return None
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        logging.warning(f"Worker pool disabled, the directory {path} must be owned by the current user and have mode 0700")
+        return None
+    return os.path.join(path, f"worker-{key}.sock")
+
+
+# Environment variables affecting the worker (e.g., the registered methods, the import paths, or the devices).
+# Workers are only reused by backends with the same values.
+_WORKER_POOL_ENVIRONMENT_PREFIXES = ("NERFBASELINES_", "PYTHON", "CUDA_", "LD_LIBRARY_PATH", "TORCH_", "XLA_")
+# Variables configuring the pool itself (they do not affect the worker)
+_WORKER_POOL_ENVIRONMENT_IGNORED = ("NERFBASELINES_WORKER_POOL", "NERFBASELINES_WORKER_POOL_DIR", "NERFBASELINES_WORKER_POOL_IDLE_TIMEOUT")
+# Time to wait for the pool worker to connect after accepting the session
+_WORKER_POOL_CONNECT_TIMEOUT = 30.
+
+
+def _get_worker_pool_environment_key() -> str:
+    env = get_safe_environment()
+    items = sorted(
+        (k, v) for k, v in env.items() 
+        if k.startswith(_WORKER_POOL_ENVIRONMENT_PREFIXES) and k not in _WORKER_POOL_ENVIRONMENT_IGNORED)
+    return hashlib.sha256(json.dumps(items).encode("utf8")).hexdigest()
+
+
+# Maximum size of a worker pool handshake message
+_WORKER_POOL_MAX_MESSAGE_SIZE = 64 * 1024
+
+
+def _worker_pool_send(conn, message):
+    # The handshake uses JSON (never pickle), the peer is not trusted before the session is established
+    def encode(value):
+        if isinstance(value, bytes):
+            return {"__bytes__": value.hex()}
+        if isinstance(value, dict):
+            return {k: encode(v) for k, v in value.items()}
+        return value
+    data = json.dumps(encode(message)).encode("utf8")
+    conn.sendall(struct.pack("!I", len(data)) + data)
+
+
+def _worker_pool_recv(conn):
+    def recv_exactly(size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError("Connection closed")
+            data += chunk
+        return data
+
+    size, = struct.unpack("!I", recv_exactly(4))
+    if size > _WORKER_POOL_MAX_MESSAGE_SIZE:
+        raise EOFError(f"Worker pool message too large ({size} bytes)")
+    message = json.loads(recv_exactly(size).decode("utf8"))
+    if not isinstance(message, dict):
+        raise EOFError("Invalid worker pool message")
+
+    def decode(value):
+        if isinstance(value, dict) and set(value.keys()) == {"__bytes__"}:
+            return bytes.fromhex(value["__bytes__"])
+        if isinstance(value, dict):
+            return {k: decode(v) for k, v in value.items()}
+        return value
+    return {k: decode(v) for k, v in message.items()}
+
+
+def _worker_pool_listen(path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(path)
+    except OSError:
+        # The socket already exists. If no worker is listening, it is stale and we replace it.
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            listener.close()
+            return None
+        except OSError:
+            pass
+        finally:
+            probe.close()
+        try:
+            os.unlink(path)
+            listener.bind(path)
+        except OSError:
+            listener.close()
+            return None
+    listener.listen(4)
+    return listener
+
+
+def _worker_pool_accept(listener, sessions, lock, state):
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except OSError:
+            # The listener was closed
+            return
+        try:
+            with conn:
+                conn.settimeout(5)
+                msg = _worker_pool_recv(conn)
+                with lock:
+                    if state["busy"] or state["closing"]:
+                        reply = {"message": "busy"}
+                    elif msg.get("message") == "session":
+                        state["busy"] = True
+                        sessions.put((msg["configuration"], msg.get("cwd")))
+                        reply = {"message": "session_ack"}
+                    else:
+                        reply = {"message": "error", "error": f"Unknown message {msg.get('message')}"}
+                _worker_pool_send(conn, reply)
+        except (OSError, EOFError, ValueError) as e:
+            logging.debug("Failed to handle worker pool connection", exc_info=e)
+
+
+def _release_worker_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_initialized():
+        torch.cuda.empty_cache()
+
+
+def run_worker_pool(*, protocol, pool_path: str, idle_timeout: Optional[float] = None):
+    """
+    Runs the worker for the first session and keeps it alive afterwards, such that
+    subsequent backends with the same environment can attach to it (see `_attach_pool_worker`)
+    and skip the environment startup. The worker exits after `idle_timeout` seconds without a session.
+    """
+    if idle_timeout is None:
+        idle_timeout = float(os.environ.get("NERFBASELINES_WORKER_POOL_IDLE_TIMEOUT", "600"))
+    listener = _worker_pool_listen(pool_path)
+    if listener is None:
+        # Another worker already serves the pool
+        logging.debug(f"Worker pool {pool_path} is already served by another worker")
+        run_worker(protocol=protocol)
+        return
+
+    lock = threading.Lock()
+    state = {"busy": True, "closing": False}
+    sessions = Queue()
+    accept_thread = threading.Thread(target=_worker_pool_accept, args=(listener, sessions, lock, state), daemon=True)
+    accept_thread.start()
+    try:
+        while True:
+            run_worker(protocol=protocol)
+            _release_worker_memory()
+            with lock:
+                state["busy"] = False
+            try:
+                configuration, cwd = sessions.get(timeout=idle_timeout)
+            except Empty:
+                with lock:
+                    if sessions.empty():
+                        state["closing"] = True
+                        logging.info("Backend worker idle, shutting down")
+                        break
+                configuration, cwd = sessions.get()
+            logging.info("Backend worker attached to a new session")
+            if cwd is not None and os.path.isdir(cwd):
+                os.chdir(cwd)
+            protocol = protocol.__class__(**configuration)
+    finally:
+        listener.close()
+        try:
+            os.unlink(pool_path)
+        except OSError:
+            pass
+
+
+def _attach_pool_worker(pool_path: str, configuration, timeout: float = 5.) -> bool:
+    # Asks a running pool worker to connect to the host with the given configuration.
+    # Returns False if there is no healthy idle worker.
+    if not os.path.exists(pool_path):
+        return False
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(timeout)
+            conn.connect(pool_path)
+            _worker_pool_send(conn, {
+                "message": "session",
+                "configuration": configuration,
+                "cwd": os.getcwd(),
+            })
+            reply = _worker_pool_recv(conn)
+        except (OSError, EOFError, ValueError) as e:
+            logging.debug(f"Failed to attach to the worker pool {pool_path}", exc_info=e)
+            return False
+        finally:
+            conn.close()
+        if reply.get("message") == "session_ack":
+            return True
+        if reply.get("message") != "busy" or time.monotonic() > deadline:
+            logging.debug(f"Worker pool {pool_path} rejected the session: {reply}")
+            return False
+        # The worker can still be finishing the previous session
+        time.sleep(0.1)
+
+
 class _IterableResultProxy:
-    def __init__(self, backend, iterator_id, next_result, errors):
+    def __init__(self, backend, iterator_id, next_results, errors, prefetch=1):
         self._iterator_id = iterator_id
-        self._next_result = next_result
+        self._buffer = deque(next_results or ())
         self._errors = errors
         self._backend = backend
+        self._prefetch = prefetch
 
     def __iter__(self):
         if "__iter__" in self._errors:
@@ -341,16 +630,22 @@ class _IterableResultProxy:
 
     def __next__(self):
         try:
-            if "__next__" in self._errors:
-                raise self._errors["__next__"]
-            if self._next_result is not None:
-                out = self._next_result[0]
-                self._next_result = None
-                return out
-            if self._iterator_id is None:
-                raise RuntimeError("Iterator is closed")
-            CancellationToken.cancel_if_requested()
-            return self._backend.instance_call(self._iterator_id, "__next__")
+            while True:
+                if self._buffer:
+                    return self._buffer.popleft()
+                if "__next__" in self._errors:
+                    raise self._errors["__next__"]
+                if self._iterator_id is None:
+                    raise RuntimeError("Iterator is closed")
+                CancellationToken.cancel_if_requested()
+                if self._prefetch <= 1:
+                    return self._backend.instance_call(self._iterator_id, "__next__")
+
+                # Pull multiple items in a single round trip
+                with _common.iterator_prefetch(self._prefetch):
+                    next_results, errors = self._backend.instance_call(self._iterator_id, _ITERATOR_NEXT_BATCH)
+                self._buffer.extend(next_results)
+                self._errors.update(errors)
         except StopIteration:
             self._iterator_id = None
             raise
@@ -364,22 +659,173 @@ class _IterableResultProxy:
         self.close()
 
 
+class _RPCFuture(Future):
+    """
+    Future returned by the RPCBackend async API. If there is no background
+    thread receiving the replies, waiting for the result receives the replies
+    (possibly of other requests) on the calling thread.
+    """
+    def __init__(self, backend: 'RPCBackend'):
+        super().__init__()
+        self._backend = backend
+
+    def result(self, timeout=None):
+        self._backend._wait_for(self)
+        return super().result(timeout)
+
+    def exception(self, timeout=None):
+        self._backend._wait_for(self)
+        return super().exception(timeout)
+
+
 class RPCBackend(_common.Backend):
-    def __init__(self, protocol, customize_wrapper=None):
+    def __init__(self, protocol, customize_wrapper=None, max_in_flight: Optional[int] = None):
         self._protocol = protocol
         self._customize_wrapper = customize_wrapper
         self._remote_instances_counter = {}
         self._interrupt_lock = threading.Lock()
         self._main_lock = threading.Lock()
+        self._receive_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        # Maps request IDs to (future, zero_copy, postprocess) in the order in which the requests were sent
+        self._pending: Dict[int, Any] = {}
+        self._request_counter = itertools.count(1)
+        if max_in_flight is None:
+            max_in_flight = int(os.environ.get("NERFBASELINES_RPC_MAX_IN_FLIGHT", "4"))
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._receiver_thread = None
 
     def _send_interrupt(self, message):
         with self._interrupt_lock:
             self._protocol.send(message, channel=1)
 
+    def _send_async(self, message, zero_copy=False, postprocess: Optional[Callable[[Any], Any]] = None, trace=None) -> Future:
+        # Bound the number of requests in flight
+        self._in_flight.acquire()
+        future = _RPCFuture(self)
+        request_id = None
+        registered = False
+        try:
+            with self._main_lock:
+                request_id = next(self._request_counter)
+                with self._pending_lock:
+                    exclusive = not self._pending
+                    self._pending[request_id] = (future, zero_copy, postprocess, trace)
+                    registered = True
+                if not exclusive:
+                    # Multiple requests are in flight. We start a thread receiving the replies
+                    # such that the worker is never blocked by sending the replies.
+                    self._ensure_receiver_thread()
+                if trace is None:
+                    self._protocol.send({**message, "request_id": request_id})
+                else:
+                    tracer, span = trace
+                    span["send_stats"] = {}
+                    self._protocol.send({**message, "request_id": request_id, "trace": True}, stats=span["send_stats"])
+                    # The reply can already be received by the receiver thread
+                    tracer.update(span, sent=time.perf_counter())
+        except BaseException:
+            with self._pending_lock:
+                # If the request is no longer pending, the slot was already released
+                release = not registered or self._pending.pop(request_id, None) is not None
+            if release:
+                self._in_flight.release()
+            raise
+        return future
+
     def _send(self, message, zero_copy=False):
-        with self._main_lock:
-            self._protocol.send(message)
-            return self._protocol.receive(channel=0, zero_copy=zero_copy)
+        return self._send_async(message, zero_copy=zero_copy).result()
+
+    def _receive_one(self):
+        with self._pending_lock:
+            # The replies are sent in the same order as the requests,
+            # therefore the next reply belongs to the oldest pending request
+            oldest = next(iter(self._pending.values()), None)
+        zero_copy = oldest[1] if oldest is not None else False
+        receive_stats = {} if oldest is not None and oldest[3] is not None else None
+        try:
+            if receive_stats is None:
+                msg = self._protocol.receive(channel=0, zero_copy=zero_copy)
+            else:
+                msg = self._protocol.receive(channel=0, zero_copy=zero_copy, stats=receive_stats)
+        except Exception as e:
+            if isinstance(e, ConnectionError):
+                self._fail_pending(e)
+                raise
+            # The reply was received, but it could not be deserialized (e.g., an exception class
+            # which only exists in the worker environment). The connection is still usable.
+            with self._pending_lock:
+                request_id = next(iter(self._pending.keys()), None)
+                request = self._pending.pop(request_id, None) if request_id is not None else None
+            if request is None:
+                raise
+            self._in_flight.release()
+            request[0].set_exception(e)
+            return
+        except BaseException as e:
+            # The message was not fully received, the connection cannot be used anymore
+            self._fail_pending(e)
+            raise
+        with self._pending_lock:
+            request = self._pending.pop(msg.get("request_id"), None)
+        if request is None:
+            logging.warning(f"Received reply for unknown request {msg.get('request_id')}")
+            return
+        self._in_flight.release()
+        future, _, postprocess, trace = request
+        try:
+            future.set_result(postprocess(msg) if postprocess is not None else msg)
+        except BaseException as e:
+            future.set_exception(e)
+        if trace is not None:
+            tracer, span = trace
+            tracer.update(span,
+                          end=time.perf_counter(),
+                          reply=receive_stats["start"] if receive_stats else None,
+                          receive_stats=receive_stats,
+                          worker_stats=msg.get("trace"))
+
+    def _fail_pending(self, error):
+        # The connection is broken, all pending requests fail
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, *_ in pending:
+            self._in_flight.release()
+            future.set_exception(error)
+
+    def _is_receiver_running(self):
+        receiver_thread = self._receiver_thread
+        return receiver_thread is not None and receiver_thread.is_alive()
+
+    def _wait_for(self, future):
+        while not future.done():
+            if self._is_receiver_running():
+                # The replies are received by the receiver thread. If the thread fails,
+                # all pending requests fail with it.
+                Future.exception(future)
+                return
+            with self._receive_lock:
+                if future.done() or self._is_receiver_running():
+                    continue
+                self._receive_one()
+
+    def _receiver(self):
+        try:
+            while True:
+                with self._receive_lock:
+                    self._receive_one()
+        except BaseException as e:
+            logging.debug("RPC receiver thread finished", exc_info=e)
+        finally:
+            with self._main_lock:
+                if self._receiver_thread is threading.current_thread():
+                    self._receiver_thread = None
+
+    def _ensure_receiver_thread(self):
+        if not self._is_receiver_running():
+            self._receiver_thread = threading.Thread(target=self._receiver, daemon=True)
+            self._receiver_thread.start()
 
     def instance_del(self, instance: int):
         try:
@@ -399,12 +845,13 @@ class RPCBackend(_common.Backend):
     def _fix_backend_for_virtual_instance(self, obj):
         return getattr(type(obj), "__nb_virtual_instance__", obj)
 
-    def _call(self, function: str, instance, *args, **kwargs) -> Any:
+    def _call_async(self, function: str, instance, *args, **kwargs) -> Future:
         with _common.set_allocator(self._protocol.get_allocator(0)):
             # 2) Add hook to the cancellation token
             cancellation_token_id = None
             cancellation_token = CancellationToken.current
             cancel_callback = None
+            remove_cancel_callback = None
             try:
                 if cancellation_token is not None:
                     cancellation_token_id = id(cancellation_token)
@@ -412,6 +859,7 @@ class RPCBackend(_common.Backend):
                         "message": "cancel", 
                         "cancellation_token_id": cancellation_token_id})
                     cancellation_token._callbacks.append(cancel_callback)
+                    remove_cancel_callback = lambda _: cancellation_token._callbacks.remove(cancel_callback)
 
                 args = tuple(self._fix_backend_for_virtual_instance(x) for x in args)
                 kwargs = {k:self._fix_backend_for_virtual_instance(x) for k, x in kwargs.items()}
@@ -424,30 +872,49 @@ class RPCBackend(_common.Backend):
                     "kwargs": kwargs,
                     "cancellation_token_id": id(cancellation_token) if cancellation_token is not None else None,
                 }
-                zero_copy = _common.current_backend_options().zero_copy
-                msg = self._send(message, zero_copy=zero_copy)
-            finally:
+                options = _common.current_backend_options()
+                if options.iterator_prefetch > 1:
+                    message["iterator_prefetch"] = options.iterator_prefetch
+                postprocess = partial(self._process_result, function, instance, options.iterator_prefetch)
+                tracer = _tracing.get_rpc_tracer()
+                trace = None
+                if tracer is not None:
+                    trace = tracer, {"name": function, "start": time.perf_counter(), "thread": threading.get_ident()}
+                future = self._send_async(message, zero_copy=options.zero_copy, postprocess=postprocess, trace=trace)
+            except BaseException:
                 if cancellation_token is not None and cancel_callback is not None:
                     cancellation_token._callbacks.remove(cancel_callback)
-            if msg["message"] == "iterable_result":
-                if msg.get("iterator_id") is not None:
-                    self._remote_instances_counter[msg["iterator_id"]] = 1
-                return _IterableResultProxy(
-                    self,
-                    msg.get("iterator"),
-                    msg.get("next_result"),
-                    msg.get("errors", {}))
-            elif msg["message"] == "result":
-                result = msg["result"]
-                if isinstance(result, _VirtualInstance):
-                    self._remote_instances_counter[result.id] = self._remote_instances_counter.get(result.id, 0) + 1
-                    return result.build_wrapper(self, customize=self._customize_wrapper)
-                return result
-            elif msg["message"] == "error":
-                raise msg["error"]
-            else:
-                print(function, instance, msg['message'])
-                raise RuntimeError(f"Unexpected message {msg['message']}")
+                raise
+            if remove_cancel_callback is not None:
+                future.add_done_callback(remove_cancel_callback)
+            return future
+
+    def _process_result(self, function: str, instance, iterator_prefetch: int, msg):
+        if msg["message"] == "iterable_result":
+            if msg.get("iterator_id") is not None:
+                self._remote_instances_counter[msg["iterator_id"]] = 1
+            return _IterableResultProxy(
+                self,
+                msg.get("iterator"),
+                msg.get("next_results"),
+                msg.get("errors", {}),
+                prefetch=iterator_prefetch)
+        elif msg["message"] == "iterable_batch":
+            return msg["next_results"], msg.get("errors", {})
+        elif msg["message"] == "result":
+            result = msg["result"]
+            if isinstance(result, _VirtualInstance):
+                self._remote_instances_counter[result.id] = self._remote_instances_counter.get(result.id, 0) + 1
+                return result.build_wrapper(self, customize=self._customize_wrapper)
+            return result
+        elif msg["message"] == "error":
+            raise msg["error"]
+        else:
+            print(function, instance, msg['message'])
+            raise RuntimeError(f"Unexpected message {msg['message']}")
+
+    def _call(self, function: str, instance, *args, **kwargs) -> Any:
+        return self._call_async(function, instance, *args, **kwargs).result()
 
     def static_call(self, function: str, *args, **kwargs) -> Any:
         return self._call(function, None, *args, **kwargs)
@@ -455,6 +922,12 @@ class RPCBackend(_common.Backend):
     def instance_call(self, instance: int, method: str, *args, **kwargs) -> Any:
         return self._call(method, instance, *args, **kwargs)
 
+    def static_call_async(self, function: str, *args, **kwargs) -> Future:
+        return self._call_async(function, None, *args, **kwargs)
+
+    def instance_call_async(self, instance: int, method: str, *args, **kwargs) -> Future:
+        return self._call_async(method, instance, *args, **kwargs)
+
 
 class RemoteProcessRPCBackend(_common.Backend):
     def __init__(self, *, python_path: Optional[str] = None, protocol=None):
@@ -466,6 +939,7 @@ class RemoteProcessRPCBackend(_common.Backend):
 
         self._worker_process: Optional[subprocess.Popen] = None
         self._worker_monitor_thread = None
+        self._worker_pool_path = None
         self._inside_context = False
 
     def __enter__(self):
@@ -498,6 +972,9 @@ class RemoteProcessRPCBackend(_common.Backend):
             self._worker_monitor_thread.join()
             self._worker_monitor_thread = None
         self._rpc_backend = None
+        if self._worker_process is not None and self._worker_pool_path is not None:
+            # The worker stays alive in the pool (it exits after the idle timeout)
+            self._worker_process = None
         if self._worker_process is not None:
             if self._worker_process.poll() is None:
                 try:
@@ -516,11 +993,24 @@ class RemoteProcessRPCBackend(_common.Backend):
                 self._worker_process.wait()
 
     def _launch_worker(self, args, env):
+        if self._worker_pool_path is not None:
+            # The pool worker outlives the current process, therefore, it cannot write to our stdout
+            logging.info(f"Backend worker output is written to {self._worker_pool_path}.log")
+            with open(self._worker_pool_path + ".log", "a") as log:
+                return subprocess.Popen(args, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
         return subprocess.Popen(args, env=env, stdin=subprocess.DEVNULL)
 
     def _customize_wrapper(self, ns):
         return ns
 
+    def _get_worker_pool_key(self) -> Optional[Any]:
+        """
+        Returns the key identifying the worker environment. Workers with the same key are
+        reused across backends if the worker pool is enabled (NERFBASELINES_WORKER_POOL=1).
+        None disables the worker pool (e.g., if the worker depends on the current mounts).
+        """
+        return (type(self).__name__, self._python_path, _get_worker_pool_environment_key())
+
     def _worker_monitor(self):
         try:
             while self._worker_running and self._worker_process is not None:
@@ -549,10 +1039,39 @@ class RemoteProcessRPCBackend(_common.Backend):
 
         self._protocol.start_host()
         protocol_kwargs = self._protocol.get_worker_configuration()
+
+        # Try to attach to a running worker
+        self._worker_pool_path = None
+        pool_key = self._get_worker_pool_key() if _worker_pool_enabled() else None
+        if pool_key is not None:
+            self._worker_pool_path = _get_worker_pool_path(*pool_key)
+            if self._worker_pool_path is not None and _attach_pool_worker(self._worker_pool_path, protocol_kwargs):
+                logging.info("Attaching to a running backend worker")
+                try:
+                    self._protocol.wait_for_worker(timeout=_WORKER_POOL_CONNECT_TIMEOUT)
+                except TimeoutError:
+                    # A new worker is started instead. The host is restarted so that
+                    # the pool worker cannot connect later.
+                    logging.warning("Backend worker from the pool did not connect, starting a new worker")
+                    self._protocol.restart_host()
+                    protocol_kwargs = self._protocol.get_worker_configuration()
+                else:
+                    self._worker_running = True
+                    logging.info("Backend worker attached")
+                    if self._rpc_backend is None:
+                        self._rpc_backend = RPCBackend(
+                            self._protocol,
+                            customize_wrapper=self._customize_wrapper,
+                        )
+                    return
+
         init_protocol_code = ", ".join(
             f"{k}={pprint.pformat(v)}"
             for k, v in protocol_kwargs.items()
         )
+        run_code = f"rw(protocol=P({init_protocol_code}))"
+        if self._worker_pool_path is not None:
+            run_code = f"rwp(protocol=P({init_protocol_code}), pool_path={self._worker_pool_path!r})"
         code = f"""
 import os
 # Hack for now to fix the cv2 failed import inside a thread.
@@ -563,9 +1082,9 @@ except Exception:
     pass
 from nerfbaselines.backends._common import setup_logging
 setup_logging(verbose={is_verbose})
-from {run_worker.__module__} import {run_worker.__name__} as rw
+from {run_worker.__module__} import {run_worker.__name__} as rw, {run_worker_pool.__name__} as rwp
 from {self._protocol.__class__.__module__} import {self._protocol.__class__.__name__} as P
-rw(protocol=P({init_protocol_code}))
+{run_code}
 """
         env = get_safe_environment()
         args = ["python", "-c", code]
@@ -608,3 +1127,13 @@ rw(protocol=P({init_protocol_code}))
         self._ensure_started()
         assert self._rpc_backend is not None, "Backend not started"
         return self._rpc_backend.instance_del(instance)
+
+    def static_call_async(self, function: str, *args, **kwargs):
+        self._ensure_started()
+        assert self._rpc_backend is not None, "Backend not started"
+        return self._rpc_backend.static_call_async(function, *args, **kwargs)
+
+    def instance_call_async(self, instance: int, method: str, *args, **kwargs):
+        self._ensure_started()
+        assert self._rpc_backend is not None, "Backend not started"
+        return self._rpc_backend.instance_call_async(instance, method, *args, **kwargs)
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import logging
+import threading
+import contextlib
+from typing import Optional, Dict, Any, List, Iterator
+
+
+# Number of log2 buckets of the latency histograms (1us .. ~36 hours)
+_NUM_BUCKETS = 38
+_MAX_SPANS = 200_000
+
+
+class _Histogram:
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * _NUM_BUCKETS
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        micros = int(value * 1e6)
+        self.buckets[min(micros.bit_length(), _NUM_BUCKETS - 1)] += 1
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                # Upper bound of the bucket, clamped to the observed range
+                return min(max((2 ** i) * 1e-6, self.min), self.max)
+        return self.max
+
+
+class _MethodStats:
+    def __init__(self):
+        self.latency = _Histogram()
+        self.totals = dict(
+            serialize=0.0, send=0.0, wait=0.0, execute=0.0, receive=0.0, deserialize=0.0,
+            bytes_out=0, bytes_in=0, shm_bytes=0, socket_bytes=0, socket_fallbacks=0)
+
+
+class RPCTracer:
+    """
+    Collects per-call spans of the RPC backends. For each method, the call latencies
+    are aggregated into a log2 histogram and the individual spans can be exported
+    as a Chrome trace (``chrome://tracing`` or https://ui.perfetto.dev).
+    """
+    def __init__(self, max_spans: int = _MAX_SPANS):
+        self._lock = threading.Lock()
+        self._max_spans = max_spans
+        self._spans: List[Dict[str, Any]] = []
+        self._dropped_spans = 0
+        self._methods: Dict[str, _MethodStats] = {}
+        self._time_origin = time.perf_counter()
+
+    def update(self, span: Dict[str, Any], **values):
+        """
+        Updates the span of a call. The span is recorded once it has both
+        the time the request was sent (``sent``) and the time the call finished (``end``).
+        """
+        with self._lock:
+            span.update(values)
+            if "sent" not in span or "end" not in span:
+                return
+        self.record(span)
+
+    def record(self, span: Dict[str, Any]):
+        send_stats = span.get("send_stats") or {}
+        receive_stats = span.get("receive_stats") or {}
+        worker_stats = span.get("worker_stats") or {}
+        socket_bytes = send_stats.get("socket_bytes", 0) + receive_stats.get("socket_bytes", 0)
+        with self._lock:
+            stats = self._methods.get(span["name"])
+            if stats is None:
+                stats = self._methods[span["name"]] = _MethodStats()
+            stats.latency.add(span["end"] - span["start"])
+            totals = stats.totals
+            totals["serialize"] += send_stats.get("serialize", 0.0)
+            totals["send"] += send_stats.get("transfer", 0.0)
+            if span.get("reply") is not None:
+                totals["wait"] += span["reply"] - span["sent"]
+            totals["execute"] += worker_stats.get("execute", 0.0)
+            totals["receive"] += receive_stats.get("transfer", 0.0)
+            totals["deserialize"] += receive_stats.get("deserialize", 0.0)
+            totals["bytes_out"] += send_stats.get("bytes", 0)
+            totals["bytes_in"] += receive_stats.get("bytes", 0)
+            totals["shm_bytes"] += send_stats.get("shm_bytes", 0) + receive_stats.get("shm_bytes", 0)
+            totals["socket_bytes"] += socket_bytes
+            totals["socket_fallbacks"] += 1 if socket_bytes > 0 else 0
+            if len(self._spans) < self._max_spans:
+                self._spans.append(span)
+            else:
+                self._dropped_spans += 1
+
+    def get_histograms(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the statistics for each called method. The times are in seconds
+        (the component times are means over all calls), the sizes are in bytes.
+        ``socket_fallbacks`` is the number of calls which sent (some of) the out-of-band
+        buffers over the pipe/socket instead of the shared memory.
+        """
+        out = {}
+        with self._lock:
+            for name, stats in self._methods.items():
+                latency = stats.latency
+                count = max(latency.count, 1)
+                out[name] = {
+                    "count": latency.count,
+                    "mean": latency.total / count,
+                    "min": latency.min if latency.count else 0.0,
+                    "max": latency.max,
+                    "p50": latency.percentile(0.5),
+                    "p90": latency.percentile(0.9),
+                    "p99": latency.percentile(0.99),
+                    "buckets": {f"<{2**i}us": n for i, n in enumerate(latency.buckets) if n > 0},
+                    **{k: (v / count if isinstance(v, float) else v) for k, v in stats.totals.items()},
+                }
+        return out
+
+    def format_summary(self) -> str:
+        lines = [f"{'method':<40} {'calls':>7} {'mean':>9} {'p50':>9} {'p99':>9} {'execute':>9} {'shm':>9} {'socket':>9} {'fallbacks':>9}"]
+        for name, stats in sorted(self.get_histograms().items(), key=lambda x: -x[1]["mean"] * x[1]["count"]):
+            lines.append(
+                f"{name:<40} {stats['count']:>7} "
+                f"{stats['mean']*1000:>7.2f}ms {stats['p50']*1000:>7.2f}ms {stats['p99']*1000:>7.2f}ms {stats['execute']*1000:>7.2f}ms "
+                f"{_format_bytes(stats['shm_bytes']):>9} {_format_bytes(stats['socket_bytes']):>9} {stats['socket_fallbacks']:>9}")
+        return "\n".join(lines)
+
+    def get_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Returns the recorded spans in the Chrome trace event format.
+        The worker spans are shown in a separate process. Since the clocks
+        of the host and the worker are not synchronized, the worker spans are
+        centered in the interval between sending the request and receiving the reply.
+        """
+        def us(t):
+            return (t - self._time_origin) * 1e6
+
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "host"}},
+            {"name": "process_name", "ph": "M", "pid": -pid, "args": {"name": "worker"}},
+        ]
+        with self._lock:
+            spans = list(self._spans)
+        for span in spans:
+            send_stats = span.get("send_stats") or {}
+            receive_stats = span.get("receive_stats") or {}
+            worker_stats = span.get("worker_stats") or {}
+            tid = span.get("thread", 0)
+            def add(name, start, duration, _pid=pid, _tid=tid, **args):
+                event = {"name": name, "cat": "rpc", "ph": "X", "ts": us(start), "dur": duration * 1e6, "pid": _pid, "tid": _tid}
+                if args:
+                    event["args"] = args
+                events.append(event)
+
+            add(span["name"], span["start"], span["end"] - span["start"],
+                bytes_out=send_stats.get("bytes", 0),
+                bytes_in=receive_stats.get("bytes", 0),
+                shm_bytes=send_stats.get("shm_bytes", 0) + receive_stats.get("shm_bytes", 0),
+                socket_bytes=send_stats.get("socket_bytes", 0) + receive_stats.get("socket_bytes", 0))
+            send_start = span["sent"] - send_stats.get("serialize", 0.0) - send_stats.get("transfer", 0.0)
+            add("serialize", send_start, send_stats.get("serialize", 0.0))
+            add("send", send_start + send_stats.get("serialize", 0.0), send_stats.get("transfer", 0.0))
+            if span.get("reply") is None:
+                continue
+            add("wait", span["sent"], span["reply"] - span["sent"])
+            add("receive", span["reply"], receive_stats.get("transfer", 0.0))
+            add("deserialize", span["reply"] + receive_stats.get("transfer", 0.0), receive_stats.get("deserialize", 0.0))
+            if worker_stats:
+                worker_time = worker_stats.get("receive", 0.0) + worker_stats.get("execute", 0.0)
+                worker_start = span["sent"] + max(0.0, span["reply"] - span["sent"] - worker_time) / 2
+                add(span["name"], worker_start, worker_time, _pid=-pid)
+                add("receive", worker_start, worker_stats.get("receive", 0.0), _pid=-pid)
+                add("execute", worker_start + worker_stats.get("receive", 0.0), worker_stats.get("execute", 0.0), _pid=-pid)
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"dropped_spans": self._dropped_spans}}
+
+    def save_chrome_trace(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.get_chrome_trace(), f)
+
+
+def _format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "K", "M", "G"):
+        if value < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+    return f"{value:.0f}T"
+
+
+_current_tracer: Optional[RPCTracer] = None
+
+
+def get_rpc_tracer() -> Optional[RPCTracer]:
+    return _current_tracer
+
+
+@contextlib.contextmanager
+def rpc_tracing(path: Optional[str] = None) -> Iterator[RPCTracer]:
+    """
+    Records the spans of all RPC calls made inside the context (from all threads).
+    The returned tracer can be used to inspect the latency histograms.
+    If ``path`` is set, the Chrome trace is written to the path when the context exits.
+
+    Example:
+        ```python
+        with rpc_tracing("trace.json") as tracer:
+            method.render(camera)
+        print(tracer.format_summary())
+        ```
+    """
+    global _current_tracer
+    tracer = RPCTracer()
+    backup = _current_tracer
+    _current_tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _current_tracer = backup
+        if path is not None:
+            tracer.save_chrome_trace(path)
+
+
+def _setup_env_tracer():
+    global _current_tracer
+    path = os.environ.get("NERFBASELINES_RPC_TRACE")
+    if not path:
+        return
+    tracer = _current_tracer = RPCTracer()
+
+    def _save():
+        # The backend workers inherit the environment, but only the callers record spans
+        if not tracer._spans:
+            return
+        try:
+            tracer.save_chrome_trace(path)
+            logging.info(f"RPC trace written to {path}\n{tracer.format_summary()}")
+        except Exception as e:
+            print(f"Failed to write the RPC trace to {path}: {e}", file=sys.stderr)
+
+    atexit.register(_save)
+
+
+_setup_env_tracer()
@@ -1,5 +1,7 @@
 import ctypes
 import functools
+import threading
+from collections import deque
 import weakref
 import stat
 import sys
@@ -21,69 +23,313 @@ except ImportError:
 
 
 DEFAULT_SHM_SIZE = 1080*1920*(12+12+12)
+DEFAULT_SHM_POOL_SIZE = 1024*1024*1024
+_SHM_ALIGNMENT = 64
+_SHM_SEGMENT_BITS = 48
+_SHM_OFFSET_MASK = (1 << _SHM_SEGMENT_BITS) - 1
+_NETWORK_BUFFER = 2**64-1
+_COMPRESSED_BUFFER = 2**64-2
+# Smaller buffers are not worth compressing
+_COMPRESS_MIN_SIZE = 64*1024
 
 
 def _noop(*args, **kwargs): del args, kwargs
 
 
+def _get_codec(name):
+    """
+    Returns a (compress, decompress) pair for the codec name, or None if the codec is not available.
+    """
+    if name is None:
+        return None
+    if name == "zlib":
+        import zlib
+        return functools.partial(zlib.compress, level=1), zlib.decompress
+    if name == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            return None
+        return lz4.frame.compress, functools.partial(lz4.frame.decompress, return_bytearray=True)
+    raise ValueError(f"Unsupported codec {name}, expected one of 'zlib', 'lz4'")
+
+
 def _tcp_generate_authkey():
     return secrets.token_hex(64).encode("ascii")
 
 
-class _allocator:
-    def __init__(self, buffer):
-        self._offset = 0
-        if buffer is not None:
-            self._buffer = weakref.ref(buffer)
-        else:
-            self._buffer = _noop
-    
+class _shm_segment:
+    # A ring buffer over a single shared memory segment
+    def __init__(self, shm, linked=False):
+        self.shm = shm
+        self.buffer = shm.buf
+        self.size = shm.buf.nbytes
+        self.linked = linked
+        self.head = 0
+        # Live allocations in the allocation order: [offset, size, refs, pending]
+        self.allocations = deque()
+
     def allocate(self, size):
-        buffer = self._buffer()
-        if buffer is None:
+        if not self.allocations:
+            offset = 0
+        else:
+            tail = self.allocations[0][0]
+            if self.head > tail:
+                if self.head + size <= self.size:
+                    offset = self.head
+                elif size <= tail:
+                    # Wrap around
+                    offset = 0
+                else:
+                    return None
+            elif self.head + size <= tail:
+                offset = self.head
+            else:
+                return None
+        if offset + size > self.size:
+            return None
+        self.allocations.append([offset, size, 0, True])
+        self.head = offset + size
+        return offset
+
+    def find(self, offset):
+        for allocation in self.allocations:
+            if allocation[0] <= offset < allocation[0] + allocation[1]:
+                return allocation
+        return None
+
+    def trim(self):
+        # Only the oldest allocations can be returned to the ring
+        allocations = self.allocations
+        while allocations and allocations[0][2] <= 0 and not allocations[0][3]:
+            allocations.popleft()
+        if not allocations:
+            self.head = 0
+
+    @property
+    def in_use(self):
+        return sum(x[1] for x in self.allocations)
+
+
+def _attach_shared_memory(name):
+    # Remove tracked shared memory as it is tracked (and unlinked) by the process which created it
+    from multiprocessing import resource_tracker
+    old_register = resource_tracker.register
+    try:
+        resource_tracker.register = _noop
+        shm = shared_memory.SharedMemory(name=name, create=False)
+    finally:
+        resource_tracker.register = old_register
+    shm.unlink = lambda: None
+    return shm
+
+
+class _allocator:
+    """
+    Ring allocator over a pool of shared memory segments. Each side only allocates
+    from the segments it created (the host owns the segment created in `start_host`,
+    further segments are created on demand up to `max_size` bytes). Buffers are leased
+    to the other side when a message referencing them is sent and they are returned
+    to the ring once the other side releases them (the release notices are sent back
+    with the next message). If the pool is exhausted, the buffers are sent over the socket
+    and the fallback is recorded in the stats.
+    """
+    def __init__(self, shm=None, *, is_host=True, segment_size=DEFAULT_SHM_SIZE, max_size=DEFAULT_SHM_POOL_SIZE):
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._peer_segments = {}
+        self._base_name = None
+        self._segment_size = segment_size
+        self._max_size = max_size
+        # Host creates segments with even IDs, worker with odd IDs
+        self._next_segment_id = 0 if is_host else 1
+        # Locations of the received buffers which are no longer used
+        self._released = deque()
+        self._stats = {
+            "allocations": 0,
+            "allocated_bytes": 0,
+            "fallbacks": 0,
+            "fallback_bytes": 0,
+        }
+        self._fallback_warned = False
+        if shm is not None:
+            self._base_name = shm.name
+            if is_host:
+                self._segments[0] = _shm_segment(shm)
+            else:
+                self._peer_segments[0] = shm
+            self._next_segment_id += 2
+
+    def _segment_name(self, segment_id):
+        return f"{self._base_name}_{segment_id}"
+
+    def _grow(self, size):
+        pool_size = sum(x.size for x in self._segments.values())
+        segment_size = max(size, self._segment_size)
+        if pool_size + segment_size > self._max_size:
+            segment_size = size
+        if pool_size + segment_size > self._max_size or shared_memory is None:
             return None
-        offset = self._offset
-        if offset + size > buffer.nbytes:
+        segment_id = self._next_segment_id
+        try:
+            shm = shared_memory.SharedMemory(name=self._segment_name(segment_id), create=True, size=segment_size)
+        except OSError as e:
+            logging.warning(f"Failed to allocate shared memory segment of size {_format_size(segment_size)}: {e}")
+            self._max_size = pool_size
             return None
-        out = buffer[offset:offset+size]
-        self._offset += size
-        return offset, out
+        self._next_segment_id += 2
+        logging.debug(f"Allocated shared memory segment {shm.name} of size {_format_size(segment_size)}")
+        self._segments[segment_id] = segment = _shm_segment(shm, linked=True)
+        return segment_id, segment
+
+    def allocate(self, size):
+        if self._base_name is None:
+            return None
+        nbytes = max(_SHM_ALIGNMENT, (size + _SHM_ALIGNMENT - 1) & ~(_SHM_ALIGNMENT - 1))
+        with self._lock:
+            for segment_id, segment in self._segments.items():
+                offset = segment.allocate(nbytes)
+                if offset is not None:
+                    break
+            else:
+                offset = None
+                grown = self._grow(nbytes)
+                if grown is not None:
+                    segment_id, segment = grown
+                    offset = segment.allocate(nbytes)
+            if offset is None:
+                self._stats["fallbacks"] += 1
+                self._stats["fallback_bytes"] += size
+                if not self._fallback_warned:
+                    self._fallback_warned = True
+                    logging.warning(f"Shared memory pool exhausted (requested {_format_size(size)}), "
+                                    "falling back to sending buffers over the socket. "
+                                    "Consider increasing NERFBASELINES_SHM_POOL_SIZE.")
+                return None
+            self._stats["allocations"] += 1
+            self._stats["allocated_bytes"] += size
+            return (segment_id << _SHM_SEGMENT_BITS) | offset, segment.buffer[offset:offset+size]
 
     def allocate_ndarray(self, shape, dtype):
         nelem = functools.reduce(lambda x, y: x * y, shape, 1)
         nbytes = nelem * np.dtype(dtype).itemsize
-        buffer = self._buffer()
-        allocation = self.allocate(nbytes)
-        if allocation is None or buffer is None:
+        allocation = self.allocate(nbytes) if nbytes > 0 else None
+        if allocation is None:
             return np.ndarray(shape, dtype=dtype)
-        offset, _ = allocation
-        return np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        _, buffer = allocation
+        return np.ndarray(shape, dtype=dtype, buffer=buffer)
 
     def get_allocation_offset(self, buffer):
-        self_buffer = self._buffer()
-        if self_buffer is None or buffer is None:
+        if buffer is None or buffer.readonly:
             return None
-        if self_buffer.readonly or buffer.readonly:
-            return None
-        self_ptr = ctypes.addressof(ctypes.c_char.from_buffer(self_buffer))
         buffer_ptr = ctypes.addressof(ctypes.c_char.from_buffer(buffer))
-        if self_ptr <= buffer_ptr < self_ptr + self_buffer.nbytes:
-            return buffer_ptr - self_ptr
+        for segment_id, segment in list(self._segments.items()):
+            self_ptr = ctypes.addressof(ctypes.c_char.from_buffer(segment.buffer))
+            if self_ptr <= buffer_ptr < self_ptr + segment.size:
+                return (segment_id << _SHM_SEGMENT_BITS) | (buffer_ptr - self_ptr)
         return None
 
-    def get(self, offset, size):
-        buffer = self._buffer()
-        assert buffer is not None, "Failed to access shared memory"
-        return buffer[offset:offset+size]
+    def _find(self, location):
+        segment = self._segments.get(location >> _SHM_SEGMENT_BITS)
+        if segment is None:
+            return None, None
+        return segment, segment.find(location & _SHM_OFFSET_MASK)
+
+    def acquire(self, location):
+        # Lease the allocation to the other side
+        with self._lock:
+            _, allocation = self._find(location)
+            if allocation is None:
+                return False
+            allocation[2] += 1
+            return True
+
+    def release(self, location):
+        with self._lock:
+            segment, allocation = self._find(location)
+            if allocation is None:
+                return
+            allocation[2] -= 1
+            segment.trim()
+            if segment.linked:
+                # The other side has already attached the segment, it is no longer needed to keep it linked
+                segment.linked = False
+                segment.shm.unlink()
 
     def reset(self):
-        self._offset = 0
+        # Called after a message was sent. Allocations which were not sent are returned to the ring.
+        with self._lock:
+            for segment in self._segments.values():
+                for allocation in segment.allocations:
+                    allocation[3] = False
+                segment.trim()
+
+    def get(self, location, size):
+        segment_id, offset = location >> _SHM_SEGMENT_BITS, location & _SHM_OFFSET_MASK
+        if segment_id in self._segments:
+            buffer = self._segments[segment_id].buffer
+        else:
+            shm = self._peer_segments.get(segment_id)
+            if shm is None:
+                assert self._base_name is not None, "Failed to access shared memory"
+                shm = self._peer_segments[segment_id] = _attach_shared_memory(self._segment_name(segment_id))
+            buffer = shm.buf
+        return buffer[offset:offset+size]
+
+    def receive(self, location, size, zero_copy=False):
+        buffer = self.get(location, size)
+        if not zero_copy:
+            buffer = bytearray(buffer)
+            self._released.append(location)
+            return buffer
+        # The buffer is released once all objects using it are deleted
+        lease = np.frombuffer(buffer, dtype=np.uint8)
+        weakref.finalize(lease, self._released.append, location)
+        return lease
+
+    def pop_released(self):
+        out = []
+        while True:
+            try:
+                out.append(self._released.popleft())
+            except IndexError:
+                return out
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "segments": len(self._segments),
+                "pool_size": sum(x.size for x in self._segments.values()),
+                "in_use": sum(x.in_use for x in self._segments.values()),
+            }
+
+    def close(self):
+        for segment in self._segments.values():
+            if segment.linked:
+                segment.linked = False
+                segment.shm.unlink()
+            segment.buffer = None
+            try:
+                segment.shm.close()
+            except (OSError, BufferError):
+                pass
+        for shm in self._peer_segments.values():
+            try:
+                shm.close()
+            except (OSError, BufferError):
+                pass
+        self._segments.clear()
+        self._peer_segments.clear()
+        self._base_name = None
 
 
 def _protocol_defaults():
     protocol_type = "auto"
     shm_size = DEFAULT_SHM_SIZE
+    shm_pool_size = DEFAULT_SHM_POOL_SIZE
     pickle_protocol = pickle.HIGHEST_PROTOCOL
+    codec = None
     hostname = "localhost"
     port = 0
 
@@ -111,6 +357,8 @@ def _protocol_defaults():
                     raise ValueError(f"Invalid shared memory size part {part} in NERFBASELINES_PROTOCOL={env_protocol}")
             elif part.startswith("pickle"):
                 pickle_protocol = int(part[6:])
+            elif part in ("zlib", "lz4"):
+                codec = part
             else:
                 raise ValueError(f"Unsupported protocol part {part} in NERFBASELINES_PROTOCOL={env_protocol}")
     env_hostname = os.environ.get("NERFBASELINES_TCP_HOSTNAME")
@@ -122,7 +370,10 @@ def _protocol_defaults():
     env_shm_size = os.environ.get("NERFBASELINES_SHM_SIZE")
     if env_shm_size is not None:
         shm_size = int(env_shm_size)
-    return protocol_type, shm_size, pickle_protocol, hostname, port
+    env_shm_pool_size = os.environ.get("NERFBASELINES_SHM_POOL_SIZE")
+    if env_shm_pool_size is not None:
+        shm_pool_size = int(env_shm_pool_size)
+    return protocol_type, shm_size, shm_pool_size, pickle_protocol, codec, hostname, port
 
 
 def _format_size(size):
@@ -146,7 +397,7 @@ def _socket_exists(path):
     return False
 
 
-def _tcp_pickle_recv(conn: socket.socket, allocator=None, zero_copy=False):
+def _tcp_pickle_recv(conn: socket.socket, allocator=None, zero_copy=False, codec=None, stats=None):
     def _read_buffer(size):
         buffer = bytearray(size)
         i = 0
@@ -158,31 +409,58 @@ def _tcp_pickle_recv(conn: socket.socket, allocator=None, zero_copy=False):
             i += n
         return buffer
 
-    data = conn.recv(12)
-    if len(data) < 12: raise EOFError
-    num_buffers, size, = struct.unpack("!iQ", data)
-    header = struct.unpack(f"!{(num_buffers-1)*2}Q", conn.recv(16*(num_buffers-1)))
+    data = conn.recv(16)
+    if len(data) < 16: raise EOFError
+    start = time.perf_counter()
+    shm_bytes = socket_bytes = 0
+    num_buffers, size, num_released = struct.unpack("!iQI", data)
+    header_size = 2*(num_buffers-1) + num_released
+    header = struct.unpack(f"!{header_size}Q", _read_buffer(8*header_size)) if header_size > 0 else ()
+    if num_released > 0:
+        # The other side no longer uses our shared memory buffers
+        assert allocator is not None, "Shared memory buffer without allocator"
+        for location in header[2*(num_buffers-1):]:
+            allocator.release(location)
     pickle_bytes = _read_buffer(size)
     buffers = []
-    for shm_offset, buffer_size in zip(header[::2], header[1::2]):
-        if shm_offset == 2**64-1:
+    for shm_location, buffer_size in zip(header[:2*(num_buffers-1):2], header[1:2*(num_buffers-1):2]):
+        if shm_location == _NETWORK_BUFFER:
             # Network buffer
             buffers.append(_read_buffer(buffer_size))
+            socket_bytes += buffer_size
+        elif shm_location == _COMPRESSED_BUFFER:
+            # Compressed network buffer (prefixed with the uncompressed size)
+            assert codec is not None, "Compressed buffer without codec"
+            data = _read_buffer(buffer_size)
+            raw_size, = struct.unpack("!Q", data[:8])
+            buffer = codec[1](memoryview(data)[8:])
+            if not isinstance(buffer, bytearray):
+                buffer = bytearray(buffer)
+            if len(buffer) != raw_size:
+                raise OSError("corrupted compressed buffer")
+            buffers.append(buffer)
+            socket_bytes += buffer_size
         else:
             # Shared memory buffer
             assert allocator is not None, "Shared memory buffer without allocator"
-            buffer = allocator.get(shm_offset, buffer_size)
-            # Perform copy here? (for zero_copy=False)
-            # NOTE: In the zero_copy mode, the buffer is not copied
-            # The data are only valid until the next send/recv call
-            if not zero_copy:
-                buffer = bytearray(buffer)
-            buffers.append(buffer)
+            # NOTE: In the zero_copy mode, the buffer is not copied.
+            # The buffer is leased until all objects using it are deleted.
+            buffers.append(allocator.receive(shm_location, buffer_size, zero_copy=zero_copy))
+            shm_bytes += buffer_size
+    transferred = time.perf_counter()
     with io.BytesIO(pickle_bytes) as buf:
         if buffers:
-            return pickle.load(buf, buffers=buffers)
+            message = pickle.load(buf, buffers=buffers)
         else:
-            return pickle.load(buf)
+            message = pickle.load(buf)
+    if stats is not None:
+        stats.update(start=start,
+                     transfer=transferred - start,
+                     deserialize=time.perf_counter() - transferred,
+                     bytes=size + shm_bytes + socket_bytes,
+                     shm_bytes=shm_bytes,
+                     socket_bytes=socket_bytes)
+    return message
 
 
 # def _align_page(offset):
@@ -193,7 +471,10 @@ def _tcp_pickle_recv(conn: socket.socket, allocator=None, zero_copy=False):
 def _tcp_pickle_send(conn: socket.socket, message, 
                      *,
                      pickle_protocol: int = pickle.HIGHEST_PROTOCOL,
-                     allocator=None):
+                     allocator=None,
+                     use_shm: bool = True,
+                     codec=None,
+                     stats=None):
     buffers = []
     def buffer_callback(buffer):
         size = buffer.raw().nbytes
@@ -201,41 +482,67 @@ def _tcp_pickle_send(conn: socket.socket, message,
         if size < 256: return True
         buffers.append(buffer.raw())
     network_buffers = []
+    start = time.perf_counter()
+    shm_bytes = socket_bytes = 0
     with io.BytesIO() as buf:
         if pickle_protocol >= 5:
             pickle.dump(message, buf, protocol=pickle_protocol, buffer_callback=buffer_callback)
         else:
             pickle.dump(message, buf, protocol=pickle_protocol)
+        serialized = time.perf_counter()
         size = buf.tell()
-        header = [len(buffers)+1, size]
+        released = allocator.pop_released() if allocator is not None else []
+        header = [len(buffers)+1, size, len(released)]
         buf.seek(0)
         for buffer in buffers:
-            # Check if buffer already is in allocator's memory
-            if allocator is not None:
-                shm_offset = allocator.get_allocation_offset(buffer)
-                if shm_offset is not None:
-                    header.append(shm_offset)
+            if allocator is not None and use_shm:
+                # Check if buffer already is in allocator's memory
+                shm_location = allocator.get_allocation_offset(buffer)
+                if shm_location is not None and allocator.acquire(shm_location):
+                    header.append(shm_location)
                     header.append(buffer.nbytes)
+                    shm_bytes += buffer.nbytes
                     continue
 
                 # Try allocating buffer in the shared memory
                 allocation = allocator.allocate(buffer.nbytes)
                 if allocation is not None:
                     # We will copy data to shared memory
-                    shm_offset, out_buffer = allocation
+                    shm_location, out_buffer = allocation
                     out_buffer[:] = buffer
-                    header.append(shm_offset)
+                    allocator.acquire(shm_location)
+                    header.append(shm_location)
                     header.append(buffer.nbytes)
+                    shm_bytes += buffer.nbytes
+                    continue
+
+            if codec is not None and buffer.nbytes >= _COMPRESS_MIN_SIZE:
+                compressed = codec[0](buffer)
+                # Only send compressed buffers if it pays off
+                if len(compressed) + 8 < 0.9 * buffer.nbytes:
+                    header.append(_COMPRESSED_BUFFER)
+                    network_buffers.append(struct.pack("!Q", buffer.nbytes))
+                    network_buffers.append(compressed)
+                    header.append(len(compressed) + 8)
+                    socket_bytes += len(compressed) + 8
                     continue
 
             # We will make it network buffer
-            header.append(2**64-1)
+            header.append(_NETWORK_BUFFER)
             network_buffers.append(buffer)
             header.append(buffer.nbytes)
-        conn.sendall(struct.pack(f"!i{len(header)-1}Q", *header))
+            socket_bytes += buffer.nbytes
+        header.extend(released)
+        conn.sendall(struct.pack(f"!iQI{len(header)-3}Q", *header))
         conn.sendall(buf.getbuffer())
         for buffer in network_buffers:
             conn.sendall(buffer)
+    if stats is not None:
+        stats.update(serialize=serialized - start,
+                     transfer=time.perf_counter() - serialized,
+                     bytes=size + shm_bytes + socket_bytes,
+                     shm_bytes=shm_bytes,
+                     socket_bytes=socket_bytes)
 
 
 class TransportPickler(pickle.Pickler):
@@ -250,11 +557,14 @@ class TransportProtocol:
                  authkey=None,
                  shm_name=None,
                  shm_size=None,
+                 shm_pool_size=None,
                  pipe_name=None,
                  pickle_protocol=pickle.HIGHEST_PROTOCOL,
+                 codec=None,
                  num_channels=2):
         self._hostname = hostname
         self._port = port
+        self._initial_port = port
         self._authkey = authkey
         self._pipe_name = pipe_name
 
@@ -267,7 +577,10 @@ class TransportProtocol:
         self._shm = None
         self._shm_name = shm_name
         self._shm_size = shm_size
+        self._shm_pool_size = shm_pool_size
         self._pickle_protocol = min(pickle_protocol, pickle.HIGHEST_PROTOCOL)
+        self._codec = codec
+        self._codec_fns = None
         self._tmpdir = None
         self._allocator = _allocator(None)
 
@@ -275,7 +588,7 @@ class TransportProtocol:
         assert self._pipe_listener is None and self._tcp_listener is None, "Already started"
         if self._authkey is None:
             self._authkey = _tcp_generate_authkey()
-        protocol_type, shm_size, pickle_protocol, hostname, port = _protocol_defaults()
+        protocol_type, shm_size, shm_pool_size, pickle_protocol, codec, hostname, port = _protocol_defaults()
         self._pickle_protocol = min(min(self._pickle_protocol, pickle_protocol), pickle.HIGHEST_PROTOCOL)
         if self._hostname is None:
             self._hostname = hostname
@@ -285,6 +598,13 @@ class TransportProtocol:
             self._shm_size = shm_size
             if shared_memory is None:
                 logging.error("Shared memory is not available")
+        if self._shm_pool_size is None:
+            self._shm_pool_size = max(shm_pool_size, self._shm_size)
+        if self._codec is None:
+            self._codec = codec
+        if self._codec is not None and _get_codec(self._codec) is None:
+            logging.warning(f"Codec {self._codec} is not available, the data will not be compressed")
+            self._codec = None
         self._is_host = True
         if protocol_type in ("tcp", "auto"):
             self._tcp_listener = socket.socket()
@@ -309,6 +629,17 @@ class TransportProtocol:
         else:
             self._shm_size = 0
 
+    def restart_host(self):
+        """
+        Closes the host and starts it again with a new configuration (listeners, authentication key,
+        and shared memory). Workers started with the previous configuration can no longer connect.
+        """
+        self.close()
+        self._authkey = None
+        self._port = self._initial_port
+        self._allocator = _allocator(None)
+        self.start_host()
+
     def _setup_protocol(self, conn):
         _tcp_pickle_send(conn, {
             "message": "ready",
@@ -352,6 +683,8 @@ class TransportProtocol:
         # Use the response to fix current configuration
         self._shm_size = setup_response["configuration"]["shm_size"]
         self._pickle_protocol = setup_response["configuration"]["pickle_protocol"]
+        self._codec = setup_response["configuration"].get("codec")
+        self._codec_fns = _get_codec(self._codec)
         if self._shm_size <= 0 and self._shm is not None:
             # Release the shared memory
             self._shm.close()
@@ -364,7 +697,7 @@ class TransportProtocol:
 
         # Setup the allocator
         if self._shm is not None:
-            self._allocator = _allocator(self._shm.buf)
+            self._allocator = _allocator(self._shm, is_host=True, segment_size=self._shm_size, max_size=self._shm_pool_size)
 
         # Release the listeners
         if self._tcp_listener is not None:
@@ -379,8 +712,10 @@ class TransportProtocol:
             "authkey": self._authkey,
             "shm_name": self._shm_name,
             "shm_size": self._shm_size,
+            "shm_pool_size": self._shm_pool_size,
             "num_channels": self._num_channels,
             "pickle_protocol": self._pickle_protocol,
+            "codec": self._codec,
         }
         if self._pipe_listener is not None:
             out["pipe_name"] = self._pipe_listener.getsockname()
@@ -391,20 +726,13 @@ class TransportProtocol:
     def _worker_try_setup_shm(self):
         # Try setup shared memory
         if self._shm_name is not None and shared_memory is not None:
-            # Remove tracked shared memory as it is already tracked in the main thread
-            from multiprocessing import resource_tracker
-            old_register = resource_tracker.register
             try:
-                resource_tracker.register = _noop
-                self._shm = shared_memory.SharedMemory(name=self._shm_name, create=False)
                 # Will be unlinked in the main thread
-                self._shm.unlink = lambda: None
+                self._shm = _attach_shared_memory(self._shm_name)
             except Exception as e:
                 logging.error(f"Failed to connect to shared memory {self._shm_name}: {e}")
                 self._shm_size = 0
                 self._shm_name = None
-            finally:
-                resource_tracker.register = old_register
         else:
             self._shm_size = 0
             self._shm_name = None
@@ -427,6 +755,11 @@ class TransportProtocol:
         deliver_challenge(conn, self._authkey)
         answer_challenge(conn, self._authkey)
 
+        # The codec is only used for TCP connections (pipes are local) and if it is available on both ends
+        if sock_args[0] != socket.AF_INET or _get_codec(self._codec) is None:
+            self._codec = None
+        self._codec_fns = _get_codec(self._codec)
+
         # Establish the protocol
         self._setup_protocol(conn)
         self._conns = [conn]
@@ -439,7 +772,10 @@ class TransportProtocol:
 
         # Setup the allocator
         if self._shm is not None:
-            self._allocator = _allocator(self._shm.buf)
+            self._allocator = _allocator(self._shm, 
+                                         is_host=False,
+                                         segment_size=self._shm_size,
+                                         max_size=self._shm_pool_size or DEFAULT_SHM_POOL_SIZE)
 
     @property
     def protocol_name(self):
@@ -451,20 +787,35 @@ class TransportProtocol:
         if (self._shm_size or 0) > 0:
             shm_size_str = _format_size(self._shm_size)
             protocol_name += f"-shm{shm_size_str}"
+        if self._codec is not None:
+            protocol_name += f"-{self._codec}"
         return protocol_name
 
-    def send(self, message, channel=0):
+    def send(self, message, channel=0, *, use_shm=True, stats=None):
+        """
+        Sends the message. If ``stats`` is a dict, it is filled with the serialization
+        and transfer times and the number of bytes sent through the shared memory and the socket.
+        """
         assert self._is_host is not None, "Not started as host or worker"
         assert self._conns is not None, "Not connected"
         try:
             conn = self._conns[channel]
             allocator = self.get_allocator(channel)
-            _tcp_pickle_send(conn, message, pickle_protocol=self._pickle_protocol, allocator=allocator)
+            _tcp_pickle_send(conn, message, 
+                             pickle_protocol=self._pickle_protocol, 
+                             allocator=allocator, 
+                             use_shm=use_shm,
+                             codec=self._codec_fns,
+                             stats=stats)
             allocator.reset()
         except (EOFError, BrokenPipeError, ConnectionError) as e:
             raise ConnectionError("Connection error") from e
 
-    def receive(self, channel=None, zero_copy=False):
+    def receive(self, channel=None, zero_copy=False, stats=None):
+        """
+        Receives the next message. If ``stats`` is a dict, it is filled with the time the message
+        started arriving, the transfer and deserialization times, and the number of bytes received.
+        """
         assert self._is_host is not None, "Not started as host or worker"
         assert self._conns is not None, "Not initialized"
         try:
@@ -478,7 +829,7 @@ class TransportProtocol:
                     conn = self._conns[channel]
                 channel = self._conns.index(conn)
                 allocator = self.get_allocator(channel)
-                message = _tcp_pickle_recv(conn, allocator=allocator, zero_copy=zero_copy)
+                message = _tcp_pickle_recv(conn, allocator=allocator, zero_copy=zero_copy, codec=self._codec_fns, stats=stats)
                 if isinstance(message, Exception):
                     raise message
                 return message
@@ -494,6 +845,13 @@ class TransportProtocol:
     def get_allocator(self, channel=0):
         return self._allocator if channel == 0 else _allocator(None)
 
+    def get_stats(self):
+        """
+        Returns the shared memory counters (number and size of the allocations,
+        fallbacks to socket buffers, and the size of the shared memory pool).
+        """
+        return self._allocator.get_stats()
+
     def close(self):
         # Release the listeners
         if self._tcp_listener is not None:
@@ -512,6 +870,8 @@ class TransportProtocol:
             self._tmpdir.cleanup()
             self._tmpdir = None
 
+        self._allocator.close()
+
         # Release the shared memory
         if self._shm is not None:
             self._shm.unlink()
@@ -1,8 +1,14 @@
+import os
 import sys
-from typing import Tuple, Dict, cast, Any, TYPE_CHECKING, Optional
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Tuple, Dict, List, Iterator, Sequence, Union, cast, Any, TYPE_CHECKING, Optional
 import numpy as np
 from .utils import padded_stack, convert_image_dtype
 from . import CameraModel, camera_model_to_int, Cameras, GenericCameras
+from ._constants import NB_PREFIX
 from ._types import Cameras, GenericCameras, TTensor, _get_xnp
 try:
     from typing import Protocol
@@ -37,86 +43,170 @@ def _is_broadcastable(shape1, shape2):
 
 
 
+class _LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Cache of the remap grids used to warp images between cameras. Frames sharing the same camera
+# (model, intrinsics, distortion, and size) reuse the same entry. The key only depends on the camera
+# parameters. The number of entries can be set using NERFBASELINES_REMAP_CACHE_SIZE.
+_remap_cache = _LRUCache(int(os.environ.get("NERFBASELINES_REMAP_CACHE_SIZE", "4")))
+# Version of the remap grids stored on disk (NERFBASELINES_REMAP_CACHE=1). It must be increased
+# whenever the distortion or undistortion functions change.
+_REMAP_CACHE_VERSION = 1
+
+
+def _array_cache_key(*arrays: Any) -> str:
+    sha = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha.update(f"{array.dtype.str}:{array.shape};".encode("utf8"))
+        sha.update(memoryview(array.reshape(-1)).cast("B"))
+    return sha.hexdigest()
+
+
+def _is_remap_cache_persistent() -> bool:
+    return os.environ.get("NERFBASELINES_REMAP_CACHE", "0") == "1"
+
+
+def _get_remap_cache_path(key: str) -> str:
+    # The stored grids are invalidated when the (un)distortion code changes
+    from nerfbaselines import __version__
+    key = hashlib.sha1(f"{_REMAP_CACHE_VERSION}:{__version__}:{key}".encode("utf8")).hexdigest()
+    return os.path.join(NB_PREFIX, "cache", "remap", f"{key}.npy")
+
+
 @runtime_checkable
 class _DistortionFunction(Protocol):
     def __call__(self, distortion_params: TTensor, uv: TTensor, **kwargs) -> TTensor:
         ...
 
 
-def _iterative_undistortion(distortion: _DistortionFunction, uv: TTensor, params: TTensor, num_iterations: int = 100, **kwargs) -> TTensor:
+@runtime_checkable
+class _DistortionJacobianFunction(Protocol):
+    def __call__(self, distortion_params: TTensor, uv: TTensor, **kwargs) -> Tuple[TTensor, TTensor]:
+        ...
+
+
+def _numerical_distortion_jacobian(distortion: _DistortionFunction, distortion_params: TTensor, uv: TTensor, **kwargs) -> Tuple[TTensor, TTensor]:
+    xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
+    # Numerical differentiation with central differences
+    rel_step_size = 1e-6
+    eps = float(xnp.finfo(distortion_params.dtype).eps)  # type: ignore
+    step = xnp.abs(rel_step_size * uv).clip(eps, None)
+    dx = distortion(distortion_params, uv, xnp=xnp)
+    dx_0b = distortion(distortion_params, xnp.stack((uv[..., 0] - step[..., 0], uv[..., 1]), -1), xnp=xnp)
+    dx_0f = distortion(distortion_params, xnp.stack((uv[..., 0] + step[..., 0], uv[..., 1]), -1), xnp=xnp)
+    dx_1b = distortion(distortion_params, xnp.stack((uv[..., 0], uv[..., 1] - step[..., 1]), -1), xnp=xnp)
+    dx_1f = distortion(distortion_params, xnp.stack((uv[..., 0], uv[..., 1] + step[..., 1]), -1), xnp=xnp)
+    J = xnp.stack(
+        (
+            (dx_0f[..., 0] - dx_0b[..., 0]) / (2 * step[..., 0]),
+            (dx_1f[..., 0] - dx_1b[..., 0]) / (2 * step[..., 1]),
+            (dx_0f[..., 1] - dx_0b[..., 1]) / (2 * step[..., 0]),
+            (dx_1f[..., 1] - dx_1b[..., 1]) / (2 * step[..., 1]),
+        ),
+        -1,
+    ).reshape((*dx.shape, 2))
+    return dx, J
+
+
+def _iterative_undistortion(distortion: _DistortionFunction, 
+                            uv: TTensor, 
+                            params: TTensor, 
+                            num_iterations: int = 100, 
+                            jacobian: Optional[_DistortionJacobianFunction] = None,
+                            **kwargs) -> TTensor:
     xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
     # Source: https://github.com/colmap/colmap/blob/a6352b20a04ff8b426e9f591c31f5c3e8a46fa3f/src/colmap/sensor/models.h#L547
-    # Parameters for Newton iteration using numerical differentiation with
-    # central differences, 100 iterations should be enough even for complex
+    # Parameters for Newton iteration. The Jacobian is computed analytically if the 
+    # distortion model provides it, otherwise numerical differentiation with
+    # central differences is used. 100 iterations should be enough even for complex
     # camera models with higher order terms.
     max_step_norm = 1e-10
-    rel_step_size = 1e-6
+    # Compact the unconverged points once their fraction drops below this threshold
+    compact_fraction = 0.75
 
-    eps = float(xnp.finfo(params.dtype).eps)  # type: ignore
     assert len(uv.shape) == len(params.shape), "uv and params must have the same number of dimensions"
     new_uv_shape = tuple(map(max, uv.shape[:-1], params.shape[:-1])) + (2,)
     if uv.shape != new_uv_shape:
         uv = xnp.broadcast_to(uv, new_uv_shape)
     x = _xnp_copy(uv, xnp=xnp)
-    # xout, mask = x, None
-
-    for i in range(num_iterations):
-        step = xnp.abs(rel_step_size * x).clip(eps, None)
-        dx = distortion(params, x, xnp=xnp)
-        dx_0b = distortion(params, xnp.stack((x[..., 0] - step[..., 0], x[..., 1]), -1), xnp=xnp)
-        dx_0f = distortion(params, xnp.stack((x[..., 0] + step[..., 0], x[..., 1]), -1), xnp=xnp)
-        dx_1b = distortion(params, xnp.stack((x[..., 0], x[..., 1] - step[..., 1]), -1), xnp=xnp)
-        dx_1f = distortion(params, xnp.stack((x[..., 0], x[..., 1] + step[..., 1]), -1), xnp=xnp)
-        J = xnp.stack(
-            (
-                1 + (dx_0f[..., 0] - dx_0b[..., 0]) / (2 * step[..., 0]),
-                (dx_1f[..., 0] - dx_1b[..., 0]) / (2 * step[..., 1]),
-                (dx_0f[..., 1] - dx_0b[..., 1]) / (2 * step[..., 0]),
-                1 + (dx_1f[..., 1] - dx_1b[..., 1]) / (2 * step[..., 1]),
-            ),
-            -1,
-        ).reshape((*dx.shape, 2))
-        step_x = np.linalg.solve(J, (x + dx - uv)[..., None]).squeeze(-1)
-        x -= step_x
-        local_mask = (step_x**2).sum(-1) >= max_step_norm
+    xout, mask = x, None
+    can_compact = not xnp.__name__.startswith("jax")
+    shared_params = params.shape[:-1] == (1,) * (len(params.shape) - 1)
+
+    for _ in range(num_iterations):
+        if jacobian is not None:
+            dx, J = jacobian(params, x, xnp=xnp)
+        else:
+            dx, J = _numerical_distortion_jacobian(distortion, params, x, xnp=xnp)
+
+        # Solve the 2x2 system (I + J) step_x = x + dx - uv in closed form
+        residual = x + dx - uv
+        a = 1 + J[..., 0, 0]
+        b = J[..., 0, 1]
+        c = J[..., 1, 0]
+        d = 1 + J[..., 1, 1]
+        det = a * d - b * c
+        step_0 = (d * residual[..., 0] - b * residual[..., 1]) / det
+        step_1 = (a * residual[..., 1] - c * residual[..., 0]) / det
+        x = x - xnp.stack((step_0, step_1), -1)
+        local_mask = step_0 * step_0 + step_1 * step_1 >= max_step_norm
 
         if not xnp.any(local_mask):
             break
 
-    # NOTE: We might consider adding this speedup in future.
-    #     # Mask here is to speedup the computation by only computing on
-    #     # unconverged points. The gather/scatter is costly so we do it
-    #     # only once every 10 steps.
-    #     # This optimization can be removed without loss of correctness
-    #     if i % 10 == 0 and i >= 30 and not xnp.all(local_mask):
-    #         # Update mask once every 10 steps
-
-    #         # Write out old values
-    #         if mask is not None:
-    #             xout[mask] = x
-
-    #         # Update mask
-    #         if mask is None:
-    #             mask = local_mask
-    #         else:
-    #             mask[mask] = local_mask
-    #
-    #         # Params can be broadcastable to uv
-    #         # We want to keep it that way so that we do not
-    #         # expand used memory
-    #         if params.size == params.shape[-1]:
-    #             params = xnp.reshape(params, (1, params.shape[-1]))
-    #         elif len(params.shape) > 2:
-    #             params = xnp.broadcast_to(params, (*x.shape[:-1], *params.shape[-1:]))
-    #             params = params[local_mask]
-    #         else:
-    #             params = params[local_mask]
-    #         uv = uv[local_mask]
-    #         x = x[local_mask]
-    # if mask is not None:
-    #     xout[mask] = x
-    # return xout
-    return cast(TTensor, x)
+        # Only continue with the unconverged points. The gather/scatter is costly,
+        # so we only compact the working set once enough points have converged.
+        if not can_compact or float(local_mask.sum()) >= compact_fraction * float(np.prod(local_mask.shape)):
+            continue
+        if mask is None:
+            # First compaction: flatten the batch dimensions
+            xout = x
+            mask = _xnp_copy(local_mask, xnp=xnp)
+            uv = uv[local_mask]
+            if shared_params:
+                params = params.reshape((1, params.shape[-1]))
+            else:
+                # Params can be broadcastable to uv. We only gather the used rows
+                # so that we do not expand the used memory.
+                params = xnp.broadcast_to(params, (*local_mask.shape, params.shape[-1]))[local_mask]
+        else:
+            xout[mask] = x
+            mask[_xnp_copy(mask, xnp=xnp)] = local_mask
+            uv = uv[local_mask]
+            if not shared_params:
+                params = params[local_mask]
+        x = x[local_mask]
+
+    if mask is None:
+        return cast(TTensor, x)
+    xout[mask] = x
+    return cast(TTensor, xout)
 
 
 def _distort_opencv(distortion_params: TTensor, uv: TTensor, **kwargs) -> TTensor:
@@ -137,6 +227,34 @@ def _distort_opencv(distortion_params: TTensor, uv: TTensor, **kwargs) -> TTenso
     dv = v * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2)
     return xnp.stack((du, dv), -1)
 
+def _distort_opencv_jacobian(distortion_params: TTensor, uv: TTensor, **kwargs) -> Tuple[TTensor, TTensor]:
+    xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
+    u = uv[..., 0]
+    v = uv[..., 1]
+    k1 = distortion_params[..., 0]
+    k2 = distortion_params[..., 1]
+    p1 = distortion_params[..., 2]
+    p2 = distortion_params[..., 3]
+
+    u2 = u * u
+    uv = u * v
+    v2 = v * v
+    r2 = u2 + v2
+    radial = k1 * r2 + k2 * r2 * r2
+    du = u * radial + 2 * p1 * uv + p2 * (r2 + 2 * u2)
+    dv = v * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2)
+
+    # d(radial)/d(r2)
+    dradial = 2 * (k1 + 2 * k2 * r2)
+    J = xnp.stack((
+        radial + u2 * dradial + 2 * p1 * v + 6 * p2 * u,
+        uv * dradial + 2 * p1 * u + 2 * p2 * v,
+        uv * dradial + 2 * p2 * v + 2 * p1 * u,
+        radial + v2 * dradial + 2 * p2 * u + 6 * p1 * v,
+    ), -1).reshape((*du.shape, 2, 2))
+    return xnp.stack((du, dv), -1), J
+
+
 
 def _distort_opencv_fisheye(distortion_params: TTensor, uv: TTensor, **kwargs) -> TTensor:
     xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
@@ -160,6 +278,41 @@ def _distort_opencv_fisheye(distortion_params: TTensor, uv: TTensor, **kwargs) -
     dv = xnp.where(r > eps, v * thetad / r.clip(eps, None) - v, xnp.zeros_like(v))
     return xnp.stack((du, dv), -1)
 
+def _distort_opencv_fisheye_jacobian(distortion_params: TTensor, uv: TTensor, **kwargs) -> Tuple[TTensor, TTensor]:
+    xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
+    eps = xnp.finfo(uv.dtype).eps
+    u = uv[..., 0]
+    v = uv[..., 1]
+    k1 = distortion_params[..., 0]
+    k2 = distortion_params[..., 1]
+    k3 = distortion_params[..., 4]
+    k4 = distortion_params[..., 5]
+    r2 = u * u + v * v
+    r = xnp.sqrt(r2)
+    theta = xnp.arctan(r)
+    theta2 = theta * theta
+    theta4 = theta2 * theta2
+    theta6 = theta4 * theta2
+    theta8 = theta4 * theta4
+    thetad = theta * (1 + k1 * theta2 + k2 * theta4 + k3 * theta6 + k4 * theta8)
+    valid = r > eps
+    r_safe = r.clip(eps, None)
+    # The distorted point is uv * scale, scale = thetad / r
+    scale = xnp.where(valid, thetad / r_safe, xnp.ones_like(u))
+    dthetad = (1 + 3 * k1 * theta2 + 5 * k2 * theta4 + 7 * k3 * theta6 + 9 * k4 * theta8) / (1 + r2)
+    # d(scale)/d(r) / r
+    dscale = xnp.where(valid, (dthetad - scale) / (r_safe * r_safe), xnp.zeros_like(u))
+    du = u * scale - u
+    dv = v * scale - v
+    J = xnp.stack((
+        scale - 1 + u * u * dscale,
+        u * v * dscale,
+        u * v * dscale,
+        scale - 1 + v * v * dscale,
+    ), -1).reshape((*du.shape, 2, 2))
+    return xnp.stack((du, dv), -1), J
+
+
 
 def _distort_full_opencv(distortion_params: TTensor, uv: TTensor, **kwargs) -> TTensor:
     xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
@@ -185,12 +338,67 @@ def _distort_full_opencv(distortion_params: TTensor, uv: TTensor, **kwargs) -> T
     dv = v * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2) - v
     return xnp.stack((du, dv), -1)
 
+def _distort_full_opencv_jacobian(distortion_params: TTensor, uv: TTensor, **kwargs) -> Tuple[TTensor, TTensor]:
+    xnp = _get_xnp(uv) if TYPE_CHECKING else kwargs["xnp"]
+    u = uv[..., 0]
+    v = uv[..., 1]
+    k1 = distortion_params[..., 0]
+    k2 = distortion_params[..., 1]
+    p1 = distortion_params[..., 2]
+    p2 = distortion_params[..., 3]
+    k3 = distortion_params[..., 4]
+    k4 = distortion_params[..., 5]
+    k5 = distortion_params[..., 6]
+    k6 = distortion_params[..., 7]
+
+    u2 = u * u
+    uv = u * v
+    v2 = v * v
+    r2 = u2 + v2
+    r4 = r2 * r2
+    r6 = r4 * r2
+    numerator = 1 + k1 * r2 + k2 * r4 + k3 * r6
+    denominator = 1 + k4 * r2 + k5 * r4 + k6 * r6
+    radial = numerator / denominator
+    du = u * radial + 2 * p1 * uv + p2 * (r2 + 2 * u2) - u
+    dv = v * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2) - v
+
+    # d(radial)/d(r2)
+    dnumerator = k1 + 2 * k2 * r2 + 3 * k3 * r4
+    ddenominator = k4 + 2 * k5 * r2 + 3 * k6 * r4
+    dradial = 2 * (dnumerator * denominator - numerator * ddenominator) / (denominator * denominator)
+    J = xnp.stack((
+        radial - 1 + u2 * dradial + 2 * p1 * v + 6 * p2 * u,
+        uv * dradial + 2 * p1 * u + 2 * p2 * v,
+        uv * dradial + 2 * p2 * v + 2 * p1 * u,
+        radial - 1 + v2 * dradial + 2 * p2 * u + 6 * p1 * v,
+    ), -1).reshape((*du.shape, 2, 2))
+    return xnp.stack((du, dv), -1), J
+
+
 
 _DISTORTIONS: Dict[CameraModel, _DistortionFunction] = {
     "opencv": _distort_opencv,
     "opencv_fisheye": _distort_opencv_fisheye,
     "full_opencv": _distort_full_opencv,
 }
+_DISTORTION_JACOBIANS: Dict[CameraModel, _DistortionJacobianFunction] = {
+    "opencv": _distort_opencv_jacobian,
+    "opencv_fisheye": _distort_opencv_fisheye_jacobian,
+    "full_opencv": _distort_full_opencv_jacobian,
+}
+
+
+def _broadcast_camera_mask(mask: TTensor, uv: TTensor, distortion_params: TTensor, xnp: Any) -> Tuple[TTensor, TTensor, TTensor]:
+    # Cameras can be broadcastable to the points (e.g., cameras [N, 1] and points [N, M, 2]).
+    # In order to select the points of a camera model, we broadcast everything to the same shape.
+    if len(uv.shape) != len(distortion_params.shape):
+        return mask, uv, distortion_params
+    batch_shape = tuple(map(max, uv.shape[:-1], distortion_params.shape[:-1]))
+    mask = xnp.broadcast_to(mask, batch_shape)
+    uv = xnp.broadcast_to(uv, (*batch_shape, uv.shape[-1]))
+    distortion_params = xnp.broadcast_to(distortion_params, (*batch_shape, distortion_params.shape[-1]))
+    return mask, uv, distortion_params
 
 
 def _distort(camera_models, distortion_params, uv, xnp: Any):
@@ -213,6 +421,7 @@ def _distort(camera_models, distortion_params, uv, xnp: Any):
             if xnp.all(mask):
                 return uv + distortion(distortion_params, uv, xnp=xnp)
             else:
+                mask, uv, distortion_params = _broadcast_camera_mask(mask, uv, distortion_params, xnp=xnp)
                 if out is None:
                     out = _xnp_copy(uv, xnp=xnp)
                 out[mask] = uv[mask] + distortion(distortion_params[mask], uv[mask], xnp=xnp)
@@ -230,9 +439,10 @@ def _undistort(camera_models: TTensor, distortion_params: TTensor, uv: TTensor,
         mask = camera_models == camera_model_to_int(cam)
         if xnp.any(mask):
             if xnp.all(mask):
-                return _iterative_undistortion(distortion, uv, distortion_params, xnp=xnp, **kwargs)
+                return _iterative_undistortion(distortion, uv, distortion_params, jacobian=_DISTORTION_JACOBIANS.get(cam), xnp=xnp, **kwargs)
             else:
-                out_update = cast(TTensor, _iterative_undistortion(distortion, uv[mask], distortion_params[mask], xnp=xnp, **kwargs))  # type: ignore
+                mask, uv, distortion_params = _broadcast_camera_mask(mask, uv, distortion_params, xnp=xnp)
+                out_update = cast(TTensor, _iterative_undistortion(distortion, uv[mask], distortion_params[mask], jacobian=_DISTORTION_JACOBIANS.get(cam), xnp=xnp, **kwargs))  # type: ignore
                 if xnp.__name__.startswith("jax"):
                     _old_out = uv if out is None else out
                     _old_out.at[mask].set(out_update)  # type: ignore
@@ -384,75 +594,217 @@ def project(cameras: GenericCameras[TTensor], xyz: TTensor) -> TTensor:
     return xnp.stack((x, y), -1)
 
 
-def interpolate_bilinear(image: TTensor, xy: TTensor) -> TTensor:
+def _interpolate_bilinear_batched(images: TTensor, xy: TTensor, out: Optional[TTensor] = None) -> TTensor:
     """
-    Interpolates an image at pixel coordinates using bilinear interpolation.
+    Interpolates a batch of images at pixel coordinates using bilinear interpolation.
+    Points outside of the image are set to zero.
 
     Args:
-        image: Image tensor [H, W, C]
-        xy: Pixel coordinates [H, W, 2]
+        images: Image tensor [B, H, W, ...]
+        xy: Pixel coordinates [B, N, 2] (or [1, N, 2] if shared by all images)
+        out: Optional (float32) output buffer [B, N, ...]
     Returns:
-        Interpolated image [H, W, C]
+        Interpolated images [B, N, ...] (float32)
     """
-
-    xnp = _get_xnp(image)
+    xnp = _get_xnp(images)
+    kwargs = {}
+    if xnp.__name__ == "torch" and not TYPE_CHECKING:
+        kwargs = {"device": images.device}
     if xnp.__name__ == "torch":
         if not sys.modules["torch"].is_floating_point(xy):
             xy = xy.float()  # type: ignore
     elif getattr(xy.dtype, "kind", None) != "f":
         xy = _xnp_astype(xy, xnp.float32, xnp=xnp)
-    original_shape = xy.shape
-    xy = xnp.reshape(xy, (-1, 2))
+    batch_size, height, width = images.shape[:3]
+    channel_shape = tuple(images.shape[3:])
+    num_points = xy.shape[-2]
     x, y = xy[..., 0], xy[..., 1]
-    height, width = image.shape[:2]
-
-    x0 = _xnp_astype(xnp.floor(x), xnp.int32, xnp=xnp)
-    x1 = x0 + 1
-    y0 = _xnp_astype(xnp.floor(y), xnp.int32, xnp=xnp)
-    y1 = y0 + 1
-
-    image = _xnp_astype(image, xnp.float32, xnp=xnp)
-    mask = xnp.logical_and(
-        xnp.logical_and(
-            x0 >= 0,
-            x1 < width,
-        ),
-        xnp.logical_and(
-            y0 >= 0,
-            y1 < height,
-        ),
-    )
-    x0 = x0[mask]
-    x1 = x1[mask]
-    y0 = y0[mask]
-    y1 = y1[mask]
-    x = x[mask]
-    y = y[mask]
-
-    dx = x - x0
-    dy = y - y0
-    dx_1 = 1 - dx
-    dy_1 = 1 - dy
+
+    x0f = xnp.floor(x)
+    y0f = xnp.floor(y)
+    dx = _xnp_astype(x - x0f, xnp.float32, xnp=xnp)
+    dy = _xnp_astype(y - y0f, xnp.float32, xnp=xnp)
+    x0 = _xnp_astype(x0f, xnp.int64, xnp=xnp)
+    y0 = _xnp_astype(y0f, xnp.int64, xnp=xnp)
+    valid = (x0 >= 0) & (x0 + 1 < width) & (y0 >= 0) & (y0 + 1 < height)
+
+    # Instead of gathering the valid points, we clamp the indices and zero the weights
+    # of the invalid points. This avoids the boolean-mask gathers and scatters.
+    x0 = x0.clip(0, max(width - 2, 0))
+    y0 = y0.clip(0, max(height - 2, 0))
+    x_step = 1 if width > 1 else 0
+    y_step = width if height > 1 else 0
+    valid = _xnp_astype(valid, xnp.float32, xnp=xnp)
+    dx_1 = (1 - dx) * valid
+    dx = dx * valid
+
+    # Indices into the flattened images
+    index = y0 * width + x0 + xnp.reshape(xnp.arange(xy.shape[0], **kwargs) * (height * width), (-1, 1))
+    if xy.shape[0] != batch_size:
+        index = index + xnp.reshape(xnp.arange(batch_size, **kwargs) * (height * width), (-1, 1))
+    index = xnp.reshape(index, (-1,))
+    flat_images = xnp.reshape(_xnp_astype(images, xnp.float32, xnp=xnp), (batch_size * height * width, -1))
+
+    num_channels = flat_images.shape[-1]
+    if out is None:
+        out = xnp.empty((batch_size, num_points, *channel_shape), dtype=xnp.float32, **kwargs)
+    assert out is not None
+    output = xnp.reshape(out, (-1, num_channels))
+
+    def _weight(w):
+        return xnp.reshape(xnp.broadcast_to(w, (batch_size, num_points)), (-1, 1))
+
+    def _gather(index):
+        if xnp.__name__ == "torch":
+            return flat_images.index_select(0, index)  # type: ignore
+        return xnp.take(flat_images, index, axis=0)
+
+    dx_1 = _weight(dx_1)
+    dx = _weight(dx)
+    dy = _weight(dy)
 
     # Top row, column-wise linear interpolation.
-    shape = x.shape + tuple(1 for _ in image.shape[2:])
-    v0 = xnp.reshape(dx_1, shape) * image[y0, x0] + xnp.reshape(dx, shape) * image[y0, x1]
+    top = _gather(index) * dx_1
+    top += _gather(index + x_step) * dx
     # Bottom row, column-wise linear interpolation.
-    v1 = xnp.reshape(dx_1, shape) * image[y1, x0] + xnp.reshape(dx, shape) * image[y1, x1]
+    index += y_step
+    bottom = _gather(index) * dx_1
+    bottom += _gather(index + x_step) * dx
 
     # Row-wise linear interpolation.
-    kwargs = {}
-    if xnp.__name__ == "torch" and not TYPE_CHECKING:
-        kwargs = {"device": image.device}
-    output = xnp.zeros(original_shape[:-1] + image.shape[2:], dtype=cast(Any, image.dtype), **kwargs)
-    output_slice = xnp.reshape(dy_1, shape) * v0 + xnp.reshape(dy, shape) * v1
-    output[mask] = _xnp_astype(output_slice, image.dtype, xnp=xnp)
-    return output
+    bottom -= top
+    bottom *= dy
+    top += bottom
+    output[...] = top
+    return cast(TTensor, out)
+
+
+def interpolate_bilinear(image: TTensor, xy: TTensor) -> TTensor:
+    """
+    Interpolates an image at pixel coordinates using bilinear interpolation.
+
+    Args:
+        image: Image tensor [H, W, C]
+        xy: Pixel coordinates [H, W, 2]
+    Returns:
+        Interpolated image [H, W, C]
+    """
+    xnp = _get_xnp(image)
+    original_shape = xy.shape
+    output = _interpolate_bilinear_batched(image[None], xnp.reshape(xy, (1, -1, 2)))
+    return xnp.reshape(output, tuple(original_shape[:-1]) + tuple(image.shape[2:]))
+
+
+def _get_warp_grid(cam1: GenericCameras[np.ndarray], cam2: GenericCameras[np.ndarray]) -> np.ndarray:
+    """
+    Returns the pixel coordinates in cam1 of all pixels of cam2 (shape [h*w, 2]).
+    The grid only depends on the camera models, intrinsics, distortion parameters,
+    and image sizes, so it is cached (and optionally stored on disk).
+    """
+    assert cam1.image_sizes is not None, "cam1 must have image sizes"
+    assert cam2.image_sizes is not None, "cam2 must have image sizes"
+    key = _array_cache_key(*(
+        getattr(cam, name) for cam in (cam1, cam2)
+        for name in ("camera_models", "intrinsics", "distortion_parameters", "image_sizes")))
+    source_point = _remap_cache.get(key)
+    if source_point is not None:
+        return source_point
+
+    persistent = _is_remap_cache_persistent()
+    path = _get_remap_cache_path(key)
+    if persistent and os.path.exists(path):
+        try:
+            source_point = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load remap grid from cache {path}: {e}")
+
+    if source_point is None:
+        xy = get_image_pixels(cam2.image_sizes)
+
+        # Camera models assume that the upper left pixel center is (0.5, 0.5).
+        xy = xy.astype(np.float32) + 0.5
+
+        # Replace poses with empty poses
+        empty_poses = np.eye(4, dtype=cam2.poses.dtype)[:3, :4]
+        cam2 = cam2.replace(poses=empty_poses)
+        cam1 = cam1.replace(poses=empty_poses)
+
+        # Unproject and reproject back
+        _, cam_point = unproject(cam2[None], xy)
+        source_point = project(cam1[None], cam_point)
+
+        # Undo 0.5 offset
+        source_point -= 0.5
+        source_point.setflags(write=False)
+
+        if persistent:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+                np.save(tmp_path, source_point)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logging.warning(f"Failed to store remap grid in cache {path}: {e}")
+    _remap_cache.put(key, source_point)
+    return source_point
+
+
+# Maximum number of output pixels warped in a single batch
+_WARP_BATCH_PIXELS = 1 << 24
+
+
+def _warp_images_between_cameras(cameras1: GenericCameras[np.ndarray],
+                                 cameras2: GenericCameras[np.ndarray],
+                                 images: Union[TTensor, Sequence[TTensor]]) -> Iterator[Tuple[int, TTensor]]:
+    """
+    Warps a batch of images from cameras1 to cameras2. Images of the same size (and the same output size)
+    are warped together in a single vectorized gather. The warped images are yielded as
+    ``(index, image)`` tuples (ordered by the groups of equal sizes).
+    """
+    assert cameras1.image_sizes is not None, "cameras1 must have image sizes"
+    assert cameras2.image_sizes is not None, "cameras2 must have image sizes"
+    assert cameras1.image_sizes.shape == cameras2.image_sizes.shape, "Camera shapes must be the same"
+    assert len(cameras1) == len(images), "Number of cameras and images must be the same"
+
+    groups: Dict[Any, List[int]] = {}
+    for i, image in enumerate(images):
+        key = (tuple(cameras2.image_sizes[i].tolist()), tuple(image.shape), str(image.dtype))
+        groups.setdefault(key, []).append(i)
+
+    for ((w, h), image_shape, _), indices in groups.items():
+        xnp = _get_xnp(images[indices[0]])
+        kwargs = {}
+        if xnp.__name__ == "torch" and not TYPE_CHECKING:
+            kwargs = {"device": images[indices[0]].device}
+        batch_size = min(len(indices), max(1, _WARP_BATCH_PIXELS // max(int(w) * int(h), 1)))
+        # Preallocate the buffers for the whole group
+        input_buffer = xnp.empty((batch_size, *image_shape), dtype=xnp.float32, **kwargs)
+        output_buffer = xnp.empty((batch_size, int(w) * int(h), *image_shape[2:]), dtype=xnp.float32, **kwargs)
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            grids = [_get_warp_grid(cameras1[i], cameras2[i]) for i in chunk]
+            # Frames sharing the same camera share the grid
+            xy = grids[0][None] if all(x is grids[0] for x in grids) else np.stack(grids, 0)
+            if xnp.__name__ == "torch":
+                xy = xnp.as_tensor(np.array(xy), **kwargs)
+            for j, i in enumerate(chunk):
+                input_buffer[j] = convert_image_dtype(images[i], xnp.float32)
+
+            # Interpolate bilinear to obtain the image
+            out = _interpolate_bilinear_batched(input_buffer[:len(chunk)], xy, out=output_buffer[:len(chunk)])
+            out = xnp.reshape(out, (len(chunk), int(h), int(w), -1))
+            for j, i in enumerate(chunk):
+                # Cast image to original dtype
+                out_image = convert_image_dtype(out[j], images[i].dtype)
+                if out_image.dtype == xnp.float32:
+                    # The output buffer is reused for the next batch
+                    out_image = _xnp_copy(out_image, xnp=xnp)
+                yield i, out_image
 
 
 def warp_image_between_cameras(cameras1: GenericCameras[np.ndarray], 
                                cameras2: GenericCameras[np.ndarray],
-                               images: np.ndarray):
+                               images: Union[TTensor, Sequence[TTensor]]):
     """
     Warp an image from cameras1 to cameras2 by mapping pixels from cameras2 to cameras1.
 
@@ -464,58 +816,24 @@ def warp_image_between_cameras(cameras1: GenericCameras[np.ndarray],
     Returns:
         Warped images
     """
-
-    xnp = _get_xnp(images)
     assert cameras1.image_sizes is not None, "cameras1 must have image sizes"
     assert cameras2.image_sizes is not None, "cameras2 must have image sizes"
     assert cameras1.image_sizes.shape == cameras2.image_sizes.shape, "Camera shapes must be the same"
 
-    if len(cameras1.intrinsics.shape) == 2:
-        out_image_list = []
-        for cam1, cam2, image in zip(cameras1, cameras2, images):
-            out_image_list.append(warp_image_between_cameras(cam1, cam2, image))
-        return padded_stack(out_image_list)
-
-    cam1 = cameras1
-    cam2 = cameras2
-
-    # NOTE: pyright workaround
-    assert cam1.image_sizes is not None
-    assert cam2.image_sizes is not None
-
-    image = images
-
     # TODO: Fix aliasing issue
     # To avoid aliasing we rescale the output camera to input resolution and rescale images later
     # new_size = cam2.image_sizes
     # cam2 = dataclasses.replace(cam2, image_sizes=cam1.image_sizes)
 
-    w, h = cam2.image_sizes
-    xy = get_image_pixels(cam2.image_sizes)
-
-    # Camera models assume that the upper left pixel center is (0.5, 0.5).
-    xy = xy.astype(xnp.float32) + 0.5
-
-    # Replace poses with empty poses
-    empty_poses = xnp.eye(4, dtype=cam2.poses.dtype)[:3, :4]
-    cam2 = cam2.replace(poses=empty_poses)
-    cam1 = cam1.replace(poses=empty_poses)
-    
-    # Unproject and reproject back
-    _, cam_point = unproject(cam2[None], xy)
-    source_point = project(cam1[None], cam_point)
-
-    # Undo 0.5 offset
-    source_point -= 0.5
-
-    # Interpolate bilinear to obtain the image
-    out_image = interpolate_bilinear(convert_image_dtype(image, xnp.float32), source_point)
-    out_image = xnp.reshape(out_image, (h, w, -1))
-
     # TODO: Resize image
 
-    # Cast image to original dtype
-    out_image = convert_image_dtype(out_image, images.dtype)
+    if len(cameras1.intrinsics.shape) == 2:
+        out_image_list: List[Any] = [None] * len(cameras1)
+        for i, out_image in _warp_images_between_cameras(cameras1, cameras2, images):
+            out_image_list[i] = out_image
+        return padded_stack(out_image_list)
+
+    _, out_image = next(_warp_images_between_cameras(cameras1[None], cameras2[None], [images]))
     return out_image
 
 
@@ -543,6 +861,18 @@ def undistort_camera(camera: Cameras):
     assert camera.image_sizes is not None, "camera must have image sizes"
     assert original_camera.image_sizes is not None, "camera must have image sizes"
 
+    # Frames sharing the same camera are only undistorted once
+    camera_parameters = np.concatenate((
+        camera.camera_models[..., None].astype(np.float64),
+        camera.intrinsics.astype(np.float64),
+        camera.distortion_parameters.astype(np.float64),
+        camera.image_sizes.astype(np.float64),
+    ), -1)
+    _, unique_indices, unique_inverse = np.unique(camera_parameters, axis=0, return_index=True, return_inverse=True)
+    unique_inverse = unique_inverse.reshape(-1)
+    camera = camera[unique_indices]
+    assert camera.image_sizes is not None, "camera must have image sizes"
+
     # Scale the image such the the boundary of the undistorted image.
     empty_poses = np.eye(4, dtype=camera.poses.dtype)[None].repeat(len(camera), axis=0)[..., :3, :4]
     camera_empty = camera.replace(poses=empty_poses)
@@ -611,8 +941,8 @@ def undistort_camera(camera: Cameras):
     cx = cx * w / orig_undistorted_camera_width
     cy = cy * h / orig_undistorted_camera_height
 
-    undistorted_image_sizes = np.stack((w, h), -1)
-    undistorted_intrinsics = np.stack((fx, fy, cx, cy), -1)
+    undistorted_image_sizes = np.stack((w, h), -1)[unique_inverse]
+    undistorted_intrinsics = np.stack((fx, fy, cx, cy), -1)[unique_inverse]
 
     # Get output
     if mask is None:
@@ -624,7 +954,8 @@ def undistort_camera(camera: Cameras):
         intrinsics[mask] = undistorted_intrinsics
         image_sizes[mask] = undistorted_image_sizes
 
-    out = vars(original_camera)
+    # NOTE: vars() returns the instance dict, we must not modify the original camera
+    out = dict(vars(original_camera))
     out.update(dict(
         camera_models=np.full_like(original_camera.camera_models, camera_model_to_int("pinhole")),
         distortion_parameters=np.zeros_like(original_camera.distortion_parameters),
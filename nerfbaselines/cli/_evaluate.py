@@ -12,13 +12,16 @@ from .._registry import evaluation_protocols_registry
 @click.argument("predictions", type=click.Path(file_okay=True, dir_okay=True, path_type=str), required=True)
 @click.option("--output", "-o", type=click.Path(file_okay=True, dir_okay=False, path_type=str), required=True, help="Path to the output JSON file to save the evaluation results.")
 @click.option("--evaluation-protocol", default=None, type=click.Choice(list(evaluation_protocols_registry.keys())), help="Override the default evaluation protocol. WARNING: This is strongly discouraged.", hidden=True)
-def evaluate_command(predictions: str, output: str, evaluation_protocol=None) -> None:
+@click.option("--batched", is_flag=True, default=False, help=(
+    "Evaluate images of the same size in batches (faster, especially on CPU). "
+    "The metrics can differ from the default evaluation in the last digits (floating point precision)."))
+def evaluate_command(predictions: str, output: str, evaluation_protocol=None, batched: bool = False) -> None:
     evaluation_protocol_obj = None
     if evaluation_protocol is not None:
         warnings.warn(f"Overriding the evaluation protocol to {evaluation_protocol}. This is strongly discouraged.")
         evaluation_protocol_obj = build_evaluation_protocol(evaluation_protocol)
 
     with run_inside_eval_container():
-        evaluate(predictions, output, evaluation_protocol=evaluation_protocol_obj)
+        evaluate(predictions, output, evaluation_protocol=evaluation_protocol_obj, batched=batched)
 
 
@@ -76,9 +76,9 @@ def measure_fps_command(*, checkpoint, backend_name, data, split="test", data_in
         if data_indices is not None:
             dataset = dataset_index_select(dataset, list(data_indices.with_total(len(dataset["cameras"]))))
 
-        # We load the features to fix image sizes
+        # We load the features to fix image sizes (only the image headers are read)
         if resolution is None:
-            dataset = dataset_load_features(dataset)
+            dataset = dataset_load_features(dataset, lazy=True)
 
         cameras = dataset["cameras"]
 
@@ -1,6 +1,6 @@
 import sys
-from contextlib import ExitStack
-from typing import Union, Tuple
+from contextlib import ExitStack, contextmanager
+from typing import Union, Tuple, List, Optional
 import logging
 from pathlib import Path
 import os
@@ -10,11 +10,40 @@ import click
 from nerfbaselines.datasets import load_dataset
 from nerfbaselines import Method, get_method_spec, build_method_class
 from nerfbaselines import backends
+from nerfbaselines.backends._common import is_remote_instance
 from nerfbaselines.evaluation import render_all_images, render_frames, trajectory_get_embeddings, trajectory_get_cameras
 from nerfbaselines.io import open_any_directory, deserialize_nb_info, load_trajectory, open_any
 from ._common import click_backend_option, NerfBaselinesCliCommand
 
 
+def _get_worker_devices(num_workers: int) -> List[Optional[str]]:
+    # If multiple devices are visible, the workers are distributed across them.
+    # Otherwise, all workers share the same devices.
+    devices = [x.strip() for x in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if x.strip()]
+    if len(devices) < 2:
+        return [None] * num_workers
+    if num_workers > len(devices):
+        logging.warning(f"Number of workers ({num_workers}) is larger than the number of visible devices ({len(devices)}), some devices will be shared")
+    return [devices[i % len(devices)] for i in range(num_workers)]
+
+
+@contextmanager
+def _visible_devices(device: Optional[str]):
+    # The backend workers inherit the environment when they are started
+    if device is None:
+        yield
+        return
+    backup = os.environ.get("CUDA_VISIBLE_DEVICES")
+    os.environ["CUDA_VISIBLE_DEVICES"] = device
+    try:
+        yield
+    finally:
+        if backup is None:
+            os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+        else:
+            os.environ["CUDA_VISIBLE_DEVICES"] = backup
+
+
 @click.command("render", cls=NerfBaselinesCliCommand, short_help="Render images from a trained model", help=(
     "Render images from a trained model for all cameras in the dataset. "
     "The images will be saved in the specified output directory. "
@@ -28,8 +57,12 @@ from ._common import click_backend_option, NerfBaselinesCliCommand
     "A path to the dataset to render the cameras from. The dataset can be either an external dataset (e.g., a path starting with `external://{dataset}/{scene}`) or a local path to a dataset. If the dataset is an external dataset, the dataset will be downloaded and cached locally. If the dataset is a local path, the dataset will be loaded directly from the specified path."))
 @click.option("--output", type=str, default="predictions", help="Output directory or tar.gz/zip file.")
 @click.option("--split", type=str, default="test", show_default=True, help="Dataset split to render.")
+@click.option("--num-workers", type=click.IntRange(min=1), default=1, show_default=True, help=(
+    "Number of backend workers rendering the images in parallel. Each worker loads the checkpoint. "
+    "If `CUDA_VISIBLE_DEVICES` contains multiple devices, the workers are distributed across the devices. "
+    "Not supported with the `python` backend."))
 @click_backend_option()
-def render_command(checkpoint: str, data: str, output: str, split: str, backend_name):
+def render_command(checkpoint: str, data: str, output: str, split: str, backend_name, num_workers: int = 1):
     checkpoint = str(checkpoint)
 
     if os.path.exists(output):
@@ -52,23 +85,38 @@ def render_command(checkpoint: str, data: str, output: str, split: str, backend_
         # Prepare method backend
         method_name = nb_info["method"]
         method_spec = get_method_spec(method_name)
-        method_cls = stack.enter_context(build_method_class(method_spec, backend=backend_name))
 
-        # Prepare method 
-        method: Method = method_cls(checkpoint=str(checkpoint_path))
+        # Prepare the methods (one per worker)
+        if num_workers > 1 and backends.get_backend(method_spec, backend_name).name == "python":
+            # The python backend runs the method in the current process, additional workers would
+            # only load more copies of the checkpoint into the same process and devices.
+            logging.warning("Multiple workers are not supported with the python backend, rendering with a single worker")
+            num_workers = 1
+        methods: List[Method] = []
+        # The visible devices are only applied to the newly started worker processes
+        devices = _get_worker_devices(num_workers) if num_workers > 1 else [None]
+        for device in devices:
+            with _visible_devices(device):
+                method_cls = stack.enter_context(build_method_class(method_spec, backend=backend_name))
+                methods.append(method_cls(checkpoint=str(checkpoint_path)))
+        if num_workers > 1:
+            if not all(is_remote_instance(x) for x in methods):
+                raise RuntimeError("Multiple workers require methods running in separate worker processes")
+            logging.info(f"Rendering with {num_workers} workers")
 
         # Load the dataset
-        method_info = method.get_info()
+        method_info = methods[0].get_info()
         dataset = load_dataset(data, 
                                split=split, 
                                features=method_info.get("required_features", None), 
-                               supported_camera_models=method_info.get("supported_camera_models", None))
+                               supported_camera_models=method_info.get("supported_camera_models", None),
+                               lazy=True)
         dataset_colorspace = dataset["metadata"].get("color_space", "srgb")
         if dataset_colorspace != nb_info.get("color_space", "srgb"):
             raise RuntimeError(f"Dataset color space {dataset_colorspace} != method color space {nb_info.get('color_space', 'srgb')}")
 
         # Render all images
-        for _ in render_all_images(method, dataset, output=output, nb_info=nb_info):
+        for _ in render_all_images(methods, dataset, output=output, nb_info=nb_info):
             pass
 
 
@@ -38,6 +38,9 @@ from ._common import SetParamOptionType, TupleClickType, IndicesClickType, click
 @click.option("--presets", type=TupleClickType(), default=None, help=(
     "Apply a comma-separated list of preset to the method. If no `--presets` is supplied, or if a special `@auto` preset is present (default if no presets are specified),"
     " the method's default presets are applied (based on the dataset metadata)."))
+@click.option("--batched-evaluation", is_flag=True, default=False, help=(
+    "Evaluate images of the same size in batches in `eval_all` (faster, especially on CPU). "
+    "The metrics can differ from the default evaluation in the last digits (floating point precision)."))
 @click_backend_option()
 def train_command(
     method_name,
@@ -52,6 +55,7 @@ def train_command(
     logger="none",
     config_overrides=None,
     presets=None,
+    batched_evaluation=False,
 ):
     if config_overrides is None:
         config_overrides = {}
@@ -112,11 +116,13 @@ def train_command(
 
         # Load eval dataset
         logging.info("Loading eval dataset")
+        # Test images are only used for evaluation, we decode them when needed
         test_dataset = load_dataset(_data, 
                                     split="test", 
                                     features=required_features, 
                                     supported_camera_models=supported_camera_models, 
-                                    load_features=True)
+                                    load_features=True,
+                                    lazy=True)
         test_dataset["metadata"]["expected_scene_scale"] = train_dataset["metadata"].get("expected_scene_scale")
 
         # Apply config overrides for the train dataset
@@ -146,6 +152,7 @@ def train_command(
             generate_output_artifact=generate_output_artifact,
             config_overrides=_config_overrides,
             applied_presets=frozenset(_presets),
+            batched_evaluation=batched_evaluation,
         )
         trainer.train()
 
@@ -12,6 +12,10 @@ from nerfbaselines.io import open_any_directory, deserialize_nb_info
 from ._common import click_backend_option, NerfBaselinesCliCommand
 
 
+# The viewed model does not change, the raw render outputs can be cached
+_RENDER_CACHE_SIZE = 256 * 1024 * 1024
+
+
 @click.command("viewer", cls=NerfBaselinesCliCommand, short_help="Start the viewer", help=(
     "Start the viewer. If a checkpoint is provided, the viewer will load the model. "
     "If a data path is provided, the viewer will load the dataset. "
@@ -66,7 +70,8 @@ def viewer_command(checkpoint: str, data, backend_name, port=None, host="localho
                test_dataset=test_dataset, 
                nb_info=nb_info,
                host=host,
-               port=port))
+               port=port,
+               render_cache_size=_RENDER_CACHE_SIZE))
         viewer.run()
 
 
@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from typing import Optional, List, Dict, Any, cast
+import numpy as np
+from nerfbaselines import UnloadedDataset, new_cameras, NB_PREFIX
+
+
+CACHE_VERSION = 1
+_CAMERAS_FIELDS = ("poses", "intrinsics", "camera_models", "distortion_parameters", "image_sizes", "nears_fars", "metadata")
+logger = logging.getLogger("nerfbaselines.datasets")
+
+
+def is_dataset_cache_enabled(cache: Optional[bool] = None) -> bool:
+    if cache is None:
+        cache = os.environ.get("NERFBASELINES_DATASET_CACHE", "0") == "1"
+    return cache
+
+
+def get_dataset_cache_path(key: str) -> str:
+    return os.path.join(NB_PREFIX, "cache", "datasets", key)
+
+
+def get_dataset_cache_key(dataset: UnloadedDataset, features=None, supported_camera_models=None) -> Optional[str]:
+    """
+    Computes the cache key for the features of an unloaded dataset. The key covers the image and
+    sampling mask paths (including their sizes and modification times), the cameras, and all the
+    options which affect the decoded images. Returns ``None`` if some file cannot be accessed.
+    """
+    def _stat(path):
+        stat = os.stat(path)
+        return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+    try:
+        payload = {
+            "version": CACHE_VERSION,
+            "images": [_stat(p) for p in dataset["image_paths"]],
+            "sampling_masks": [_stat(p) for p in dataset["sampling_mask_paths"]] if dataset["sampling_mask_paths"] is not None else None,
+            "image_paths_root": dataset["image_paths_root"],
+            "sampling_mask_paths_root": dataset["sampling_mask_paths_root"],
+            "color_space": dataset["metadata"].get("color_space"),
+            "downscale_loaded_factor": dataset["metadata"].get("downscale_loaded_factor"),
+            "downscale_factor": dataset["metadata"].get("downscale_factor"),
+            "features": sorted(features) if features is not None else None,
+            "supported_camera_models": sorted(supported_camera_models) if supported_camera_models is not None else None,
+        }
+    except OSError:
+        return None
+    sha = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf8"))
+    for name in _CAMERAS_FIELDS:
+        value = getattr(dataset["cameras"], name)
+        if value is None:
+            sha.update(f"{name}:none".encode("utf8"))
+            continue
+        value = np.ascontiguousarray(value)
+        sha.update(f"{name}:{value.dtype.str}:{value.shape}".encode("utf8"))
+        sha.update(value.tobytes())
+    return sha.hexdigest()
+
+
+def _write_flat(path: str, arrays: List[np.ndarray]):
+    offsets = np.zeros((len(arrays) + 1,), dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, array in enumerate(arrays):
+            array = np.ascontiguousarray(array)
+            f.write(memoryview(array).cast("B"))
+            offsets[i + 1] = offsets[i] + array.nbytes
+    return offsets
+
+
+def _read_flat(path: str, dtype, offsets: np.ndarray, shapes: List[List[int]]) -> List[np.ndarray]:
+    if offsets[-1] == 0:
+        return [np.zeros(shape, dtype=dtype) for shape in shapes]
+    # Copy-on-write mapping: pages are shared between processes until written to
+    data = np.memmap(path, dtype=np.uint8, mode="c", shape=(int(offsets[-1]),))
+    return [data[start:end].view(dtype).reshape(shape) for start, end, shape in zip(offsets[:-1], offsets[1:], shapes)]
+
+
+def save_dataset_cache(key: str, dataset: UnloadedDataset) -> bool:
+    """
+    Stores the loaded features of a dataset in the cache. The images (and sampling masks) are stored
+    in a single flat file each, together with an index of the offsets and shapes of the individual images.
+    """
+    images = dataset.get("images")
+    assert images is not None, "Images must be loaded"
+    if len(set(x.dtype for x in images)) > 1:
+        logger.debug("Not caching dataset with mixed image dtypes")
+        return False
+    path = get_dataset_cache_path(key)
+    tmp_path = path + f".tmp-{os.getpid()}"
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path, exist_ok=True)
+        index: Dict[str, Any] = {
+            "image_offsets": _write_flat(os.path.join(tmp_path, "images.bin"), list(images)),
+            "image_shapes": np.array([x.shape for x in images], dtype=np.int64),
+        }
+        sampling_masks = dataset["sampling_masks"]
+        if sampling_masks is not None:
+            index["sampling_mask_offsets"] = _write_flat(os.path.join(tmp_path, "sampling_masks.bin"), list(sampling_masks))
+            index["sampling_mask_shapes"] = np.array([x.shape for x in sampling_masks], dtype=np.int64)
+        np.savez(os.path.join(tmp_path, "index.npz"), **index)
+
+        cameras = dataset["cameras"]
+        np.savez(os.path.join(tmp_path, "cameras.npz"), **{
+            k: getattr(cameras, k) for k in _CAMERAS_FIELDS if getattr(cameras, k) is not None})
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf8") as f:
+            json.dump({
+                "version": CACHE_VERSION,
+                "image_dtype": images[0].dtype.str if len(images) > 0 else "|u1",
+                "image_paths": dataset["image_paths"],
+                "image_paths_root": dataset["image_paths_root"],
+                "sampling_mask_paths": dataset["sampling_mask_paths"],
+                "sampling_mask_paths_root": dataset["sampling_mask_paths_root"],
+            }, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process has already written the cache
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        logger.debug(f"Stored dataset features in cache {path}")
+        return True
+    except OSError as e:
+        logger.warning(f"Failed to store dataset features in cache {path}: {e}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+
+
+def load_dataset_cache(key: str, dataset: UnloadedDataset) -> bool:
+    """
+    Loads the features of a dataset from the cache (in-place). The images are memory-mapped
+    (copy-on-write) so multiple processes loading the same dataset share the page cache.
+    Returns ``False`` if the cache entry does not exist.
+    """
+    path = get_dataset_cache_path(key)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return False
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            return False
+        with np.load(os.path.join(path, "index.npz")) as index:
+            index = dict(index)
+        with np.load(os.path.join(path, "cameras.npz")) as cameras_data:
+            cameras_data = dict(cameras_data)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load dataset features from cache {path}: {e}")
+        return False
+
+    dataset["images"] = _read_flat(
+        os.path.join(path, "images.bin"), np.dtype(meta["image_dtype"]),
+        index["image_offsets"], index["image_shapes"].tolist())
+    dataset["sampling_masks"] = None
+    if "sampling_mask_offsets" in index:
+        dataset["sampling_masks"] = _read_flat(
+            os.path.join(path, "sampling_masks.bin"), np.dtype(bool),
+            index["sampling_mask_offsets"], index["sampling_mask_shapes"].tolist())
+    dataset["cameras"] = new_cameras(**cast(Dict[str, np.ndarray], cameras_data))
+    dataset["image_paths"] = meta["image_paths"]
+    dataset["image_paths_root"] = meta["image_paths_root"]
+    dataset["sampling_mask_paths"] = meta["sampling_mask_paths"]
+    dataset["sampling_mask_paths_root"] = meta["sampling_mask_paths_root"]
+    logger.info(f"Loaded dataset features from cache {path}")
+    return True
@@ -39,6 +39,10 @@ CameraModel = collections.namedtuple("CameraModel", ["model_id", "model_name", "
 Camera = collections.namedtuple("Camera", ["id", "model", "width", "height", "params"])
 BaseImage = collections.namedtuple("BaseImage", ["id", "qvec", "tvec", "camera_id", "name", "xys", "point3D_ids"])
 Point3D = collections.namedtuple("Point3D", ["id", "xyz", "rgb", "error", "image_ids", "point2D_idxs"])
+# Array-backed points3D. The track of point i is stored in track_*[track_offsets[i]:track_offsets[i + 1]]
+Points3DArrays = collections.namedtuple("Points3DArrays", ["ids", "xyz", "rgb", "error", "track_offsets", "track_image_ids", "track_point2D_idxs"])
+_POINT3D_BINARY_DTYPE = np.dtype([("id", "<u8"), ("xyz", "<f8", (3,)), ("rgb", "u1", (3,)), ("error", "<f8"), ("track_length", "<u8")])
+_POINT2D_BINARY_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
 
 
 class Image(BaseImage):
@@ -219,36 +223,34 @@ def read_images_binary(path_to_model_file):
     """
     images = {}
     with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(fid, num_bytes=64, format_char_sequence="idddddddi")
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            image_name_binary = b""
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                image_name_binary += current_char
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            image_name = image_name_binary.decode("utf-8")
-            num_points2D = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
-            x_y_id_s = read_next_bytes(
-                fid,
-                num_bytes=24 * num_points2D,
-                format_char_sequence="ddq" * num_points2D,
-            )
-            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])), tuple(map(float, x_y_id_s[1::3]))])
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
-            )
+        data = fid.read()
+    num_reg_images = struct.unpack_from("<Q", data, 0)[0]
+    offset = 8
+    for _ in range(num_reg_images):
+        binary_image_properties = struct.unpack_from("<idddddddi", data, offset)
+        offset += 64
+        image_id = binary_image_properties[0]
+        qvec = np.array(binary_image_properties[1:5])
+        tvec = np.array(binary_image_properties[5:8])
+        camera_id = binary_image_properties[8]
+        name_end = data.index(b"\x00", offset)  # look for the ASCII 0 entry
+        image_name = data[offset:name_end].decode("utf-8")
+        offset = name_end + 1
+        num_points2D = struct.unpack_from("<Q", data, offset)[0]
+        offset += 8
+        x_y_id_s = np.frombuffer(data, dtype=_POINT2D_BINARY_DTYPE, count=num_points2D, offset=offset)
+        offset += 24 * num_points2D
+        xys = x_y_id_s["xy"].astype(np.float64)
+        point3D_ids = x_y_id_s["point3D_id"].astype(np.int64)
+        images[image_id] = Image(
+            id=image_id,
+            qvec=qvec,
+            tvec=tvec,
+            camera_id=camera_id,
+            name=image_name,
+            xys=xys,
+            point3D_ids=point3D_ids,
+        )
     return images
 
 
@@ -341,31 +343,90 @@ def read_points3D_binary(path_to_model_file):
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
-    points3D = {}
+    arrays = read_points3D_binary_arrays(path_to_model_file)
+    return points3D_arrays_to_dict(arrays)
+
+
+def read_points3D_binary_arrays(path_to_model_file):
+    """
+    Reads the points3D.bin file into flat numpy arrays (see ``Points3DArrays``).
+    The file is read at once and only the track lengths are scanned sequentially;
+    the point properties and tracks are extracted with vectorized numpy operations.
+    """
     with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(fid, num_bytes=43, format_char_sequence="QdddBBBd")
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
-            track_elems = read_next_bytes(
-                fid,
-                num_bytes=8 * track_length,
-                format_char_sequence="ii" * track_length,
-            )
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id,
-                xyz=xyz,
-                rgb=rgb,
-                error=error,
-                image_ids=image_ids,
-                point2D_idxs=point2D_idxs,
-            )
+        data = fid.read()
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+
+    # Find the start of each record (43 bytes of properties + 8 bytes of track length + track)
+    starts = np.empty((num_points,), dtype=np.int64)
+    track_lengths = np.empty((num_points,), dtype=np.int64)
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    offset = 8
+    for i in range(num_points):
+        track_length = unpack_track_length(data, offset + 43)[0]
+        starts[i] = offset
+        track_lengths[i] = track_length
+        offset += 51 + 8 * track_length
+
+    # Split the bytes into the record headers and the track elements
+    buffer = np.frombuffer(data, dtype=np.uint8, count=offset)
+    is_header = np.zeros((offset + 1,), dtype=np.int8)
+    is_header[starts] += 1
+    is_header[starts + 51] -= 1
+    is_header = np.cumsum(is_header[:-1], dtype=np.int8).astype(bool)
+    is_track = ~is_header
+    is_track[:8] = False
+    headers = buffer[is_header].view(_POINT3D_BINARY_DTYPE)
+    tracks = buffer[is_track].view("<i4").reshape(-1, 2)
+
+    track_offsets = np.zeros((num_points + 1,), dtype=np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    return Points3DArrays(
+        ids=headers["id"].astype(np.int64),
+        xyz=headers["xyz"].astype(np.float64),
+        rgb=headers["rgb"].copy(),
+        error=headers["error"].astype(np.float64),
+        track_offsets=track_offsets,
+        track_image_ids=tracks[:, 0].astype(np.int64),
+        track_point2D_idxs=tracks[:, 1].astype(np.int64),
+    )
+
+
+def points3D_dict_to_arrays(points3D):
+    """
+    Converts the dict returned by ``read_points3D_text`` or ``read_points3D_binary`` to ``Points3DArrays``.
+    """
+    track_lengths = np.array([len(pt.image_ids) for pt in points3D.values()], dtype=np.int64)
+    track_offsets = np.zeros((len(points3D) + 1,), dtype=np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    return Points3DArrays(
+        ids=np.array([pt.id for pt in points3D.values()], dtype=np.int64),
+        xyz=np.array([pt.xyz for pt in points3D.values()], dtype=np.float64).reshape(-1, 3),
+        rgb=np.array([pt.rgb for pt in points3D.values()], dtype=np.uint8).reshape(-1, 3),
+        error=np.array([pt.error for pt in points3D.values()], dtype=np.float64),
+        track_offsets=track_offsets,
+        track_image_ids=np.concatenate([np.asarray(pt.image_ids, dtype=np.int64) for pt in points3D.values()] + [np.zeros((0,), dtype=np.int64)]),
+        track_point2D_idxs=np.concatenate([np.asarray(pt.point2D_idxs, dtype=np.int64) for pt in points3D.values()] + [np.zeros((0,), dtype=np.int64)]),
+    )
+
+
+def points3D_arrays_to_dict(arrays):
+    """
+    Converts ``Points3DArrays`` to the dict of ``Point3D`` returned by ``read_points3D_binary``.
+    All arrays of the returned points are views into ``arrays``.
+    """
+    points3D = {}
+    offsets = arrays.track_offsets.tolist()
+    for i, point3D_id in enumerate(arrays.ids.tolist()):
+        start, end = offsets[i], offsets[i + 1]
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=arrays.xyz[i],
+            rgb=arrays.rgb[i],
+            error=arrays.error[i],
+            image_ids=arrays.track_image_ids[start:end],
+            point2D_idxs=arrays.track_point2D_idxs[start:end],
+        )
     return points3D
 
 
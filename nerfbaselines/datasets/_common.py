@@ -12,13 +12,16 @@ import logging
 import os
 import struct
 import tempfile
+import operator
+import threading
+from collections import OrderedDict
 import numpy as np
 import PIL.Image
 import PIL.ExifTags
 from tqdm import tqdm
 from typing import (
     Optional, TypeVar, Tuple, Union, List, Dict, Any, 
-    FrozenSet, Iterable,
+    FrozenSet, Iterable, Sequence, Callable,
     overload, cast,
 )
 from nerfbaselines.io import wget
@@ -33,6 +36,7 @@ from nerfbaselines import (
     NB_PREFIX,
 )
 from .. import cameras
+from . import _cache as _dataset_cache
 from ..utils import padded_stack, pad_poses, unpad_poses, apply_transform
 try:
     from typing import Literal
@@ -217,6 +221,32 @@ def get_default_viewer_transform(poses, dataset_type: Optional[str]) -> Tuple[np
         raise ValueError(f"Dataset type {dataset_type} is not supported")
 
 
+def _dataset_undistort_paths(dataset: Dataset, i: int):
+    if dataset["image_paths"] is not None:
+        dataset["image_paths"][i] = os.path.join(
+            "/undistorted", os.path.split(dataset["image_paths"][i])[-1]
+        )
+    if dataset["sampling_mask_paths"] is not None:
+        dataset["sampling_mask_paths"][i] = os.path.join(
+            "/undistorted-masks", os.path.split(dataset["sampling_mask_paths"][i])[-1]
+        )
+
+
+class _UndistortImage:
+    def __init__(self, cameras: Cameras, undistorted_cameras: Cameras, indices: List[int]):
+        self.cameras = cameras
+        self.undistorted_cameras = undistorted_cameras
+        self.indices = {index: j for j, index in enumerate(indices)}
+
+    def __call__(self, index: int, image: np.ndarray) -> np.ndarray:
+        j = self.indices.get(index)
+        if j is None:
+            return image
+        camera = self.cameras[j]
+        ow, oh = camera.image_sizes
+        return cameras.warp_image_between_cameras(camera, self.undistorted_cameras[j], image[:oh, :ow])
+
+
 def _dataset_undistort_unsupported(dataset: Dataset, supported_camera_models):
     assert dataset["images"] is not None, "Images must be loaded"
     supported_models_int = set(camera_model_to_int(x) for x in supported_camera_models)
@@ -228,6 +258,25 @@ def _dataset_undistort_unsupported(dataset: Dataset, supported_camera_models):
     if len(undistort_tasks) == 0:
         return False
 
+    # Undistort all cameras at once (frames sharing the same camera are only solved once)
+    undistort_indices = [i for i, _ in undistort_tasks]
+    distorted_cameras = dataset["cameras"][undistort_indices]
+    undistorted_cameras = cameras.undistort_camera(distorted_cameras)
+
+    if isinstance(dataset["images"], LazyImages):
+        # Images are undistorted when they are decoded
+        for j, i in enumerate(undistort_indices):
+            _dataset_undistort_paths(dataset, i)
+            # IMPORTANT: camera is modified in-place
+            dataset["cameras"][i] = undistorted_cameras[j]
+        warp_fn = _UndistortImage(distorted_cameras, undistorted_cameras, undistort_indices)
+        dataset["images"] = dataset["images"].map(warp_fn)
+        if dataset["sampling_masks"] is not None:
+            assert isinstance(dataset["sampling_masks"], LazyImages), "Sampling masks must be lazy if images are lazy"
+            dataset["sampling_masks"] = dataset["sampling_masks"].map(warp_fn)
+        dataset["image_paths_root"] = "/undistorted"
+        return True
+
     was_list = isinstance(dataset["images"], list)
     new_images = list(dataset["images"])
     new_sampling_masks = (
@@ -239,26 +288,24 @@ def _dataset_undistort_unsupported(dataset: Dataset, supported_camera_models):
     # Release memory here
     gc.collect()
 
-    for i, camera in tqdm(undistort_tasks, desc="undistorting images", dynamic_ncols=True):
-        undistorted_camera = cameras.undistort_camera(camera)
-        ow, oh = camera.image_sizes
-        if dataset["image_paths"] is not None:
-            dataset["image_paths"][i] = os.path.join(
-                "/undistorted", os.path.split(dataset["image_paths"][i])[-1]
-            )
-        if dataset["sampling_mask_paths"] is not None:
-            dataset["sampling_mask_paths"][i] = os.path.join(
-                "/undistorted-masks", os.path.split(dataset["sampling_mask_paths"][i])[-1]
-            )
-        warped = cameras.warp_image_between_cameras(
-            camera, undistorted_camera, new_images[i][:oh, :ow]
-        )
-        new_images[i] = warped
+    # Images of the same size are warped in batches
+    def _warp_all(images):
+        cropped = [images[i][:camera.image_sizes[1], :camera.image_sizes[0]] for i, camera in undistort_tasks]
+        for j, warped in cameras._warp_images_between_cameras(distorted_cameras, undistorted_cameras, cropped):
+            images[undistort_indices[j]] = warped
+            # Release the original image
+            cropped[j] = None
+            progress.update(1)
+
+    num_steps = len(undistort_tasks) * (2 if new_sampling_masks is not None else 1)
+    with tqdm(total=num_steps, desc="undistorting images", dynamic_ncols=True) as progress:
+        _warp_all(new_images)
         if new_sampling_masks is not None:
-            warped = cameras.warp_image_between_cameras(camera, undistorted_camera, new_sampling_masks[i][:oh, :ow])
-            new_sampling_masks[i] = warped
+            _warp_all(new_sampling_masks)
+    for j, i in enumerate(undistort_indices):
+        _dataset_undistort_paths(dataset, i)
         # IMPORTANT: camera is modified in-place
-        dataset["cameras"][i] = undistorted_camera
+        dataset["cameras"][i] = undistorted_cameras[j]
     if not was_list:
         dataset["images"] = padded_stack(new_images)
         dataset["sampling_masks"] = (
@@ -337,12 +384,261 @@ def _dataset_rescale_intrinsics(dataset: Dataset, image_sizes: np.ndarray):
             intrinsics=(cameras.intrinsics * multipliers).astype(cameras.intrinsics.dtype))
 
 
+def _get_num_loader_workers(num_workers: Optional[int] = None) -> int:
+    if num_workers is None:
+        num_workers = int(os.environ.get("NERFBASELINES_LOADER_WORKERS", min(8, os.cpu_count() or 1)))
+    return max(0, num_workers)
+
+
+def _load_image(path: str, color_space: str, resize: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+    if str(path).endswith(".bin"):
+        assert color_space == "linear"
+        with open(path, "rb") as f:
+            data_bytes = f.read()
+            h, w = struct.unpack("<II", data_bytes[:8])
+            image = (
+                np.frombuffer(
+                    data_bytes, dtype=np.float16, count=h * w * 4, offset=8
+                )
+                .astype(np.float32)
+                .reshape([h, w, 4])
+            )
+        metadata = np.array(
+            [np.nan for _ in range(len(METADATA_COLUMNS))], dtype=np.float32
+        )
+    else:
+        assert color_space == "srgb"
+        pil_image = PIL.Image.open(path)
+        metadata = get_image_metadata(pil_image)
+        if resize is not None:
+            w, h = pil_image.size
+            new_size = round(w/resize), round(h/resize)
+            pil_image = pil_image.resize(new_size, PIL.Image.Resampling.BICUBIC)
+            warnings.warn(f"Resized image with a factor of {resize}")
+
+        image = np.array(pil_image, dtype=np.uint8)
+        if len(image.shape)==2:
+            image = np.stack(3*[image], axis=-1)
+    return image, metadata
+
+
+def _load_sampling_mask(path: str, resize: Optional[float]) -> np.ndarray:
+    sampling_mask = PIL.Image.open(path).convert("L")
+    if resize is not None:
+        w, h = sampling_mask.size
+        new_size = round(w*resize), round(h*resize)
+        sampling_mask = sampling_mask.resize(new_size, PIL.Image.Resampling.NEAREST)
+        warnings.warn(f"Resized sampling mask with a factor of {resize}")
+    return np.array(sampling_mask, dtype=np.uint8).astype(bool)
+
+
+def _read_image_size(path: str, resize: Optional[float]) -> Tuple[int, int]:
+    # Reads only the header of the image
+    if str(path).endswith(".bin"):
+        with open(path, "rb") as f:
+            h, w = struct.unpack("<II", f.read(8))
+        return w, h
+    with PIL.Image.open(path) as pil_image:
+        w, h = pil_image.size
+    if resize is not None:
+        w, h = round(w/resize), round(h/resize)
+    return w, h
+
+
+class _ImageLoader:
+    def __init__(self, paths: List[str], color_space: str, resize: Optional[float]):
+        self.paths = paths
+        self.color_space = color_space
+        self.resize = resize
+
+    def __call__(self, index: int) -> np.ndarray:
+        return _load_image(self.paths[index], self.color_space, self.resize)[0]
+
+
+class _SamplingMaskLoader:
+    def __init__(self, paths: List[str], resize: Optional[float]):
+        self.paths = paths
+        self.resize = resize
+
+    def __call__(self, index: int) -> np.ndarray:
+        return _load_sampling_mask(self.paths[index], self.resize)
+
+
+class _IndexedLoader:
+    def __init__(self, load_fn: Callable[[int], np.ndarray], indices: List[int]):
+        self.load_fn = load_fn
+        self.indices = indices
+
+    def __call__(self, index: int) -> np.ndarray:
+        return self.load_fn(self.indices[index])
+
+
+class _MappedLoader:
+    def __init__(self, load_fn: Callable[[int], np.ndarray], map_fn: Callable[[int, np.ndarray], np.ndarray]):
+        self.load_fn = load_fn
+        self.map_fn = map_fn
+
+    def __call__(self, index: int) -> np.ndarray:
+        return self.map_fn(index, self.load_fn(index))
+
+
+class LazyImages(Sequence[np.ndarray]):
+    """
+    A sequence of images which are decoded when accessed. The most recently
+    accessed ``max_cached`` images are kept in memory (LRU). It can be used in place
+    of the list of images in ``Dataset["images"]`` and ``Dataset["sampling_masks"]``.
+    The sequence can be pickled (the cache is not pickled), provided the loader can be pickled.
+
+    Args:
+        load_fn: Function which loads the image at the given index.
+        length: Number of images.
+        max_cached: Maximum number of decoded images to keep in memory.
+    """
+    def __init__(self, load_fn: Callable[[int], np.ndarray], length: int, *, max_cached: int = 16):
+        self._load_fn = load_fn
+        self._length = length
+        self._max_cached = max_cached
+        self._cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> np.ndarray:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "LazyImages":
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.index_select(range(self._length)[index])
+        index = operator.index(index)
+        if index < 0:
+            index += self._length
+        if not (0 <= index < self._length):
+            raise IndexError(f"Index {index} out of range for {self._length} images")
+        with self._lock:
+            image = self._cache.get(index)
+            if image is not None:
+                self._cache.move_to_end(index)
+                return image
+        image = self._load_fn(index)
+        if self._max_cached > 0:
+            with self._lock:
+                self._cache[index] = image
+                while len(self._cache) > self._max_cached:
+                    self._cache.popitem(last=False)
+        return image
+
+    def index_select(self, indices: Iterable[int]) -> "LazyImages":
+        """
+        Returns a new lazy sequence containing the images at the given indices.
+        """
+        indices = [int(i) for i in indices]
+        return LazyImages(_IndexedLoader(self._load_fn, indices), len(indices), max_cached=self._max_cached)
+
+    def map(self, map_fn: Callable[[int, np.ndarray], np.ndarray]) -> "LazyImages":
+        """
+        Returns a new lazy sequence where ``map_fn(index, image)`` is applied to the images when they are loaded.
+        """
+        return LazyImages(_MappedLoader(self._load_fn, map_fn), self._length, max_cached=self._max_cached)
+
+    def __getstate__(self):
+        return {"load_fn": self._load_fn, "length": self._length, "max_cached": self._max_cached}
+
+    def __setstate__(self, state):
+        self.__init__(state["load_fn"], state["length"], max_cached=state["max_cached"])
+
+
+def _ordered_parallel_map(fn, items, *, num_workers: int, executor: str = "thread", prefetch: Optional[int] = None):
+    """
+    Applies ``fn`` to ``items`` on a worker pool, yielding the results in the order of ``items``.
+    At most ``prefetch`` results are in-flight at any time, which bounds the memory used by
+    results that were decoded but not consumed yet.
+    """
+    if num_workers <= 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    import collections
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    if prefetch is None:
+        prefetch = 2 * num_workers
+    prefetch = max(prefetch, 1)
+    if executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=num_workers)
+    elif executor == "process":
+        pool = ProcessPoolExecutor(max_workers=num_workers)
+    else:
+        raise ValueError(f"Unknown executor {executor}, supported executors are 'thread' and 'process'")
+    pending = collections.deque()
+    try:
+        for item in items:
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
 def dataset_load_features(
-    dataset: UnloadedDataset, features=None, supported_camera_models=None, show_progress=True
+    dataset: UnloadedDataset, 
+    features=None, 
+    supported_camera_models=None, 
+    show_progress=True, 
+    *,
+    num_workers: Optional[int] = None,
+    executor: Literal["thread", "process"] = "thread",
+    prefetch: Optional[int] = None,
+    cache: Optional[bool] = None,
+    lazy: bool = False,
+    max_cached_images: int = 16,
 ) -> Dataset:
+    """
+    Loads the images (and sampling masks) of an unloaded dataset, rescales the intrinsics to match the
+    loaded image sizes and undistorts the cameras not supported by the method.
+
+    Images are decoded on a pool of ``num_workers`` workers (threads by default, PIL releases the GIL
+    while decoding). The order of the images is preserved and at most ``prefetch`` decoded images are
+    in-flight at any time. Timings of the individual stages are logged at the end.
+
+    Args:
+        dataset: The dataset to load the features for.
+        features: The features to load.
+        supported_camera_models: Camera models supported by the method. Other cameras are undistorted.
+        show_progress: Whether to show the progress bar.
+        num_workers: Number of decoding workers. If ``None``, it is read from the ``NERFBASELINES_LOADER_WORKERS``
+            environment variable (defaults to the number of CPUs, up to 8). Zero decodes the images in the current thread.
+        executor: The pool type to use (``"thread"`` or ``"process"``).
+        prefetch: Maximum number of images being decoded ahead of the consumer. Defaults to ``2 * num_workers``.
+        cache: Whether to use the on-disk cache of decoded features (stored in ``NB_PREFIX/cache/datasets``).
+            If ``None``, the cache is enabled by setting the ``NERFBASELINES_DATASET_CACHE=1`` environment variable.
+        lazy: If ``True``, only the image sizes are read and ``images`` (and ``sampling_masks``) are
+            :class:`LazyImages` sequences decoding the images on access. Useful when only a few images are used.
+        max_cached_images: Maximum number of decoded images kept in memory by the lazy sequences.
+    """
     if features is None:
         features = frozenset(("color",))
-    images: List[np.ndarray] = []
+    cache_key = None
+    if _dataset_cache.is_dataset_cache_enabled(cache):
+        cache_key = _dataset_cache.get_dataset_cache_key(dataset, features, supported_camera_models)
+        if cache_key is not None and _dataset_cache.load_dataset_cache(cache_key, dataset):
+            return cast(Dataset, dataset)
+    num_workers = _get_num_loader_workers(num_workers)
+    if len(dataset["image_paths"]) <= 1:
+        # Not worth starting a pool (e.g., the viewer loads single images)
+        num_workers = 0
+    timings: Dict[str, float] = {}
+    images: Union[List[np.ndarray], LazyImages] = []
     image_sizes = []
     all_metadata = []
     resize = dataset["metadata"].get("downscale_loaded_factor")
@@ -353,55 +649,35 @@ def dataset_load_features(
     if image_paths_root is not None:
         logger.info(f"Loading images from {image_paths_root}")
 
-    i = 0
-    for p in tqdm(dataset["image_paths"], desc="loading images", dynamic_ncols=True, disable=not show_progress):
-        if str(p).endswith(".bin"):
-            assert dataset["metadata"]["color_space"] == "linear"
-            with open(p, "rb") as f:
-                data_bytes = f.read()
-                h, w = struct.unpack("<II", data_bytes[:8])
-                image = (
-                    np.frombuffer(
-                        data_bytes, dtype=np.float16, count=h * w * 4, offset=8
-                    )
-                    .astype(np.float32)
-                    .reshape([h, w, 4])
-                )
-            metadata = np.array(
-                [np.nan for _ in range(len(METADATA_COLUMNS))], dtype=np.float32
-            )
-        else:
-            assert dataset["metadata"]["color_space"] == "srgb"
-            pil_image = PIL.Image.open(p)
-            metadata = get_image_metadata(pil_image)
-            if resize is not None:
-                w, h = pil_image.size
-                new_size = round(w/resize), round(h/resize)
-                pil_image = pil_image.resize(new_size, PIL.Image.Resampling.BICUBIC)
-                warnings.warn(f"Resized image with a factor of {resize}")
-
-            image = np.array(pil_image, dtype=np.uint8)
-            if len(image.shape)==2:
-                image = np.stack(3*[image], axis=-1)
-        images.append(image)
-        image_sizes.append([image.shape[1], image.shape[0]])
-        all_metadata.append(metadata)
-        i += 1
+    start = time.perf_counter()
+    if lazy:
+        # Only the image headers are read, the images are decoded on access
+        read_image_size = functools.partial(_read_image_size, resize=resize)
+        image_sizes = [list(x) for x in _ordered_parallel_map(read_image_size, dataset["image_paths"], num_workers=num_workers, executor="thread")]
+        images = LazyImages(_ImageLoader(list(dataset["image_paths"]), dataset["metadata"]["color_space"], resize), 
+                            len(dataset["image_paths"]), max_cached=max_cached_images)
+    else:
+        load_image = functools.partial(_load_image, color_space=dataset["metadata"]["color_space"], resize=resize)
+        for image, metadata in tqdm(_ordered_parallel_map(load_image, dataset["image_paths"], num_workers=num_workers, executor=executor, prefetch=prefetch),
+                                    total=len(dataset["image_paths"]), desc="loading images", dynamic_ncols=True, disable=not show_progress):
+            images.append(image)
+            image_sizes.append([image.shape[1], image.shape[0]])
+            all_metadata.append(metadata)
+    timings["images"] = time.perf_counter() - start
 
     logger.debug(f"Loaded {len(images)} images")
 
     if dataset["sampling_mask_paths"] is not None:
-        sampling_masks = []
-        for p in tqdm(dataset["sampling_mask_paths"], desc="loading sampling masks", dynamic_ncols=True):
-            sampling_mask = PIL.Image.open(p).convert("L")
-            if resize is not None:
-                w, h = sampling_mask.size
-                new_size = round(w*resize), round(h*resize)
-                sampling_mask = sampling_mask.resize(new_size, PIL.Image.Resampling.NEAREST)
-                warnings.warn(f"Resized sampling mask with a factor of {resize}")
-
-            sampling_masks.append(np.array(sampling_mask, dtype=np.uint8).astype(bool))
+        start = time.perf_counter()
+        if lazy:
+            sampling_masks = LazyImages(_SamplingMaskLoader(list(dataset["sampling_mask_paths"]), resize), 
+                                        len(dataset["sampling_mask_paths"]), max_cached=max_cached_images)
+        else:
+            load_sampling_mask = functools.partial(_load_sampling_mask, resize=resize)
+            sampling_masks = list(tqdm(_ordered_parallel_map(load_sampling_mask, dataset["sampling_mask_paths"], num_workers=num_workers, executor=executor, prefetch=prefetch),
+                                       total=len(dataset["sampling_mask_paths"]), desc="loading sampling masks", dynamic_ncols=True, disable=not show_progress))
         dataset["sampling_masks"] = sampling_masks  # padded_stack(sampling_masks)
+        timings["sampling_masks"] = time.perf_counter() - start
         logger.debug(f"Loaded {len(sampling_masks)} sampling masks")
 
     if resize is not None:
@@ -421,13 +697,23 @@ def dataset_load_features(
     # Replace image sizes and metadata
     image_sizes = np.array(image_sizes, dtype=np.int32)
 
+    start = time.perf_counter()
     _dataset_rescale_intrinsics(cast(Dataset, dataset), image_sizes)
+    timings["rescale_intrinsics"] = time.perf_counter() - start
 
     if supported_camera_models is not None:
+        start = time.perf_counter()
         if _dataset_undistort_unsupported(cast(Dataset, dataset), supported_camera_models):
             logger.warning(
                 "Some cameras models are not supported by the method. Images have been undistorted. Make sure to use the undistorted images for training."
             )
+        timings["undistort"] = time.perf_counter() - start
+
+    if cache_key is not None and not lazy and _dataset_cache.save_dataset_cache(cache_key, dataset):
+        # Replace the private copies with the shared memory-mapped images
+        _dataset_cache.load_dataset_cache(cache_key, dataset)
+    log = logger.info if show_progress else logger.debug
+    log(f"Loaded dataset features using {num_workers} workers in {sum(timings.values()):.2f}s (" + ", ".join(f"{k}: {v:.2f}s" for k, v in timings.items()) + ")")
     return cast(Dataset, dataset)
 
 
@@ -475,6 +761,8 @@ def dataset_index_select(dataset: TDataset, i: Union[slice, list, np.ndarray]) -
             return obj[i]
         if isinstance(obj, np.ndarray):
             return obj[i]
+        if isinstance(obj, LazyImages):
+            return obj.index_select(np.arange(dataset_len)[i])
         if isinstance(obj, list):
             indices = np.arange(dataset_len)[i]
             return [obj[i] for i in indices]
@@ -517,6 +805,7 @@ def load_dataset(
         features: Optional[FrozenSet[DatasetFeature]] = ...,
         supported_camera_models: Optional[FrozenSet[CameraModel]] = ...,
         load_features: Literal[True] = ...,
+        lazy: bool = ...,
         **kwargs) -> Dataset:
     ...
 
@@ -528,6 +817,7 @@ def load_dataset(
         features: Optional[FrozenSet[DatasetFeature]] = ...,
         supported_camera_models: Optional[FrozenSet[CameraModel]] = ...,
         load_features: Literal[False] = ...,
+        lazy: bool = ...,
         **kwargs) -> UnloadedDataset:
     ...
 
@@ -727,6 +1017,7 @@ def load_dataset(
         features: Optional[FrozenSet[DatasetFeature]] = None,
         supported_camera_models: Optional[FrozenSet[CameraModel]] = None,
         load_features: bool = True,
+        lazy: bool = False,
         **kwargs,
         ) -> Union[Dataset, UnloadedDataset]:
     path = str(path)
@@ -813,5 +1104,5 @@ def load_dataset(
             dataset_instance["metadata"]["evaluation_protocol"] = eval_protocol
 
     if load_features:
-        return dataset_load_features(dataset_instance, features=kwargs["features"], supported_camera_models=supported_camera_models)
+        return dataset_load_features(dataset_instance, features=kwargs["features"], supported_camera_models=supported_camera_models, lazy=lazy)
     return dataset_instance
@@ -2,7 +2,7 @@ import typing
 from collections import OrderedDict
 import logging
 from pathlib import Path
-from typing import Tuple, Optional, Dict, List, Union, FrozenSet
+from typing import Tuple, Optional, List, Union, FrozenSet
 import numpy as np
 from nerfbaselines import DatasetFeature, CameraModel, camera_model_to_int, new_cameras, DatasetNotFoundError, new_dataset
 from ..utils import Indices
@@ -265,14 +265,14 @@ def load_colmap_dataset(path: Union[Path, str],
     else:
         raise DatasetNotFoundError("Missing 'sparse/0/images.{bin,txt}' file in COLMAP dataset")
 
-    points3D: Optional[Dict[int, colmap_utils.Point3D]] = None
+    points3D: Optional[colmap_utils.Points3DArrays] = None
     if load_points:
         if not (colmap_path / "points3D.bin").exists() and not (colmap_path / "points3D.txt").exists():
             raise DatasetNotFoundError("Missing 'sparse/0/points3D.{bin,txt}' file in COLMAP dataset")
         if (colmap_path / "points3D.bin").exists():
-            points3D = colmap_utils.read_points3D_binary(colmap_path / "points3D.bin")
+            points3D = colmap_utils.read_points3D_binary_arrays(colmap_path / "points3D.bin")
         elif (colmap_path / "points3D.txt").exists():
-            points3D = colmap_utils.read_points3D_text(colmap_path / "points3D.txt")
+            points3D = colmap_utils.points3D_dict_to_arrays(colmap_utils.read_points3D_text(colmap_path / "points3D.txt"))
         else:
             raise DatasetNotFoundError("Missing 'sparse/0/points3D.{bin,txt}' file in COLMAP dataset")
 
@@ -334,16 +334,20 @@ def load_colmap_dataset(path: Union[Path, str],
     images_points3D_indices = None
     if load_points:
         assert points3D is not None, "3D points have not been loaded"
-        points3D_xyz = np.array([p.xyz for p in points3D.values()], dtype=np.float32)
-        points3D_rgb = np.array([p.rgb for p in points3D.values()], dtype=np.uint8)
+        points3D_xyz = points3D.xyz.astype(np.float32)
+        points3D_rgb = points3D.rgb.astype(np.uint8)
         if "images_points3D_indices" in features:
             images_points3D_indices = []
-            ptmap = {point3D_id: i for i, point3D_id in enumerate(points3D.keys())}
+            sorter = np.argsort(points3D.ids, kind="stable")
+            sorted_ids = points3D.ids[sorter]
             for ids in images_points3D_ids:
-                indices3D = np.array([
-                    ptmap[point3D_id] for point3D_id in ids if point3D_id != -1
-                ], dtype=np.int32)
-                images_points3D_indices.append(indices3D)
+                ids = np.asarray(ids, dtype=np.int64)
+                ids = ids[ids != -1]
+                positions = np.searchsorted(sorted_ids, ids).clip(max=max(len(sorted_ids) - 1, 0))
+                missing = ids[sorted_ids[positions] != ids] if len(sorted_ids) > 0 else ids
+                if len(missing) > 0:
+                    raise KeyError(int(missing[0]))
+                images_points3D_indices.append(sorter[positions].astype(np.int32))
 
     # camera_ids=torch.tensor(camera_ids, dtype=torch.int32),
     all_cameras = new_cameras(
@@ -4,11 +4,16 @@ import zipfile
 import tarfile
 import time
 import io
+import hashlib
+import threading
+from collections import deque
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import logging
 import os
 import typing
-from typing import Dict, Union, Iterable, TypeVar, Optional, cast, List, Tuple, BinaryIO, Any
+from typing import Dict, Union, Iterable, TypeVar, Optional, cast, List, Tuple, BinaryIO, Any, Sequence, Callable
 import numpy as np
 import json
 from pathlib import Path
@@ -18,12 +23,14 @@ from tqdm import tqdm
 
 import nerfbaselines
 from .utils import (
+    CancellationToken,
     apply_colormap,
     image_to_srgb,
     visualize_depth,
     convert_image_dtype, 
 )
 from .backends import run_on_host, zero_copy
+from .backends._common import is_remote_instance, current_backend_options, _use_backend_options
 from . import (
     Dataset,
     RenderOutput, 
@@ -37,12 +44,14 @@ from . import (
     new_dataset,
 )
 from .io import (
-    open_any_directory, 
     deserialize_nb_info, 
-    get_predictions_sha,
     get_method_sha,
     save_evaluation_results,
     _save_predictions_iterate,
+    _get_prediction_name,
+    _open_predictions,
+    _PredictionsHasher,
+    get_predictions_sha,
     save_image,
     read_image, 
 )
@@ -106,16 +115,18 @@ def compute_metrics(pred, gt, *, reduce: bool = True, run_lpips_vgg: bool = Fals
     pred = pred[..., : gt.shape[-1]]
     pred = convert_image_dtype(pred, np.float32)
     gt = convert_image_dtype(gt, np.float32)
-    mse = metrics.mse(pred, gt)
+    values = metrics.compute_image_metrics(gt, pred)
     out = {
-        "psnr": reduction(metrics.psnr(mse)),
-        "ssim": reduction(metrics.ssim(gt, pred)),
-        "mae": reduction(metrics.mae(gt, pred)),
-        "mse": reduction(mse),
-        "lpips": reduction(metrics.lpips(gt, pred)),
+        "psnr": reduction(values["psnr"]),
+        "ssim": reduction(values["ssim"]),
+        "mae": reduction(values["mae"]),
+        "mse": reduction(values["mse"]),
+        "lpips": reduction(values["lpips"]),
     }
     if run_lpips_vgg:
-        out["lpips_vgg"] = reduction(metrics.lpips_vgg(gt, pred))
+        # NOTE: metrics.lpips is LPIPS-VGG by default, we do not need to evaluate it twice
+        lpips_vgg = values["lpips"] if metrics.lpips is metrics.lpips_vgg else metrics.lpips_vgg(gt, pred)
+        out["lpips_vgg"] = reduction(lpips_vgg)
     return out
 
 
@@ -127,10 +138,67 @@ def path_is_video(path: str) -> bool:
             path.endswith(".mov"))
 
 
+# Memory budget (in bytes) for the predictions and ground-truth images evaluated together in a batch.
+_EVALUATE_BATCH_MEMORY = 1 << 30
+
+
+def _evaluate_all(evaluation_protocol: EvaluationProtocol, 
+                  predictions: Iterable[RenderOutput], 
+                  dataset: Dataset, 
+                  *, 
+                  batched: bool = False) -> Iterable[Dict[str, Union[float, int]]]:
+    """
+    Evaluates the predictions one by one (in the same order). If batched is True and the evaluation protocol
+    supports it (does not raise NotImplementedError in `evaluate_batch`), consecutive predictions of the same size are grouped 
+    into batches (bounded by `_EVALUATE_BATCH_MEMORY`) and evaluated together.
+    """
+    if not batched:
+        for i, pred in enumerate(predictions):
+            yield evaluation_protocol.evaluate(pred, dataset_index_select(dataset, [i]))
+        return
+
+    batch: List[RenderOutput] = []
+    batch_indices: List[int] = []
+    batch_key = None
+    batch_memory = 0
+    supports_batch = True
+
+    def flush():
+        nonlocal supports_batch
+        results = None
+        if supports_batch:
+            try:
+                results = evaluation_protocol.evaluate_batch(batch, dataset_index_select(dataset, batch_indices))
+            except NotImplementedError:
+                supports_batch = False
+        if results is None:
+            results = [evaluation_protocol.evaluate(pred, dataset_index_select(dataset, [i])) for pred, i in zip(batch, batch_indices)]
+        yield from results
+        batch.clear()
+        batch_indices.clear()
+
+    for i, pred in enumerate(predictions):
+        color = pred["color"]
+        gt = dataset["images"][i]
+        key = (color.shape, gt.shape)
+        # Memory of the float32 RGB(A) copies of the prediction and the ground truth
+        memory = 4 * (color.size + gt.size)
+        if batch and (key != batch_key or batch_memory + memory > _EVALUATE_BATCH_MEMORY):
+            yield from flush()
+        if not batch:
+            batch_key, batch_memory = key, 0
+        batch.append(pred)
+        batch_indices.append(i)
+        batch_memory += memory
+    if batch:
+        yield from flush()
+
+
 def evaluate(predictions: str, 
              output: str, 
              description: str = "evaluating", 
-             evaluation_protocol: Optional[EvaluationProtocol] = None):
+             evaluation_protocol: Optional[EvaluationProtocol] = None,
+             batched: bool = False):
     """
     Evaluate a set of predictions.
 
@@ -139,19 +207,22 @@ def evaluate(predictions: str,
         output: Path to a json file where the results will be written.
         description: Description of the evaluation, used for progress bar.
         evaluation_protocol: The evaluation protocol to use. If None, the protocol from info.json will be used.
+        batched: If True, images of the same size are evaluated in batches (if supported by the evaluation protocol).
+            The evaluation is faster (especially on CPU), but the metrics can differ in the last digits
+            (up to floating point precision, i.e., relative tolerance around 1e-6). Disabled by default
+            so that the published results are reproducible.
     Returns:
         A dictionary containing the results.
     """
     if os.path.exists(output):
         raise FileExistsError(f"{output} already exists")
 
-    with open_any_directory(predictions, "r") as _predictions_path:
-        predictions_path = Path(_predictions_path)
-        try:
-            with open(predictions_path / "info.json", "r", encoding="utf8") as f:
-                nb_info = json.load(f)
-            nb_info = deserialize_nb_info(nb_info)
-        except FileNotFoundError:
+    # The predictions are read in a single pass (archives are not extracted) in the order 
+    # in which they are stored. The per-image metrics are sorted at the end.
+    with _open_predictions(predictions, ordered=False) as (info_data, relpaths, files):
+        if info_data is not None:
+            nb_info = deserialize_nb_info(json.loads(info_data.decode("utf8")))
+        else:
             nb_info = {"evaluation_protocol": "default"}
 
         if evaluation_protocol is None:
@@ -159,63 +230,196 @@ def evaluate(predictions: str,
         logging.info(f"Using evaluation protocol {evaluation_protocol.get_name()}")
 
         # Run the evaluation
-        metrics_lists = {}
-        relpaths = [str(x.relative_to(predictions_path / "color")) for x in (predictions_path / "color").glob("**/*") if x.is_file()]
-        relpaths.sort()
+        image_metrics: List[Dict[str, Union[float, int]]] = []
+        hasher = _PredictionsHasher(relpaths)
+        # The ground-truth images are loaded together with the predictions
+        # and released once they are evaluated
+        gt_images: List[Optional[np.ndarray]] = [None] * len(relpaths)
 
         def read_predictions() -> Iterable[RenderOutput]:
-            # Load the prediction
-            for relname in relpaths:
+            for i, (relname, color_data, gt_data) in enumerate(files):
+                hasher.update(relname, color_data, gt_data)
+                gt_images[i] = _decode_image(relname, gt_data)
                 yield {
-                    "color": read_image(predictions_path / "color" / relname)
+                    "color": _decode_image(relname, color_data)
                 }
 
-        gt_images = [
-            read_image(predictions_path / "gt-color" / name) for name in relpaths
-        ]
         with suppress_type_checks():
-            from pprint import pprint
-            pprint(nb_info)
             dataset = new_dataset(
                 cameras=typing.cast(Cameras, None),
                 image_paths=relpaths,
-                image_paths_root=str(predictions_path / "color"),
+                image_paths_root=os.path.join(str(predictions), "color"),
                 metadata=typing.cast(Dict, nb_info.get("render_dataset_metadata", nb_info.get("dataset_metadata", {}))),
-                images=gt_images)
+                images=typing.cast(List[np.ndarray], gt_images))
 
             # Evaluate the prediction
             with tqdm(desc=description, dynamic_ncols=True, total=len(relpaths)) as progress:
-                def collect_metrics_lists():
-                    for i, pred in enumerate(read_predictions()):
-                        dataset_slice = dataset_index_select(dataset, [i])
-                        metrics = evaluation_protocol.evaluate(pred, dataset_slice)
-                        for k, v in metrics.items():
-                            if k not in metrics_lists:
-                                metrics_lists[k] = []
-                            metrics_lists[k].append(v)
-                        progress.update(1)
-                        if "psnr" in metrics_lists:
-                            psnr_val = np.mean(metrics_lists["psnr"][-1])
-                            progress.set_postfix(psnr=f"{psnr_val:.4f}")
-                        yield metrics
-
-                metrics = evaluation_protocol.accumulate_metrics(collect_metrics_lists())
-
-
-        predictions_sha, ground_truth_sha = get_predictions_sha(str(predictions_path))
-
-        # If output is specified, write the results to a file
-        if os.path.exists(str(output)):
-            raise FileExistsError(f"{output} already exists")
-
-        out = save_evaluation_results(str(output),
-                                      metrics=metrics, 
-                                      metrics_lists=metrics_lists, 
-                                      predictions_sha=predictions_sha,
-                                      ground_truth_sha=ground_truth_sha,
-                                      evaluation_protocol=evaluation_protocol.get_name(),
-                                      nb_info=nb_info)
-        return out
+                for i, metrics in enumerate(_evaluate_all(evaluation_protocol, read_predictions(), dataset, batched=batched)):
+                    gt_images[i] = None
+                    image_metrics.append(metrics)
+                    progress.update(1)
+                    if "psnr" in metrics:
+                        progress.set_postfix(psnr=f"{np.mean(metrics['psnr']):.4f}")
+
+    # The metrics are accumulated in the order of the sorted relative paths
+    image_metrics = [image_metrics[i] for i in sorted(range(len(relpaths)), key=lambda i: relpaths[i])]
+    metrics_lists = {}
+    for metrics in image_metrics:
+        for k, v in metrics.items():
+            if k not in metrics_lists:
+                metrics_lists[k] = []
+            metrics_lists[k].append(v)
+    with suppress_type_checks():
+        metrics = evaluation_protocol.accumulate_metrics(image_metrics)
+
+    shas = hasher.hexdigest()
+    if shas is None:
+        # Too many images were stored out of the sorted order, the predictions are hashed again
+        shas = get_predictions_sha(predictions)
+    predictions_sha, ground_truth_sha = shas
+
+    # If output is specified, write the results to a file
+    if os.path.exists(str(output)):
+        raise FileExistsError(f"{output} already exists")
+
+    out = save_evaluation_results(str(output),
+                                  metrics=metrics, 
+                                  metrics_lists=metrics_lists, 
+                                  predictions_sha=predictions_sha,
+                                  ground_truth_sha=ground_truth_sha,
+                                  evaluation_protocol=evaluation_protocol.get_name(),
+                                  nb_info=nb_info)
+    return out
+
+
+def _decode_image(name: str, data: bytes) -> np.ndarray:
+    with io.BytesIO(data) as f:
+        f.name = name
+        return read_image(f)
+
+
+def _render_and_evaluate_all(method: Union[Method, Sequence[Method]],
+                             dataset: Dataset,
+                             output: str,
+                             output_metrics: str,
+                             *,
+                             description: Optional[str] = "rendering all images",
+                             nb_info: Optional[dict] = None,
+                             evaluation_protocol: EvaluationProtocol,
+                             on_prediction: Optional[Callable[[int, RenderOutput], None]] = None,
+                             batched: bool = False) -> Tuple[Dict, float]:
+    """
+    Renders all images (see `render_all_images`) and evaluates them in a single pass.
+    The results are identical to running `evaluate` on the saved predictions, but the saved
+    images are not read back. The images are evaluated in the rendering order and the per-image
+    metrics are sorted in the order of the saved files at the end. The hashes are computed from
+    the encoded files (see `_PredictionsHasher`).
+
+    Returns:
+        A tuple of the results (see `evaluate`) and the time spent rendering and saving the predictions.
+    """
+    if os.path.exists(output_metrics):
+        raise FileExistsError(f"{output_metrics} already exists")
+
+    background_color = dataset["metadata"].get("background_color", None)
+    color_space = dataset["metadata"].get("color_space", "srgb")
+    image_sizes = _assert_not_none(dataset["cameras"].image_sizes)
+    num_images = len(dataset["image_paths"])
+    names = [_get_prediction_name(dataset, i).with_suffix(".png") for i in range(num_images)]
+    # Same order as the files listed by `evaluate`
+    relpaths = [str(Path("color", name).relative_to("color")) for name in names]
+    order = sorted(range(num_images), key=lambda i: relpaths[i])
+
+    # The files are collected from the writer thread of `_save_predictions_iterate`
+    # (the files of a prediction are written before the prediction is yielded)
+    files: Dict[str, bytes] = {}
+    files_lock = threading.Lock()
+    hashed_files = {"info.json"}.union(*({f"color/{name}", f"gt-color/{name}"} for name in names))
+
+    def on_write(path, data):
+        if path in hashed_files:
+            with files_lock:
+                files[path] = data
+
+    hasher = _PredictionsHasher(relpaths)
+    gt_images: List[Optional[np.ndarray]] = [None] * num_images
+    render_info: Dict[str, Any] = {}
+    render_time = 0.0
+    with suppress_type_checks():
+        eval_dataset = new_dataset(
+            cameras=typing.cast(Cameras, None),
+            image_paths=relpaths,
+            image_paths_root="color",
+            metadata={},
+            images=typing.cast(List[np.ndarray], gt_images))
+
+    def read_predictions() -> Iterable[RenderOutput]:
+        nonlocal render_time
+        predictions = iter(_render_all_images(method, dataset, output,
+                                              description=description,
+                                              nb_info=nb_info,
+                                              evaluation_protocol=evaluation_protocol,
+                                              on_write=on_write))
+        for i in range(num_images):
+            start = time.perf_counter()
+            pred = next(predictions)
+            render_time += time.perf_counter() - start
+            if on_prediction is not None:
+                on_prediction(i, pred)
+            if not render_info:
+                with files_lock:
+                    info_data = files.pop("info.json")
+                render_info.update(deserialize_nb_info(json.loads(info_data.decode("utf8"))))
+                eval_dataset["metadata"].update(render_info.get("render_dataset_metadata", render_info.get("dataset_metadata", {})))
+            with files_lock:
+                color_data, gt_data = files.pop(f"color/{names[i]}"), files.pop(f"gt-color/{names[i]}")
+            hasher.update(relpaths[i], color_data, gt_data)
+            del color_data, gt_data
+            # The images are compared in the same form as they are stored in the PNG files
+            w, h = image_sizes[i]
+            gt_images[i] = np.ascontiguousarray(image_to_srgb(
+                dataset["images"][i][:h, :w], np.uint8, color_space=color_space, allow_alpha=True, background_color=background_color))
+            color = np.ascontiguousarray(image_to_srgb(
+                pred["color"], np.uint8, color_space=color_space, allow_alpha=True, background_color=background_color))
+            del pred
+            yield {"color": color}
+        start = time.perf_counter()
+        for _ in predictions:
+            pass
+        render_time += time.perf_counter() - start
+
+    image_metrics: List[Dict[str, Union[float, int]]] = []
+    with suppress_type_checks():
+        for i, metrics in enumerate(_evaluate_all(evaluation_protocol, read_predictions(), eval_dataset, batched=batched)):
+            gt_images[i] = None
+            image_metrics.append(metrics)
+    assert len(image_metrics) == num_images, "Not all predictions were evaluated"
+
+    # The metrics are accumulated in the order of the saved files (same as `evaluate`)
+    image_metrics = [image_metrics[i] for i in order]
+    metrics_lists = {}
+    for metrics in image_metrics:
+        for k, v in metrics.items():
+            if k not in metrics_lists:
+                metrics_lists[k] = []
+            metrics_lists[k].append(v)
+    with suppress_type_checks():
+        metrics = evaluation_protocol.accumulate_metrics(image_metrics)
+
+    shas = hasher.hexdigest()
+    if shas is None:
+        # Too many images were rendered out of the sorted order, the saved predictions are hashed
+        shas = get_predictions_sha(output)
+    predictions_sha_hex, gt_sha_hex = shas
+
+    out = save_evaluation_results(output_metrics,
+                                  metrics=metrics, 
+                                  metrics_lists=metrics_lists, 
+                                  predictions_sha=predictions_sha_hex,
+                                  ground_truth_sha=gt_sha_hex,
+                                  evaluation_protocol=evaluation_protocol.get_name(),
+                                  nb_info=render_info)
+    return out, render_time
 
 
 class DefaultEvaluationProtocol(EvaluationProtocol):
@@ -248,6 +452,25 @@ class DefaultEvaluationProtocol(EvaluationProtocol):
         gt_f = convert_image_dtype(gt, np.float32)
         return compute_metrics(pred_f[None], gt_f[None], run_lpips_vgg=self._lpips_vgg, reduce=True)
 
+    def evaluate_batch(self, predictions: Sequence[RenderOutput], dataset: Dataset) -> List[Dict[str, Union[float, int]]]:
+        """
+        Evaluates multiple predictions of the same size at once.
+        The results are the same as calling `evaluate` for each prediction separately.
+        """
+        assert len(dataset["images"]) == len(predictions), "There must be exactly one image in the dataset for each prediction"
+        background_color = dataset["metadata"].get("background_color")
+        color_space = dataset["metadata"]["color_space"]
+        pred = np.stack([
+            image_to_srgb(x["color"], np.uint8, color_space=color_space, background_color=background_color)
+            for x in predictions])
+        gt = np.stack([
+            image_to_srgb(x, np.uint8, color_space=color_space, background_color=background_color)
+            for x in dataset["images"]])
+        pred_f = convert_image_dtype(pred, np.float32)
+        gt_f = convert_image_dtype(gt, np.float32)
+        metrics = compute_metrics(pred_f, gt_f, run_lpips_vgg=self._lpips_vgg, reduce=False)
+        return [{k: v[i].item() for k, v in metrics.items()} for i in range(len(predictions))]
+
     def accumulate_metrics(self, metrics: Iterable[Dict[str, Union[float, int]]]) -> Dict[str, Union[float, int]]:
         acc = {}
         for i, data in enumerate(metrics):
@@ -286,14 +509,42 @@ def with_supported_camera_models(supported_camera_models):
     return decorator
 
 
+# Number of render requests kept in flight when rendering with remote methods
+_RENDER_REQUESTS_IN_FLIGHT = 2
+
+
 def render_all_images(
-    method: Method,
+    method: Union[Method, Sequence[Method]],
+    dataset: Dataset,
+    output: str,
+    description: Optional[str] = "rendering all images",
+    nb_info: Optional[dict] = None,
+    evaluation_protocol: Optional[EvaluationProtocol] = None,
+) -> Iterable[RenderOutput]:
+    """
+    Renders all images in the dataset (using the evaluation protocol) and saves them to the output.
+    The method can also be a list of method instances (e.g., running in multiple backend workers
+    and loaded from the same checkpoint). In that case, the images are rendered in parallel
+    and yielded in the order of the dataset cameras.
+    """
+    return _render_all_images(method, dataset, output, 
+                              description=description, 
+                              nb_info=nb_info, 
+                              evaluation_protocol=evaluation_protocol)
+
+
+def _render_all_images(
+    method: Union[Method, Sequence[Method]],
     dataset: Dataset,
     output: str,
+    *,
     description: Optional[str] = "rendering all images",
     nb_info: Optional[dict] = None,
     evaluation_protocol: Optional[EvaluationProtocol] = None,
+    on_write: Optional[Callable[[str, bytes], None]] = None,
 ) -> Iterable[RenderOutput]:
+    methods = list(method) if isinstance(method, (list, tuple)) else [cast(Method, method)]
+    assert len(methods) > 0, "At least one method must be provided"
     if evaluation_protocol is None:
         evaluation_protocol = build_evaluation_protocol(dataset["metadata"]["evaluation_protocol"])
     logging.info(f"Rendering images with evaluation protocol {evaluation_protocol.get_name()}")
@@ -313,12 +564,45 @@ def render_all_images(
                 info_background_color = np.array(info_background_color, np.uint8)
             assert info_background_color is None or (background_color is not None and np.array_equal(info_background_color, background_color)), \
                 f"Dataset background color {background_color} != method background color {info_background_color}"
-    nb_info["checkpoint_sha256"] = get_method_sha(method)
+    nb_info["checkpoint_sha256"] = get_method_sha(methods[0])
     nb_info["evaluation_protocol"] = evaluation_protocol.get_name()
 
     def _render_all():
-        for i in range(len(dataset["cameras"])):
-            yield evaluation_protocol.render(method, dataset_index_select(dataset, [i]))
+        if len(methods) == 1 and not is_remote_instance(methods[0]):
+            for i in range(len(dataset["cameras"])):
+                yield evaluation_protocol.render(methods[0], dataset_index_select(dataset, [i]))
+            return
+
+        # For remote methods, multiple render requests are kept in flight such that 
+        # the worker renders the next images while the current one is being saved.
+        # Each image is rendered by the first free method and the outputs are reassembled in order.
+        free_methods: Queue = Queue()
+        for _method in methods:
+            for _ in range(_RENDER_REQUESTS_IN_FLIGHT if is_remote_instance(_method) else 1):
+                free_methods.put(_method)
+        num_in_flight = free_methods.qsize()
+
+        def _render(i, cancellation_token, backend_options):
+            # The executor threads use the cancellation token and the backend options 
+            # (e.g., zero_copy) of the calling thread
+            old_cancellation_token = CancellationToken.current
+            CancellationToken._set_token(cancellation_token)
+            _method = free_methods.get()
+            try:
+                with _use_backend_options(backend_options):
+                    return evaluation_protocol.render(_method, dataset_index_select(dataset, [i]))
+            finally:
+                free_methods.put(_method)
+                CancellationToken._set_token(old_cancellation_token)
+
+        with ThreadPoolExecutor(max_workers=num_in_flight) as executor:
+            futures = deque()
+            for i in range(len(dataset["cameras"])):
+                futures.append(executor.submit(_render, i, CancellationToken.current, current_backend_options()))
+                if len(futures) >= num_in_flight:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
 
     with tqdm(desc=description or "", 
               disable=description is None, 
@@ -327,7 +611,8 @@ def render_all_images(
         for val in _save_predictions_iterate(output,
                                              _render_all(),
                                              dataset=dataset,
-                                             nb_info=nb_info):
+                                             nb_info=nb_info,
+                                             on_write=on_write):
             progress.update(1)
             yield val
 
@@ -5,6 +5,8 @@ import base64
 import hashlib
 import json
 from contextlib import ExitStack
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import numpy as np
 import time
@@ -12,7 +14,7 @@ import tarfile
 import os
 from typing import (
     Union, Iterator, Any, Dict, List, Iterable, Optional, TypeVar, overload,
-    ContextManager, IO, cast
+    ContextManager, IO, Callable, Tuple, cast
 )
 import zipfile
 import contextlib
@@ -425,23 +427,168 @@ def load_trajectory(file) -> Trajectory:
     return data
 
 
-def get_predictions_sha(predictions: str, description: str = "hashing predictions"):
-    b = bytearray(128 * 1024)
-    mv = memoryview(b)
+# Memory budget (in bytes) for the encoded images read ahead of their turn (see `_open_predictions`)
+_PREDICTIONS_BUFFER_MEMORY = 1 << 28
+
+
+def _get_archive_member_name(name: str) -> str:
+    while name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+def _iterate_predictions_pairs(relpaths: List[str], read: Callable[[str], bytes]) -> Iterator[Tuple[str, bytes, bytes]]:
+    for relpath in relpaths:
+        yield relpath, read(f"color/{relpath}"), read(f"gt-color/{relpath}")
 
-    def sha256_update(sha, filename):
-        with open(filename, "rb", buffering=0) as f:
-            for n in iter(lambda: f.readinto(mv), 0):
-                sha.update(mv[:n])
 
+@contextlib.contextmanager
+def _open_predictions(path: Union[str, Path], *, ordered: bool = True) -> Iterator[Tuple[Optional[bytes], List[str], Iterator[Tuple[str, bytes, bytes]]]]:
+    """
+    Opens the predictions (a directory or a tar.gz/zip archive) for a single read pass.
+    The archives are read directly (the members are not extracted to disk).
+
+    Args:
+        path: Path to the predictions.
+        ordered: If True, the images are iterated in the order of the sorted relative paths.
+            Otherwise, they are iterated in the order in which they are stored (which avoids
+            buffering or re-reading the members of tar.gz archives).
+
+    Yields:
+        A tuple of the content of info.json (or None if missing), the relative paths
+        of the predicted images (in the order of the iterator), and an iterator of 
+        (relative path, encoded prediction, encoded ground truth).
+        The iterator is only valid inside the context.
+    """
+    path = str(path)
+    if not (path.endswith(".zip") or path.endswith(".tar.gz")):
+        with open_any_directory(path, "r") as root:
+            relpaths = [x.relative_to(Path(root) / "color").as_posix() for x in (Path(root) / "color").glob("**/*") if x.is_file()]
+            relpaths.sort()
+            info_data = None
+            if os.path.exists(os.path.join(root, "info.json")):
+                info_data = Path(root, "info.json").read_bytes()
+            yield info_data, relpaths, _iterate_predictions_pairs(relpaths, lambda name: Path(root, name).read_bytes())
+        return
+
+    with open_any(path, "r") as f:
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(f, mode="r") as zip:
+                zip_members = {
+                    _get_archive_member_name(x.filename): x for x in zip.infolist() if not x.is_dir()}
+                relpaths = sorted(x[len("color/"):] for x in zip_members if x.startswith("color/"))
+
+                def read_zip_member(name):
+                    if name not in zip_members:
+                        raise FileNotFoundError(f"{name} not found in {path}")
+                    return zip.read(zip_members[name])
+
+                info_data = read_zip_member("info.json") if "info.json" in zip_members else None
+                yield info_data, relpaths, _iterate_predictions_pairs(relpaths, read_zip_member)
+            return
+
+        with tarfile.open(fileobj=f, mode="r:gz") as tar:
+            # Gzip streams are only seekable by decompressing them again. We scan the headers first
+            # and then read the members in the order they are stored in the archive.
+            tar_members = {
+                _get_archive_member_name(x.name): x for x in tar.getmembers() if x.isfile()}
+            relpaths = sorted(x[len("color/"):] for x in tar_members if x.startswith("color/"))
+            for relpath in relpaths:
+                if f"gt-color/{relpath}" not in tar_members:
+                    raise FileNotFoundError(f"gt-color/{relpath} not found in {path}")
+            info_data = None
+            if "info.json" in tar_members:
+                info_data = _assert_not_none(tar.extractfile(tar_members["info.json"])).read()
+
+            def pair_offsets(relpath):
+                return (tar_members[f"color/{relpath}"].offset_data, tar_members[f"gt-color/{relpath}"].offset_data)
+
+            def iterate_tar(relpaths):
+                # Yields the pairs in the order of `relpaths`. Members are read in the order
+                # in which they are stored and the members read ahead of their turn are kept.
+                members = sorted(
+                    (name for x in relpaths for name in (f"color/{x}", f"gt-color/{x}")), 
+                    key=lambda x: tar_members[x].offset_data)
+                buffer: Dict[str, bytes] = {}
+                rank = 0
+                for name in members:
+                    buffer[name] = _assert_not_none(tar.extractfile(tar_members[name])).read()
+                    while rank < len(relpaths) and f"color/{relpaths[rank]}" in buffer and f"gt-color/{relpaths[rank]}" in buffer:
+                        relpath = relpaths[rank]
+                        yield relpath, buffer.pop(f"color/{relpath}"), buffer.pop(f"gt-color/{relpath}")
+                        rank += 1
+
+            if not ordered:
+                # The pairs are yielded as soon as both members are read
+                relpaths.sort(key=lambda x: max(pair_offsets(x)))
+                yield info_data, relpaths, iterate_tar(relpaths)
+                return
+
+            def iterate_tar_ordered():
+                # The sorted pairs are split into windows of at most `_PREDICTIONS_BUFFER_MEMORY` bytes
+                # and the archive is read once for each window (the memory is bounded, but large
+                # archives stored out of the sorted order are read multiple times).
+                start = 0
+                while start < len(relpaths):
+                    end, size = start, 0
+                    while end < len(relpaths):
+                        pair_size = tar_members[f"color/{relpaths[end]}"].size + tar_members[f"gt-color/{relpaths[end]}"].size
+                        if end > start and size + pair_size > _PREDICTIONS_BUFFER_MEMORY:
+                            break
+                        size += pair_size
+                        end += 1
+                    yield from iterate_tar(relpaths[start:end])
+                    start = end
+
+            yield info_data, relpaths, iterate_tar_ordered()
+
+
+class _PredictionsHasher:
+    """
+    Computes the hashes of the encoded predictions and ground-truth images in the order of 
+    the sorted relative paths (see `get_predictions_sha`) from images arriving in any order.
+    The images arriving ahead of their turn are buffered. If the buffer exceeds 
+    `_PREDICTIONS_BUFFER_MEMORY` bytes, the hashing is abandoned and `hexdigest` returns None
+    (the hashes have to be computed by reading the predictions again).
+    """
+    def __init__(self, relpaths: List[str]):
+        self._relpaths = sorted(relpaths)
+        self._predictions_sha = hashlib.sha256()
+        self._gt_sha = hashlib.sha256()
+        self._buffer: Dict[str, Tuple[bytes, bytes]] = {}
+        self._buffer_memory = 0
+        self._rank = 0
+        self._overflow = False
+
+    def update(self, relpath: str, color_data: bytes, gt_data: bytes):
+        if self._overflow:
+            return
+        self._buffer[relpath] = (color_data, gt_data)
+        self._buffer_memory += len(color_data) + len(gt_data)
+        while self._rank < len(self._relpaths) and self._relpaths[self._rank] in self._buffer:
+            color_data, gt_data = self._buffer.pop(self._relpaths[self._rank])
+            self._buffer_memory -= len(color_data) + len(gt_data)
+            self._predictions_sha.update(color_data)
+            self._gt_sha.update(gt_data)
+            self._rank += 1
+        if self._buffer_memory > _PREDICTIONS_BUFFER_MEMORY:
+            self._overflow = True
+            self._buffer.clear()
+
+    def hexdigest(self) -> Optional[Tuple[str, str]]:
+        if self._overflow:
+            return None
+        assert self._rank == len(self._relpaths), "Not all predictions were hashed"
+        return self._predictions_sha.hexdigest(), self._gt_sha.hexdigest()
+
+
+def get_predictions_sha(predictions: str, description: str = "hashing predictions"):
     predictions_sha = hashlib.sha256()
     gt_sha = hashlib.sha256()
-    with open_any_directory(predictions, "r") as predictions:
-        relpaths = [x.relative_to(Path(predictions) / "color") for x in (Path(predictions) / "color").glob("**/*") if x.is_file()]
-        relpaths.sort()
-        for relname in tqdm(relpaths, desc=description, dynamic_ncols=True):
-            sha256_update(predictions_sha, Path(predictions) / "color" / relname)
-            sha256_update(gt_sha, Path(predictions) / "gt-color" / relname)
+    with _open_predictions(predictions) as (_, relpaths, files):
+        for _, color_data, gt_data in tqdm(files, total=len(relpaths), desc=description, dynamic_ncols=True):
+            predictions_sha.update(color_data)
+            gt_sha.update(gt_data)
         return (
             predictions_sha.hexdigest(),
             gt_sha.hexdigest(),
@@ -563,7 +710,23 @@ def save_evaluation_results(file,
         return out
 
 
-def _save_predictions_iterate(output: str, predictions: Iterable[RenderOutput], dataset: Dataset, *, nb_info=None):
+# Number of threads encoding the predictions when saving them
+_SAVE_PREDICTIONS_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _get_prediction_name(dataset: Dataset, i: int) -> Path:
+    relative_name = Path(dataset["image_paths"][i])
+    if dataset["image_paths_root"] is not None:
+        relative_name = Path(os.path.basename(relative_name))
+        # relative_name = relative_name.relative_to(Path(dataset["image_paths_root"]))
+    return relative_name
+
+
+def _save_predictions_iterate(output: str, predictions: Iterable[RenderOutput], dataset: Dataset, *, nb_info=None, on_write=None):
+    """
+    Saves the predictions and yields them after they are written. If ``on_write`` is set,
+    it is called with the path and the content of each written file (from the writer thread).
+    """
     background_color =  dataset["metadata"].get("background_color", None)
     assert background_color is None or background_color.dtype == np.uint8, "background_color must be None or uint8"
     color_space = dataset["metadata"].get("color_space", "srgb")
@@ -602,55 +765,85 @@ def _save_predictions_iterate(output: str, predictions: Iterable[RenderOutput],
             _background_color = background_color
             if isinstance(_background_color, np.ndarray):
                 _background_color = _background_color.tolist()
-            fp.write(
-                json.dumps(
-                    serialize_nb_info(
-                        {
-                            **(nb_info or {}),
-                            "render_version": __version__,
-                            "render_datetime": datetime.utcnow().isoformat(timespec="seconds"),
-                            "render_dataset_metadata": dataset["metadata"],
-                        }),
-                    indent=2,
-                ).encode("utf-8")
-            )
-
-
-        for i, (pred, (w, h)) in enumerate(zip(predictions, _assert_not_none(dataset["cameras"].image_sizes))):
+            info_data = json.dumps(
+                serialize_nb_info(
+                    {
+                        **(nb_info or {}),
+                        "render_version": __version__,
+                        "render_datetime": datetime.utcnow().isoformat(timespec="seconds"),
+                        "render_dataset_metadata": dataset["metadata"],
+                    }),
+                indent=2,
+            ).encode("utf-8")
+            fp.write(info_data)
+        if on_write is not None:
+            on_write("info.json", info_data)
+
+
+        def _encode(i, pred, w, h):
+            # Encodes all files of a single prediction (runs in the encoder threads)
+            files = []
+
+            @contextlib.contextmanager
+            def _open(path):
+                with io.BytesIO() as f:
+                    f.name = path
+                    yield f
+                    files.append((path, f.getvalue()))
+
             gt_image = image_to_srgb(dataset["images"][i][:h, :w], np.uint8, color_space=color_space, allow_alpha=allow_transparency, background_color=background_color)
             pred_image = image_to_srgb(pred["color"], np.uint8, color_space=color_space, allow_alpha=allow_transparency, background_color=background_color)
             assert gt_image.shape[:-1] == pred_image.shape[:-1], f"gt size {gt_image.shape[:-1]} != pred size {pred_image.shape[:-1]}"
-            relative_name = Path(dataset["image_paths"][i])
-            if dataset["image_paths_root"] is not None:
-                relative_name = Path(os.path.basename(relative_name))
-                # relative_name = relative_name.relative_to(Path(dataset["image_paths_root"]))
-            with open_fn(f"gt-color/{relative_name.with_suffix('.png')}") as f:
+            relative_name = _get_prediction_name(dataset, i)
+            with _open(f"gt-color/{relative_name.with_suffix('.png')}") as f:
                 save_image(f, gt_image)
-            with open_fn(f"color/{relative_name.with_suffix('.png')}") as f:
+            with _open(f"color/{relative_name.with_suffix('.png')}") as f:
                 save_image(f, pred_image)
 
-            with open_fn(f"cameras/{relative_name.with_suffix('.npz')}") as f:
+            with _open(f"cameras/{relative_name.with_suffix('.npz')}") as f:
                 save_cameras_npz(f, dataset["cameras"][i])
             # with open_fn(f"gt-color/{relative_name.with_suffix('.npy')}") as f:
             #     np.save(f, dataset["images"][i][:h, :w])
             # with open_fn(f"color/{relative_name.with_suffix('.npy')}") as f:
             #     np.save(f, pred["color"])
             if "depth" in pred:
-                with open_fn(f"depth/{relative_name.with_suffix('.bin')}") as f:
+                with _open(f"depth/{relative_name.with_suffix('.bin')}") as f:
                     save_depth(f, pred["depth"])
                 depth_rgb = visualize_depth(pred["depth"], near_far=dataset["cameras"].nears_fars[i] if dataset["cameras"].nears_fars is not None else None, expected_scale=expected_scene_scale)
-                with open_fn(f"depth-rgb/{relative_name.with_suffix('.png')}") as f:
+                with _open(f"depth-rgb/{relative_name.with_suffix('.png')}") as f:
                     save_image(f, depth_rgb)
             if "accumulation" in pred:
-                with open_fn(f"accumulation/{relative_name.with_suffix('.png')}") as f:
+                with _open(f"accumulation/{relative_name.with_suffix('.png')}") as f:
                     save_image(f, visualize_depth(pred["accumulation"]))
             if color_space == "linear":
                 # Store the raw linear image as well
-                with open_fn(f"gt-color-linear/{relative_name.with_suffix('.bin')}") as f:
+                with _open(f"gt-color-linear/{relative_name.with_suffix('.bin')}") as f:
                     save_image(f, dataset["images"][i][:h, :w])
-                with open_fn(f"color-linear/{relative_name.with_suffix('.bin')}") as f:
+                with _open(f"color-linear/{relative_name.with_suffix('.bin')}") as f:
                     save_image(f, pred["color"])
-            yield pred
+            return files
+
+        def _write(pred, encoded):
+            # The files are written in the order of the predictions
+            for path, data in encoded.result():
+                with open_fn(path) as f:
+                    f.write(data)
+                if on_write is not None:
+                    on_write(path, data)
+            return pred
+
+        # The predictions are encoded in a thread pool (PNG and zlib compression release the GIL)
+        # and written by a single writer thread, while the next predictions are being rendered.
+        num_workers = _SAVE_PREDICTIONS_WORKERS
+        with ThreadPoolExecutor(max_workers=num_workers) as encoder, \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            pending = deque()
+            for i, (pred, (w, h)) in enumerate(zip(predictions, _assert_not_none(dataset["cameras"].image_sizes))):
+                pending.append(writer.submit(_write, pred, encoder.submit(_encode, i, pred, w, h)))
+                if len(pending) > 2 * num_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
 
 def save_predictions(output: str, predictions: Iterable[RenderOutput], dataset: Dataset, *, nb_info=None):
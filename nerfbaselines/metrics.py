@@ -1,6 +1,7 @@
+import os
 from functools import wraps
 import numpy
-from typing import Optional, Callable, Union, Sequence, Tuple, cast
+from typing import Optional, Callable, Union, Sequence, Tuple, Dict, cast
 import numpy as np
 import warnings
 
@@ -23,6 +24,50 @@ def _wrap_metric_arbitrary_shape(fn):
     return wrapped
 
 
+def _filter_valid_1d(z: np.ndarray, filt: np.ndarray, axis: int) -> np.ndarray:
+    # Equivalent to np.convolve(row, filt, mode="valid") applied to all rows along the axis.
+    axis = axis % z.ndim
+    size = z.shape[axis] - len(filt) + 1
+    assert size > 0, f"Image dims must be at least the filter size, got {z.shape[axis]} < {len(filt)}"
+    out = None
+    # NOTE: np.convolve flips the filter
+    for i, weight in enumerate(filt[::-1]):
+        index = (slice(None),) * axis + (slice(i, i + size),)
+        if out is None:
+            out = z[index] * weight
+        else:
+            out += z[index] * weight
+    assert out is not None
+    return out
+
+
+def _separable_filter_valid(z: np.ndarray, filt: np.ndarray) -> np.ndarray:
+    """
+    Applies the 1D filter along the x and y axes of images [B, H, W, C] (only the valid region is returned).
+    The result matches np.convolve(row, filt, mode="valid") applied to all rows and columns.
+    The computation is done in float64 (same as np.convolve with a float64 filter).
+    """
+    size = len(filt)
+    out_shape = (z.shape[0], z.shape[1] - size + 1, z.shape[2] - size + 1, z.shape[3])
+    assert out_shape[1] > 0 and out_shape[2] > 0, f"Image dims must be at least the filter size, got {z.shape[1:3]} < {size}"
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+    if cv2 is None or z.shape[-1] > 512:
+        z = z.astype(np.float64, copy=False)
+        return _filter_valid_1d(_filter_valid_1d(z, filt, axis=-2), filt, axis=-3)
+
+    # OpenCV computes correlation with the anchor in the center of the filter
+    kernel = np.ascontiguousarray(filt[::-1], dtype=np.float64)
+    start = size // 2
+    out = np.empty(out_shape, dtype=np.float64)
+    for i, image in enumerate(z):
+        filtered = cv2.sepFilter2D(np.ascontiguousarray(image), cv2.CV_64F, kernel, kernel, borderType=cv2.BORDER_CONSTANT)
+        out[i] = np.reshape(filtered, z.shape[1:])[start:start + out_shape[1], start:start + out_shape[2]]
+    return out
+
+
 @_wrap_metric_arbitrary_shape
 def dmpix_ssim(
     a: np.ndarray,
@@ -80,59 +125,59 @@ def dmpix_ssim(
         filt = np.exp(-0.5 * f_i)
         filt /= np.sum(filt)
 
-        # Construct a 1D convolution.
-        def filter_fn_1(z):
-            return np.convolve(z, filt, mode="valid")
-
-        # jax.vmap(filter_fn_1)
-        filter_fn_vmap = lambda x: np.stack([filter_fn_1(y) for y in x], 0)  # noqa: E731
-
-        # Apply the vectorized filter along the y axis.
-        def filter_fn_y(z):
-            z_flat = np.moveaxis(z, -3, -1).reshape((-1, z.shape[-3]))
-            z_filtered_shape = ((z.shape[-4],) if z.ndim == 4 else ()) + (
-                z.shape[-2],
-                z.shape[-1],
-                -1,
-            )
-            z_filtered = np.moveaxis(filter_fn_vmap(z_flat).reshape(z_filtered_shape), -1, -3)
-            return z_filtered
-
-        # Apply the vectorized filter along the x axis.
-        def filter_fn_x(z):
-            z_flat = np.moveaxis(z, -2, -1).reshape((-1, z.shape[-2]))
-            z_filtered_shape = ((z.shape[-4],) if z.ndim == 4 else ()) + (
-                z.shape[-3],
-                z.shape[-1],
-                -1,
-            )
-            z_filtered = np.moveaxis(filter_fn_vmap(z_flat).reshape(z_filtered_shape), -1, -2)
-            return z_filtered
-
         # Apply the blur in both x and y.
-        filter_fn = lambda z: filter_fn_y(filter_fn_x(z))  # noqa: E731
+        # NOTE: The filter is applied to the whole arrays at once, which gives
+        # the same results as applying np.convolve(z, filt, mode="valid") to each row.
+        filter_fn = lambda z: _separable_filter_valid(z, filt)  # noqa: E731
+    else:
+        # The filtered maps are modified in-place, the custom filter could return a view of its input
+        custom_filter_fn = filter_fn
+        filter_fn = lambda z: np.array(custom_filter_fn(z))  # noqa: E731
 
     mu0 = filter_fn(a)
     mu1 = filter_fn(b)
-    mu00 = mu0 * mu0
-    mu11 = mu1 * mu1
+    sigma00 = filter_fn(a**2)
+    sigma11 = filter_fn(b**2)
+    sigma01 = filter_fn(a * b)
+
+    # NOTE: The filtered maps are large (float64) arrays, therefore,
+    # the rest of the computation is done in-place to avoid temporary copies.
     mu01 = mu0 * mu1
-    sigma00 = filter_fn(a**2) - mu00
-    sigma11 = filter_fn(b**2) - mu11
-    sigma01 = filter_fn(a * b) - mu01
+    mu00 = np.square(mu0, out=mu0)
+    mu11 = np.square(mu1, out=mu1)
+    sigma00 -= mu00
+    sigma11 -= mu11
+    sigma01 -= mu01
 
     # Clip the variances and covariances to valid values.
     # Variance must be non-negative:
     epsilon = np.finfo(np.float32).eps ** 2
-    sigma00 = np.maximum(epsilon, sigma00)
-    sigma11 = np.maximum(epsilon, sigma11)
-    sigma01 = np.sign(sigma01) * np.minimum(np.sqrt(sigma00 * sigma11), np.abs(sigma01))
+    np.maximum(epsilon, sigma00, out=sigma00)
+    np.maximum(epsilon, sigma11, out=sigma11)
+    sigma_max = np.multiply(sigma00, sigma11)
+    np.sqrt(sigma_max, out=sigma_max)
+    np.minimum(sigma_max, np.abs(sigma01), out=sigma_max)
+    np.sign(sigma01, out=sigma01)
+    sigma01 *= sigma_max
+    del sigma_max
 
     c1 = (k1 * max_val) ** 2
     c2 = (k2 * max_val) ** 2
-    numer = (2 * mu01 + c1) * (2 * sigma01 + c2)
-    denom = (mu00 + mu11 + c1) * (sigma00 + sigma11 + c2)
-    ssim_map = numer / denom
+    # numer = (2 * mu01 + c1) * (2 * sigma01 + c2)
+    numer = mu01
+    numer *= 2
+    numer += c1
+    sigma01 *= 2
+    sigma01 += c2
+    numer *= sigma01
+    # denom = (mu00 + mu11 + c1) * (sigma00 + sigma11 + c2)
+    denom = mu00
+    denom += mu11
+    denom += c1
+    sigma00 += sigma11
+    sigma00 += c2
+    denom *= sigma00
+    ssim_map = np.divide(numer, denom, out=numer)
     ssim_value = np.mean(ssim_map, tuple(range(-3, 0)))
     return ssim_map if return_map else ssim_value
 
@@ -302,6 +347,10 @@ def _mean(metric):
 
 
 def _normalize_input(a):
+    # Already normalized inputs (e.g., passed from compute_image_metrics) are not copied again.
+    # NOTE: The metrics must not modify the normalized inputs in-place.
+    if a.dtype == np.float32 and a.size > 0 and a.min() >= 0 and a.max() <= 1:
+        return a
     return np.clip(a, 0, 1).astype(np.float32)
 
 
@@ -369,13 +418,19 @@ def psnr(a: Union[np.ndarray, np.float32, np.float64], b: Optional[np.ndarray] =
 
 _LPIPS_CACHE = {}
 _LPIPS_GPU_AVAILABLE = None
+# Memory budget (in bytes) for a single LPIPS forward pass. Larger batches are split into mini-batches.
+_LPIPS_BATCH_MEMORY = int(os.environ.get("NERFBASELINES_LPIPS_BATCH_MEMORY", str(2 << 30)))
+# Approximate peak memory used by the network activations per input pixel (for an image pair).
+_LPIPS_MEMORY_PER_PIXEL = {"alex": 512, "vgg": 4096}
 
 
-def _lpips(a, b, net, version="0.1"):
-    global _LPIPS_GPU_AVAILABLE
-    assert a.shape == b.shape, f"Images must have the same shape, got {a.shape} and {b.shape}"
-    assert a.dtype.kind == "f" and b.dtype.kind == "f", f"Expected floating point inputs, got {a.dtype} and {b.dtype}"
+def _get_lpips_batch_size(net: str, height: int, width: int) -> int:
+    memory_per_image = _LPIPS_MEMORY_PER_PIXEL.get(net, _LPIPS_MEMORY_PER_PIXEL["vgg"]) * height * width
+    return max(1, _LPIPS_BATCH_MEMORY // memory_per_image)
 
+
+def _get_lpips_net(net, version="0.1"):
+    global _LPIPS_GPU_AVAILABLE
     import torch
 
     lp_net = _LPIPS_CACHE.get(net)
@@ -397,17 +452,42 @@ def _lpips(a, b, net, version="0.1"):
 
     if _LPIPS_GPU_AVAILABLE:
         device = torch.device("cuda")
+    return lp_net.to(device), device
 
-    batch_shape = a.shape[:-3]
-    img_shape = a.shape[-3:]
-    a = _normalize_input(a)
-    b = _normalize_input(b)
+
+def _lpips_prepare_input(a, device):
+    # Converts normalized images [B..., H, W, C] to the LPIPS input format [B, C, H, W] in [-1, 1].
+    import torch
+
+    x = torch.from_numpy(np.ascontiguousarray(a)).view(-1, *a.shape[-3:]).permute(0, 3, 1, 2)
+    return x.to(device).mul(2).sub_(1)
+
+
+def _lpips_forward(a, b, lp_net, batch_shape, batch_size=None):
+    import torch
+
+    outs = []
+    batch_size = batch_size or len(a)
     with torch.no_grad():
-        a = torch.from_numpy(a).float().view(-1, *img_shape).permute(0, 3, 1, 2).mul_(2).sub_(1).to(device)
-        b = torch.from_numpy(b).float().view(-1, *img_shape).permute(0, 3, 1, 2).mul_(2).sub_(1).to(device)
-        out = cast(torch.Tensor, lp_net.to(device).forward(a, b))
-        out = out.detach().cpu().numpy().reshape(batch_shape)
-        return out
+        # The images are processed in mini-batches to bound the memory used by the activations
+        for i in range(0, len(a), batch_size):
+            out = cast(torch.Tensor, lp_net.forward(a[i:i + batch_size], b[i:i + batch_size]))
+            outs.append(out.detach().cpu().numpy().reshape(-1))
+    if not outs:
+        return np.zeros(batch_shape, dtype=np.float32)
+    return np.concatenate(outs, 0).reshape(batch_shape)
+
+
+def _lpips(a, b, net, version="0.1"):
+    assert a.shape == b.shape, f"Images must have the same shape, got {a.shape} and {b.shape}"
+    assert a.dtype.kind == "f" and b.dtype.kind == "f", f"Expected floating point inputs, got {a.dtype} and {b.dtype}"
+
+    batch_shape = a.shape[:-3]
+    batch_size = _get_lpips_batch_size(net, *a.shape[-3:-1])
+    lp_net, device = _get_lpips_net(net, version=version)
+    a = _lpips_prepare_input(_normalize_input(a), device)
+    b = _lpips_prepare_input(_normalize_input(b), device)
+    return _lpips_forward(a, b, lp_net, batch_shape, batch_size=batch_size)
 
 
 def lpips_alex(a: np.ndarray, b: np.ndarray) -> Union[np.ndarray, np.float32]:
@@ -435,3 +515,40 @@ def lpips_vgg(a: np.ndarray, b: np.ndarray) -> Union[np.ndarray, np.float32]:
 
 
 lpips = lpips_vgg
+
+
+def compute_image_metrics(a: np.ndarray, b: np.ndarray, *, run_lpips: bool = True) -> Dict[str, Union[np.ndarray, np.float32, np.float64]]:
+    """
+    Compute PSNR, MSE, MAE, SSIM and LPIPS in a single pass.
+    The inputs are clipped and converted to float32 only once and the buffers are shared
+    between the metrics. The results are the same as calling the individual metric functions.
+
+    Args:
+        a: Tensor of prediction images [B..., H, W, C].
+        b: Tensor of target images [B..., H, W, C].
+        run_lpips: If True, LPIPS (see `lpips`) is computed as well.
+    Returns:
+        Dictionary of metric values for each image [B...].
+    """
+    assert a.shape == b.shape, f"Images must have the same shape, got {a.shape} and {b.shape}"
+    assert a.dtype.kind == "f" and b.dtype.kind == "f", f"Expected floating point inputs, got {a.dtype} and {b.dtype}"
+    a = _normalize_input(a)
+    b = _normalize_input(b)
+
+    # NOTE: |a-b|^2 == (a-b)^2, so the difference buffer can be reused for both MAE and MSE
+    diff = np.subtract(a, b)
+    np.abs(diff, out=diff)
+    mae_value = _mean(diff)
+    np.square(diff, out=diff)
+    mse_value = _mean(diff)
+    del diff
+    out = {
+        "psnr": psnr(mse_value),
+        "ssim": dmpix_ssim(a, b),
+        "mae": mae_value,
+        "mse": mse_value,
+    }
+    if run_lpips:
+        # The normalized buffers are passed directly (the torch tensors share the memory)
+        out["lpips"] = lpips(a, b)
+    return out
@@ -38,7 +38,7 @@ from .utils import (
 )
 from .datasets import dataset_index_select
 from .evaluation import (
-    render_all_images, evaluate, build_evaluation_protocol,
+    build_evaluation_protocol, _render_and_evaluate_all,
 )
 from .logging import ConcatLogger, Logger, log_metrics
 try:
@@ -374,7 +374,7 @@ def eval_few(method: Method, logger: Logger, dataset: Dataset, *, split: str, st
                 )
 
 
-def eval_all(method: Method, logger: Optional[Logger], dataset: Dataset, *, output: str, step: int, evaluation_protocol: EvaluationProtocol, split: str, nb_info):
+def eval_all(method: Method, logger: Optional[Logger], dataset: Dataset, *, output: str, step: int, evaluation_protocol: EvaluationProtocol, split: str, nb_info, batched: bool = False):
     metrics: Optional[Dict[str, float]] = {} if logger else None
     expected_scene_scale = dataset["metadata"].get("expected_scene_scale")
 
@@ -401,43 +401,41 @@ def eval_all(method: Method, logger: Optional[Logger], dataset: Dataset, *, outp
         os.unlink(output_metrics)
         logging.warning(f"Removed existing results at {output_metrics}")
 
-    start = time.perf_counter()
     num_vis_images = 16
     vis_images: List[Tuple[np.ndarray, np.ndarray]] = []
     vis_depth: List[np.ndarray] = []
     image_sizes = dataset["cameras"].image_sizes
     total_rays = image_sizes.prod(-1).sum()
     assert image_sizes is not None
-    for (i, gt), pred, (w, h) in zip(
-        enumerate(dataset["images"]),
-        render_all_images(
-            method,
-            dataset,
-            output=output,
-            description=f"Rendering all images at step={step}",
-            nb_info=nb_info,
-            evaluation_protocol=evaluation_protocol,
-        ),
-        image_sizes,
-    ):
+    has_depth = False
+
+    def _add_visualization(i, pred):
+        nonlocal has_depth
+        has_depth = "depth" in pred
         if len(vis_images) < num_vis_images:
+            w, h = image_sizes[i]
             color = pred["color"]
             background_color = dataset["metadata"].get("background_color", None)
             dataset_colorspace = dataset["metadata"].get("color_space", "srgb")
             color_srgb = image_to_srgb(color, np.uint8, color_space=dataset_colorspace, background_color=background_color)
-            gt_srgb = image_to_srgb(gt[:h, :w], np.uint8, color_space=dataset_colorspace, background_color=background_color)
+            gt_srgb = image_to_srgb(dataset["images"][i][:h, :w], np.uint8, color_space=dataset_colorspace, background_color=background_color)
             vis_images.append((gt_srgb, color_srgb))
             if "depth" in pred:
                 near_far = dataset["cameras"].nears_fars[i] if dataset["cameras"].nears_fars is not None else None
                 vis_depth.append(visualize_depth(pred["depth"], expected_scale=expected_scene_scale, near_far=near_far))
-    elapsed = time.perf_counter() - start
 
-    # Compute metrics
-    info = evaluate(
-        output, 
-        output_metrics, 
+    # Render the images and compute the metrics in a single pass 
+    # (the results are the same as running `evaluate` on the saved predictions)
+    info, elapsed = _render_and_evaluate_all(
+        method,
+        dataset,
+        output,
+        output_metrics,
+        description=f"Rendering all images at step={step}",
+        nb_info=nb_info,
         evaluation_protocol=evaluation_protocol,
-        description=f"evaluating all images at step={step}")
+        on_prediction=_add_visualization,
+        batched=batched)
     metrics = info["metrics"]
 
     if logger:
@@ -460,7 +458,7 @@ def eval_all(method: Method, logger: Optional[Logger], dataset: Dataset, *, outp
                          display_name="color", 
                          description="left: gt, right: prediction", 
                          step=step)
-        if "depth" in pred:
+        if has_depth:
             depth_vis = make_image_grid(*vis_depth, ncol=num_cols)
             logger.add_image(f"eval-all-{split}/depth", 
                             depth_vis, 
@@ -558,6 +556,7 @@ class Trainer:
         generate_output_artifact: Optional[bool] = None,
         config_overrides: Optional[Dict[str, Any]] = None,
         applied_presets: Optional[FrozenSet[str]] = None,
+        batched_evaluation: bool = False,
     ):
         self._num_iterations = 0
         self.method = method
@@ -576,6 +575,7 @@ class Trainer:
         self.eval_few_iters = eval_few_iters
         self.eval_all_iters = eval_all_iters
         self.generate_output_artifact = generate_output_artifact
+        self.batched_evaluation = batched_evaluation
         self.config_overrides = config_overrides
         if logger is not None and not callable(logger):
             logger = cast(Callable[[str], Logger], lambda _: logger)
@@ -829,7 +829,8 @@ class Trainer:
         nb_info = self._get_nb_info()
         return eval_all(self.method, logger, self.test_dataset, 
                         step=self.step, evaluation_protocol=self._evaluation_protocol,
-                        split="test", nb_info=nb_info, output=self.output)
+                        split="test", nb_info=nb_info, output=self.output,
+                        batched=self.batched_evaluation)
 
     def eval_few(self):
         logger = self.get_logger()
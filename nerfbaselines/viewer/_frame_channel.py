@@ -0,0 +1,89 @@
+"""
+Shared memory channel for the encoded viewer frames. The frames are written by the process
+rendering them (see `Viewer.update`) and read by the HTTP server process (see `_make_render_fn`).
+Only the location of the frame is sent through the control queue.
+"""
+import threading
+import logging
+from typing import Optional
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+from nerfbaselines.backends._transport_protocol import _attach_shared_memory
+
+
+_FRAME_CHANNEL_SLOTS = 4
+_FRAME_CHANNEL_SLOT_SIZE = 8 * 1024 * 1024
+_HEADER_SIZE = 64
+
+_SLOT_FREE = 0
+_SLOT_FULL = 1
+
+
+class FrameChannel:
+    """
+    A fixed number of frame slots in a shared memory segment. The header of the segment
+    contains the state of each slot (free/full). The writer marks a free slot as full and copies
+    the frame into it. The reader copies the frame out of the slot and marks it as free again.
+    If there is no free slot or the frame is larger than a slot, `write` returns None and
+    the frame has to be sent through the control queue instead.
+    """
+    def __init__(self, shm, num_slots: int, slot_size: int, *, owner: bool):
+        self._shm = shm
+        self._num_slots = num_slots
+        self._slot_size = slot_size
+        self._owner = owner
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, num_slots: int = _FRAME_CHANNEL_SLOTS, slot_size: int = _FRAME_CHANNEL_SLOT_SIZE) -> Optional["FrameChannel"]:
+        assert num_slots <= _HEADER_SIZE, f"At most {_HEADER_SIZE} slots are supported"
+        if shared_memory is None:
+            return None
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + num_slots * slot_size)
+        except OSError as e:
+            logging.warning(f"Failed to allocate shared memory for the viewer frames: {e}")
+            return None
+        shm.buf[:num_slots] = bytes(num_slots)
+        return cls(shm, num_slots, slot_size, owner=True)
+
+    @classmethod
+    def attach(cls, spec) -> "FrameChannel":
+        name, num_slots, slot_size = spec
+        return cls(_attach_shared_memory(name), num_slots, slot_size, owner=False)
+
+    def get_spec(self):
+        """
+        Returns the (picklable) parameters used to attach the channel in another process.
+        """
+        return self._shm.name, self._num_slots, self._slot_size
+
+    def write(self, data: bytes) -> Optional[int]:
+        if len(data) > self._slot_size:
+            return None
+        buffer = self._shm.buf
+        with self._lock:
+            for slot in range(self._num_slots):
+                if buffer[slot] == _SLOT_FREE:
+                    buffer[slot] = _SLOT_FULL
+                    break
+            else:
+                return None
+        # The slot is only accessed by the reader once the control message is received
+        offset = _HEADER_SIZE + slot * self._slot_size
+        buffer[offset:offset + len(data)] = data
+        return slot
+
+    def read(self, slot: int, size: int) -> bytes:
+        buffer = self._shm.buf
+        offset = _HEADER_SIZE + slot * self._slot_size
+        out = bytes(buffer[offset:offset + size])
+        buffer[slot] = _SLOT_FREE
+        return out
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
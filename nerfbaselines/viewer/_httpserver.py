@@ -4,11 +4,11 @@ The first implementation is a simple HTTP server using the built-in Python HTTP
 The second implementation is a Flask server that provides a more feature-rich experience.
 """
 import errno
+import math
 import socket
 import shutil
 from functools import partial
 from typing import cast, Any
-import queue
 import contextlib
 import logging
 import os
@@ -21,11 +21,15 @@ from PIL import Image
 from nerfbaselines.datasets import dataset_index_select, dataset_load_features
 from nerfbaselines.utils import image_to_srgb
 from ._proxy import cloudflared_tunnel
+from ._frame_channel import FrameChannel
 from ._websocket import httpserver_websocket_handler, ConnectionClosed
 from nerfbaselines.backends._common import setup_logging as setup_logging
 
 
 logger = logging.getLogger("nerfbaselines.viewer")
+# The interactive frames are rendered at a scale meeting this frame time (see _ProgressiveRendering)
+_PROGRESSIVE_TARGET_FRAME_TIME = 0.1
+_PROGRESSIVE_MIN_SCALE = 1 / 8
 
 
 class NotFound(Exception):
@@ -37,9 +41,44 @@ class BadRequest(Exception):
 
 
 @contextlib.contextmanager
-def _make_render_fn(request_queue, output_queue):
-    output_queues = {}
+def _make_render_fn(request_queue, output_queue, frame_channel=None):
+    # Outputs received by the thread reading the output queue for the other threads
+    outputs = {}
+    condition = threading.Condition()
+    state = {"reading": False, "ended": False}
     message_counter = threading.local()
+    channel = FrameChannel.attach(frame_channel) if frame_channel is not None else None
+
+    def receive(feedid):
+        # The waiting threads take turns in reading the output queue,
+        # so that the outputs are not passed through an extra multiplexing thread
+        with condition:
+            while True:
+                if feedid in outputs:
+                    return outputs.pop(feedid)
+                if state["ended"]:
+                    return {"type": "end"}
+                if not state["reading"]:
+                    state["reading"] = True
+                    break
+                condition.wait()
+        try:
+            while True:
+                out = output_queue.get()
+                with condition:
+                    if out.get("type") == "end":
+                        state["ended"] = True
+                        return out
+                    out_feedid = out.pop("feedid")
+                    assert out_feedid is not None
+                    if out_feedid == feedid:
+                        return out
+                    outputs[out_feedid] = out
+                    condition.notify_all()
+        finally:
+            with condition:
+                state["reading"] = False
+                condition.notify_all()
 
     def render_fn(feedid, **kwargs):
         mid = getattr(message_counter, "counter", 0)
@@ -47,47 +86,28 @@ def _make_render_fn(request_queue, output_queue):
         tid = threading.get_ident()
         feedid = f"{tid}-{mid}"
 
-        if feedid not in output_queues:
-            output_queues[feedid] = queue.Queue()
-        try:
-            request_queue.put({
-                "feedid": feedid,
-                **kwargs,
-            })
-            out = output_queues[feedid].get()
-            out_type = out.pop("type")
-            if out_type == "error":
-                raise RuntimeError(out["error"])
-            elif out_type == "end":
-                raise SystemExit(0)
-            return out["result"]
-        finally:
-            output_queues.pop(feedid)
-
-    # Start queue multiplexer
-    def _multiplex_queues(output_queue, output_queues):
-        try:
-            while True:
-                out = output_queue.get()
-                out_type = out.get("type")
-                if out_type == "end":
-                    for q in output_queues.values(): q.put(out)
-                    break
-                else:
-                    feedid = out.pop("feedid")
-                    assert feedid is not None
-                    output_queues[feedid].put(out)
-        except Exception as e:
-            logging.exception(e)
-            logging.error(e)
+        request_queue.put({
+            "feedid": feedid,
+            **kwargs,
+        })
+        out = receive(feedid)
+        out_type = out.pop("type")
+        if out_type == "error":
+            raise RuntimeError(out["error"])
+        elif out_type == "end":
+            raise SystemExit(0)
+        if "result_slot" in out:
+            assert channel is not None, "Frame channel is not attached"
+            result = channel.read(out["result_slot"], out["result_size"])
+        else:
+            result = out["result"]
+        return result, out.get("render_time")
 
-    multiplex_thread = threading.Thread(target=_multiplex_queues, args=(output_queue, output_queues), daemon=True)
-    multiplex_thread.start()
     try:
         yield render_fn
     finally:
-        output_queue.put({"type": "end"})
-        multiplex_thread.join()
+        if channel is not None:
+            channel.close()
 
 
 def write_dataset_pointcloud(file, points3D_xyz, points3D_rgb=None):
@@ -126,8 +146,42 @@ def write_dataset_pointcloud(file, points3D_xyz, points3D_rgb=None):
     plydata.write(file)
 
 
+class _ProgressiveRendering:
+    """
+    Chooses the resolution of the interactive renders of a websocket connection.
+    While the camera moves, the frames are rendered at a scale estimated (from the recent
+    render times) to meet the target frame time. Once the same request is received again
+    (the camera is idle), the frame is rendered at the full resolution.
+    """
+    def __init__(self, 
+                 target_frame_time: float = _PROGRESSIVE_TARGET_FRAME_TIME, 
+                 min_scale: float = _PROGRESSIVE_MIN_SCALE):
+        self.target_frame_time = target_frame_time
+        self.min_scale = min_scale
+        self._time_per_pixel = None
+        self._last_request = None
+
+    def get_scale(self, req, num_pixels: int) -> float:
+        request = json.dumps(req, sort_keys=True)
+        idle = request == self._last_request
+        self._last_request = request
+        if idle or self._time_per_pixel is None:
+            return 1.0
+        scale = math.sqrt(self.target_frame_time / (self._time_per_pixel * max(num_pixels, 1)))
+        # Quantize the scale to avoid changing the resolution with every frame
+        scale = math.floor(scale * 16) / 16
+        return min(1.0, max(self.min_scale, scale))
+
+    def update(self, render_time: float, num_pixels: int):
+        time_per_pixel = render_time / max(num_pixels, 1)
+        if self._time_per_pixel is None:
+            self._time_per_pixel = time_per_pixel
+        else:
+            self._time_per_pixel = 0.5 * (self._time_per_pixel + time_per_pixel)
+
+
 class ViewerBackend:
-    def __init__(self, request_queue, output_queue, *, info, datasets):
+    def __init__(self, request_queue, output_queue, *, info, datasets, frame_channel=None):
         self._info = info
         self._datasets = datasets
         self._images_cache = {}
@@ -135,12 +189,13 @@ class ViewerBackend:
         self._stack = contextlib.ExitStack()
         self._request_queue = request_queue
         self._output_queue = output_queue
+        self._frame_channel = frame_channel
         self._thumbnail_size = 96
 
     def __enter__(self):
         self._stack.__enter__()
         self._render_fn = self._stack.enter_context(
-            _make_render_fn(self._request_queue, self._output_queue))
+            _make_render_fn(self._request_queue, self._output_queue, self._frame_channel))
         return self
 
     def __exit__(self, *args):
@@ -158,6 +213,10 @@ class ViewerBackend:
         return self._info
 
     def render(self, req):
+        frame_bytes, mimetype, _ = self._render(req)
+        return frame_bytes, mimetype
+
+    def _render(self, req, progressive=None):
         assert self._render_fn is not None, "Backend not initialized"
         if "image_size" not in req:
             raise ValueError("Invalid request, missing image_size")
@@ -171,7 +230,17 @@ class ViewerBackend:
         pose = np.array(req.get("pose"), dtype=np.float32).reshape(3, 4)
         intrinsics = np.array(req.get("intrinsics"), dtype=np.float32)
         lossless = req.get("lossless", False)
-        frame_bytes = self._render_fn(
+        scale = 1.0
+        if progressive is not None:
+            scale = progressive.get_scale(req, image_size[0] * image_size[1])
+            if scale < 1:
+                scaled_size = [max(1, round(x * scale)) for x in image_size]
+                intrinsics = intrinsics * np.array([
+                    scaled_size[0] / image_size[0], scaled_size[1] / image_size[1],
+                    scaled_size[0] / image_size[0], scaled_size[1] / image_size[1]], dtype=np.float32)
+                scale = scaled_size[0] / image_size[0]
+                image_size = scaled_size
+        frame_bytes, render_time = self._render_fn(
             threading.get_ident(), 
             pose=pose, 
             image_size=image_size, 
@@ -183,8 +252,10 @@ class ViewerBackend:
             split_tilt=float(req.get("split_tilt", 0)),
             format="PNG" if lossless else "JPEG",
             split_output_type=req.get("split_output_type"))
+        if progressive is not None and render_time is not None:
+            progressive.update(render_time, image_size[0] * image_size[1])
         mimetype = "image/png" if lossless else "image/jpeg"
-        return frame_bytes, mimetype
+        return frame_bytes, mimetype, scale
 
     def get_dataset_image(self, req):
         if "split" not in req:
@@ -248,16 +319,22 @@ class ViewerBackend:
         self._info["state"]["viewer_public_url"] = public_url
         return {"status": "ok", "public_url": public_url}
 
-    def handle_render_websocket_message(self, data):
+    def handle_render_websocket_message(self, data, progressive=None):
         thread = None
         try:
-            assert isinstance(data, str)
-            req = json.loads(data)
+            req = json.loads(data) if isinstance(data, str) else data
+            assert isinstance(req, dict)
             thread = req.pop("thread")
-            payload, mimetype = self.render(req)
-            msg_bytes = json.dumps({
+            req.pop("stream", None)
+            if not req.pop("progressive", False):
+                progressive = None
+            payload, mimetype, scale = self._render(req, progressive=progressive)
+            header = {
                 "status": "ok", "thread": thread, "mimetype": mimetype
-            }).encode("utf-8")
+            }
+            if progressive is not None:
+                header["scale"] = scale
+            msg_bytes = json.dumps(header).encode("utf-8")
             message_length = len(msg_bytes)
             return struct.pack(f"!I", message_length) + msg_bytes + payload
         except Exception as e:
@@ -266,6 +343,42 @@ class ViewerBackend:
                 "status": "error", "message": str(e), "thread": thread
             })
 
+    def handle_render_websocket(self, ws):
+        """
+        Serves the render requests of a websocket connection until it is closed.
+        The requests received while a frame is being rendered are coalesced. For each stream
+        (the optional ``stream`` field of the request), only the most recent request is rendered
+        and the older ones are answered with the ``superseded`` status.
+
+        The requests with ``progressive`` set are rendered at a lower resolution while the camera
+        moves (see `_ProgressiveRendering`) and the scale is reported in the ``scale`` field of the reply.
+        """
+        progressive = _ProgressiveRendering()
+        while True:
+            messages = [ws.receive()]
+            while True:
+                data = ws.receive(timeout=0)
+                if data is None:
+                    break
+                messages.append(data)
+
+            requests = {}
+            for data in messages:
+                try:
+                    req = json.loads(data)
+                    assert isinstance(req, dict)
+                except Exception:
+                    ws.send(self.handle_render_websocket_message(data))
+                    continue
+                superseded = requests.pop(req.get("stream"), None)
+                if superseded is not None:
+                    ws.send(json.dumps({
+                        "status": "superseded", "thread": superseded.get("thread")
+                    }))
+                requests[req.get("stream")] = req
+            for req in requests.values():
+                ws.send(self.handle_render_websocket_message(req, progressive=progressive))
+
     def get_dataset_pointcloud(self):
         dataset = self._datasets.get("train")
         if dataset is None:
@@ -456,10 +569,7 @@ class ViewerRequestHandler(SimpleHTTPRequestHandler):
     @httpserver_websocket_handler
     def _handle_render_websocket(self, ws):
         try:
-            while True:
-                reqdata = ws.receive()
-                out = self.backend.handle_render_websocket_message(reqdata)
-                ws.send(out)
+            self.backend.handle_render_websocket(ws)
         except ConnectionClosed:
             pass
         except Exception as e:
@@ -526,8 +636,6 @@ def run_simple_http_server(*args, host=None, port=None, verbose=False, **kwargs)
                     raise
             else:
                 raise RuntimeError("Could not find a free port")
-            port = self.server_address[1]
-            backend.notify_started(port)
             return out
 
     try:
@@ -536,6 +644,8 @@ def run_simple_http_server(*args, host=None, port=None, verbose=False, **kwargs)
         with ViewerBackend(*args, **kwargs) as backend, \
                 ThreadingHTTPServerWithBind((host, port), partial(ViewerRequestHandler, backend=backend)) as server:
             port = server.server_address[1]
+            # The socket is listening once the server is constructed
+            backend.notify_started(port)
             server.serve_forever()
     except KeyboardInterrupt:
         pass
@@ -623,10 +733,7 @@ def run_flask_server(*args, port, host=None, verbose=False, **kwargs):
     @flask_websocket_route(app, "/render-websocket")
     def render_websocket(ws):
         try:
-            while True:
-                reqdata = ws.receive()
-                out = backend.handle_render_websocket_message(reqdata)
-                ws.send(out)
+            backend.handle_render_websocket(ws)
         except ConnectionClosed:
             pass
         except Exception as e:
@@ -1,6 +1,9 @@
 import io
+import os
 import time
 import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import math
 import multiprocessing
 import logging
@@ -16,6 +19,11 @@ try:
 except ImportError:
     from typing_extensions import Optional
 from ._httpserver import run_simple_http_server
+from ._frame_channel import FrameChannel
+
+
+# Number of threads formatting and encoding the rendered frames (see Viewer.update)
+_ENCODE_WORKERS = min(4, os.cpu_count() or 1)
 
 
 def get_viewer_params_from_nb_info(nb_info, include_registry_data: bool = True):
@@ -226,7 +234,8 @@ class Viewer:
                  test_dataset=None, 
                  nb_info=None, 
                  host: str = "localhost",
-                 port: Optional[int] = None):
+                 port: Optional[int] = None,
+                 render_cache_size: int = 0):
         self._request_queue = multiprocessing.Queue()
         self._output_queue = multiprocessing.Queue()
         self._port = port
@@ -249,6 +258,12 @@ class Viewer:
         self._model = model
         self._running = False
         self._host = host
+        self._render_cache_size = render_cache_size
+        self._render_cache = OrderedDict()
+        self._render_cache_bytes = 0
+        self._encode_pool = None
+        self._encode_futures = deque()
+        self._frame_channel = None
 
     @property
     def port(self):
@@ -266,6 +281,10 @@ class Viewer:
         """
         Performs a single render task from the queue.
         This function should be called within the train step function to update the viewer when rendering is available.
+        If the render cache is enabled (`render_cache_size > 0`) and the model changes between the calls,
+        `clear_render_cache` must be called to discard the cached renders.
+        The rendered frame is formatted and encoded in a background thread, so that
+        rendering of the next frame overlaps with the compression of the current one.
 
         Returns:
             bool: True if there are more tasks in the queue
@@ -275,21 +294,69 @@ class Viewer:
         req = self._request_queue.get()
         feedid = req.pop("feedid")
         try:
-            frame = self._render(**req)
+            start = time.perf_counter()
+            with backends.zero_copy():
+                outputs = self._render_outputs(copy=True, **req)
+        except Exception as e:
+            logging.exception(e)
             self._output_queue.put({
+                "type": "error",
+                "feedid": feedid,
+                "error": str(e),
+                "exception": e
+            })
+            return not self._request_queue.empty()
+
+        if self._encode_pool is None:
+            self._encode_pool = ThreadPoolExecutor(max_workers=_ENCODE_WORKERS, thread_name_prefix="nb-viewer-encode")
+        # Bound the number of frames waiting to be encoded
+        while self._encode_futures and (
+                self._encode_futures[0].done() or len(self._encode_futures) >= 2 * _ENCODE_WORKERS):
+            self._encode_futures.popleft().result()
+        self._encode_futures.append(self._encode_pool.submit(
+            self._encode_output, self._output_queue, self._frame_channel, feedid, outputs, req, start))
+        return not self._request_queue.empty()
+
+    def _encode_output(self, output_queue, frame_channel, feedid, outputs, req, start):
+        try:
+            frame = self._encode_frame(outputs, **req)
+            # The frame is passed through the shared memory if possible, only its location is sent
+            slot = frame_channel.write(frame) if frame_channel is not None else None
+            output_queue.put({
                 "type": "result",
                 "feedid": feedid,
-                "result": frame,
+                **({"result": frame} if slot is None else {"result_slot": slot, "result_size": len(frame)}),
+                "render_time": time.perf_counter() - start,
             })
         except Exception as e:
             logging.exception(e)
-            self._output_queue.put({
+            output_queue.put({
                 "type": "error",
                 "feedid": feedid,
                 "error": str(e),
                 "exception": e
             })
-        return not self._request_queue.empty()
+
+    def clear_render_cache(self):
+        """
+        Discards the cached render outputs. It must be called when the model changes.
+        """
+        self._render_cache.clear()
+        self._render_cache_bytes = 0
+
+    def _cache_render_outputs(self, key, outputs):
+        entry = self._render_cache.pop(key, {})
+        self._render_cache_bytes -= sum(v.nbytes for v in entry.values())
+        entry.update(outputs)
+        size = sum(v.nbytes for v in entry.values())
+        if size > self._render_cache_size:
+            return
+        self._render_cache[key] = entry
+        self._render_cache_bytes += size
+        # Evict the least recently used entries
+        while self._render_cache_bytes > self._render_cache_size:
+            _, evicted = self._render_cache.popitem(last=False)
+            self._render_cache_bytes -= sum(v.nbytes for v in evicted.values())
 
     def _format_output(self, output, name, *, background_color=None, expected_depth_scale=None):
         name = name or "color"
@@ -317,18 +384,25 @@ class Viewer:
             output = apply_colormap((output-mmin)/(mmax-mmin), pallete="coolwarm")
         return output
 
-    def _render(self,
-                pose,
-                image_size,
-                intrinsics,
-                output_type,
-                split_output_type,
-                split_percentage,
-                split_tilt,
-                appearance_weights=None,
-                appearance_train_indices=None,
-                format=None,
-                **kwargs):
+    def _render(self, format=None, **kwargs):
+        with backends.zero_copy():
+            outputs = self._render_outputs(**kwargs)
+            return self._encode_frame(outputs, format=format, **kwargs)
+
+    def _render_outputs(self,
+                        pose,
+                        image_size,
+                        intrinsics,
+                        output_type,
+                        split_output_type,
+                        appearance_weights=None,
+                        appearance_train_indices=None,
+                        copy: bool = False,
+                        **kwargs):
+        """
+        Renders the raw outputs required for the frame. If copy is False, the outputs
+        can be in the shared memory and are only valid inside the zero-copy context.
+        """
         del kwargs
         camera = nerfbaselines.new_cameras(
             poses=pose,
@@ -356,27 +430,57 @@ class Viewer:
                 pass
             if embeddings is not None and all(x is not None for x in embeddings):
                 embedding = sum(x * alpha for (_, alpha), x in zip(app_tuples, embeddings))
-        options = { "output_type_dtypes": { "color": "uint8" },
-                    "outputs": output_types,
-                    "embedding": embedding }
-        with backends.zero_copy():
-            outputs = self._model.render(camera, options=options)
-            # Format first output
-            frame = self._format_output(outputs[output_type], output_type)
-            if split_output_type is not None:
-                # Format second output
-                split_frame = self._format_output(outputs[split_output_type], split_output_type)
-
-                # Combine the two outputs
-                frame = combine_outputs(frame, split_frame, 
-                                        split_percentage=split_percentage,
-                                        split_tilt=split_tilt)
-            # Copy if still in shared memory before moving it to the output queue
-            with io.BytesIO() as output, Image.fromarray(frame) as img:
-                img.save(output, format=format)
-                output.seek(0)
-                return output.getvalue()
-
+        # The raw outputs are cached, so that switching the output types
+        # or returning to a previous view does not render the frame again
+        cache_key = (
+            np.round(np.asarray(pose, dtype=np.float64), 4).tobytes(),
+            np.round(np.asarray(intrinsics, dtype=np.float64), 2).tobytes(),
+            tuple(int(x) for x in image_size),
+            np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None,
+        )
+        outputs = self._render_cache.get(cache_key, {})
+        if outputs:
+            self._render_cache.move_to_end(cache_key)
+        missing_output_types = tuple(x for x in output_types if x not in outputs)
+        if missing_output_types:
+            options = { "output_type_dtypes": { "color": "uint8" },
+                        "outputs": missing_output_types,
+                        "embedding": embedding }
+            rendered = self._model.render(camera, options=options)
+            rendered = {k: rendered[k] for k in missing_output_types}
+            if copy or self._render_cache_size > 0:
+                # The outputs can be in the shared memory (zero-copy), we need to copy them
+                rendered = {k: np.array(v, copy=True) for k, v in rendered.items()}
+            if self._render_cache_size > 0:
+                self._cache_render_outputs(cache_key, rendered)
+            outputs = {**outputs, **rendered}
+        return outputs
+
+    def _encode_frame(self,
+                      outputs,
+                      output_type,
+                      split_output_type,
+                      split_percentage,
+                      split_tilt,
+                      format=None,
+                      **kwargs):
+        del kwargs
+        # Format first output
+        frame = self._format_output(outputs[output_type], output_type)
+        if split_output_type is not None:
+            # Format second output
+            split_frame = self._format_output(outputs[split_output_type], split_output_type)
+
+            # Combine the two outputs (in-place, the cached outputs must not be modified)
+            if np.shares_memory(frame, outputs[output_type]):
+                frame = frame.copy()
+            frame = combine_outputs(frame, split_frame, 
+                                    split_percentage=split_percentage,
+                                    split_tilt=split_tilt)
+        with io.BytesIO() as output, Image.fromarray(frame) as img:
+            img.save(output, format=format)
+            output.seek(0)
+            return output.getvalue()
 
     def _run_backend(self):
         orig_port = self._port
@@ -384,12 +488,14 @@ class Viewer:
         info = get_viewer_params(self._model_info, datasets, self._nb_info)
         assert self._request_queue is not None, "Request queue is not initialized"
 
+        self._frame_channel = FrameChannel.create()
         self._process = multiprocessing.Process(target=self._server_fn, args=(
             self._request_queue, 
             self._output_queue, 
         ), kwargs=dict(
             datasets={"train": self._train_dataset, "test": self._test_dataset},
             info=info,
+            frame_channel=self._frame_channel.get_spec() if self._frame_channel is not None else None,
             host=self._host,
             port=self._port,
         ), daemon=True)
@@ -422,6 +528,12 @@ class Viewer:
         return f"{self._host}:{self._port}"
 
     def close(self):
+        # Finish encoding the rendered frames
+        if self._encode_pool is not None:
+            self._encode_pool.shutdown(wait=True)
+            self._encode_pool = None
+            self._encode_futures.clear()
+
         # Empty request queue
         if self._request_queue is not None:
             while not self._request_queue.empty(): self._request_queue.get()
@@ -439,6 +551,9 @@ class Viewer:
                     break
             self._process.kill()
             self._process = None
+        if self._frame_channel is not None:
+            self._frame_channel.close()
+            self._frame_channel = None
 
     def __enter__(self):
         if self._process is None:
@@ -1206,6 +1206,7 @@ export class WebSocketFrameRenderer {
     this._socket = undefined;
     this._subscriptions = {};
     this._thread_counter = 0;
+    this.needs_refinement = false;
   }
 
   _on_message(message) {
@@ -1305,6 +1306,10 @@ export class WebSocketFrameRenderer {
         ...params,
       }));
     });
+    // A newer request of the same stream was received before this one was rendered
+    if (message.status === "superseded") return undefined;
+    // The progressive frames rendered at a lower resolution are refined once the camera stops
+    if (params.progressive) this.needs_refinement = message.scale !== undefined && message.scale < 1;
     return await createImageBitmap(message.payload, { imageOrientation: flipY ? "flipY" : undefined });
   }
 }
@@ -2698,9 +2703,9 @@ export class Viewer extends THREE.EventDispatcher {
     const run = async () => {
       while (true) {
         try {
-          const params = this._get_render_params();
+          const params = this._get_render_params({ force: this.frame_renderer.needs_refinement });
           if (params !== undefined) {
-            const image = await this.frame_renderer.render(params, { flipY: true });
+            const image = await this.frame_renderer.render({ ...params, progressive: true }, { flipY: true });
             if (image) {
               this.dispatchEvent({ type: "frame", image });
               this._last_frames[0] = image;
@@ -3571,6 +3576,8 @@ export class Viewer extends THREE.EventDispatcher {
           appearance_weights,
           appearance_train_indices,
           lossless: true,
+          // Video frames must not be superseded by the interactive renders
+          stream: "video",
         };
         request.output_type = state.output_type === "" ? undefined : state.output_type;
         if (state.split_enabled && state.split_output_type) {
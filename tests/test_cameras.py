@@ -1,4 +1,5 @@
 import pytest
+from unittest import mock
 import numpy as np
 from nerfbaselines import cameras
 from nerfbaselines import camera_model_to_int, CameraModel, new_cameras
@@ -25,6 +26,36 @@ def test_distortions(camera_type: CameraModel):
     np.testing.assert_allclose(xy, new_xy, atol=5e-4, rtol=0)
 
 
+
+@pytest.mark.parametrize("camera_type", ["opencv", "opencv_fisheye", "full_opencv"])
+def test_distortion_jacobians(camera_type):
+    num_samples = 1000
+    params = np.random.rand(num_samples, 8) * 0.05
+    xy = (np.random.rand(num_samples, 2) * 2 - 1) * 0.8
+    xnp = _get_xnp(xy)
+    distortion = cameras._DISTORTIONS[camera_type]
+    dx, J = cameras._DISTORTION_JACOBIANS[camera_type](params, xy, xnp=xnp)
+    dx_numerical, J_numerical = cameras._numerical_distortion_jacobian(distortion, params, xy, xnp=xnp)
+    np.testing.assert_allclose(dx, dx_numerical, atol=1e-12, rtol=0)
+    np.testing.assert_allclose(J, J_numerical, atol=1e-5, rtol=0)
+
+
+@pytest.mark.extras
+@pytest.mark.parametrize("camera_type", ["opencv", "opencv_fisheye", "full_opencv"])
+def test_distortions_torch(camera_type):
+    import torch
+
+    num_samples = 10000
+    camera_models = np.full((num_samples,), camera_model_to_int(camera_type), dtype=np.int32)
+    params = np.random.rand(num_samples, 8) * 0.01
+    xy = (np.random.rand(num_samples, 2) * 2 - 1) * 0.8
+    xy_distorted = cameras._distort(camera_models, params, xy, xnp=np)
+    new_xy = cameras._undistort(torch.from_numpy(camera_models), torch.from_numpy(params), torch.from_numpy(xy_distorted), xnp=torch)
+    assert isinstance(new_xy, torch.Tensor)
+    np.testing.assert_allclose(xy, new_xy.numpy(), atol=5e-4, rtol=0)
+    np.testing.assert_allclose(cameras._undistort(camera_models, params, xy_distorted, xnp=np), new_xy.numpy(), atol=1e-8, rtol=0)
+
+
 @pytest.mark.parametrize("camera_type", get_args(CameraModel))
 def test_camera(camera_type):
     np.random.seed(42)
@@ -81,10 +112,57 @@ def test_camera_undistort(camera_type):
         nears_fars=None,
     )
     undistorted_cams = cameras.undistort_camera(cams)
+    # The input cameras must not be modified
+    assert np.all(cams.camera_models == camera_model_to_int(camera_type))
     images = np.random.rand(num_cam, 200, 100, 3)
     cameras.warp_image_between_cameras(cams, undistorted_cams, images)
 
 
+
+def test_camera_undistort_shared_cameras():
+    np.random.seed(42)
+    cam = _build_camera("opencv", np.array([536.07, 536.01, 342.37, 235.53]), np.array([-0.27, 0.06, 0.001, -0.0003]), image_sizes=np.array([640, 480], dtype=np.int32))
+    other = _build_camera("opencv", np.array([436.07, 436.01, 342.37, 235.53]), np.array([-0.2, 0.05, 0.001, -0.0003]), image_sizes=np.array([640, 480], dtype=np.int32))
+    cams = type(cam).cat([cam[None], other[None], cam[None]])
+    undistorted_cams = cameras.undistort_camera(cams)
+    for i, single in enumerate([cam, other, cam]):
+        expected = cameras.undistort_camera(single)
+        np.testing.assert_allclose(undistorted_cams.intrinsics[i], expected.intrinsics)
+        np.testing.assert_array_equal(undistorted_cams.image_sizes[i], expected.image_sizes)
+
+
+def test_warp_grid_cache(tmp_path):
+    cam = _build_camera("opencv_fisheye", np.array([536.07, 536.01, 342.37, 235.53]), np.array([0.1, 0.05, 0.0, 0.0, 0.01, 0.001]), image_sizes=np.array([64, 48], dtype=np.int32))
+    undistorted_cam = cameras.undistort_camera(cam)
+    moved_cam = cam.replace(poses=np.random.randn(3, 4).astype(np.float32))
+    images = np.random.rand(48, 64, 3).astype(np.float32)
+
+    cameras._remap_cache.clear()
+    with mock.patch.object(cameras, "NB_PREFIX", str(tmp_path)), \
+            mock.patch.dict("os.environ", {"NERFBASELINES_REMAP_CACHE": "1"}):
+        grid = cameras._get_warp_grid(cam, undistorted_cam)
+        # Poses do not affect the grid
+        assert cameras._get_warp_grid(moved_cam, undistorted_cam) is grid
+        assert len(list((tmp_path / "cache" / "remap").iterdir())) == 1
+
+        # The grid is loaded from the disk
+        cameras._remap_cache.clear()
+        grid2 = cameras._get_warp_grid(cam, undistorted_cam)
+        assert grid2 is not grid
+        np.testing.assert_array_equal(grid2, grid)
+
+        # The stored grids are not reused after the cache version changes
+        cameras._remap_cache.clear()
+        with mock.patch.object(cameras, "_REMAP_CACHE_VERSION", cameras._REMAP_CACHE_VERSION + 1):
+            cameras._get_warp_grid(cam, undistorted_cam)
+        assert len(list((tmp_path / "cache" / "remap").iterdir())) == 2
+
+        warped = cameras.warp_image_between_cameras(cam, undistorted_cam, images)
+    cameras._remap_cache.clear()
+    warped2 = cameras.warp_image_between_cameras(moved_cam, undistorted_cam, images)
+    np.testing.assert_array_equal(warped, warped2)
+
+
 # # @pytest.mark.parametrize("camera_type", get_args(CameraModel))
 # # def test_camera_undistort(camera_type):
 # #     np.random.seed(42)
@@ -313,3 +391,86 @@ def test_project_shapes():
     uv = cameras.project(cam, xyz)
     assert uv.shape == (2, 12 * 15, 2)
     assert uv.dtype == np.float32
+
+
+def _test_undistortion_4k_benchmark(benchmark, xnp, to_tensor):
+    cam = new_cameras(
+        poses=np.eye(4, dtype=np.float32)[None, :3, :4],
+        intrinsics=np.array([[2000.0, 2000.0, 1920.0, 1080.0]], dtype=np.float32),
+        image_sizes=np.array([[3840, 2160]], dtype=np.int32),
+        camera_models=np.array([camera_model_to_int("opencv_fisheye")], dtype=np.int32),
+        distortion_parameters=np.array([[0.1, 0.02, 0, 0, 0.01, 0.001]], dtype=np.float32),
+        nears_fars=None,
+    ).apply(lambda x, _: to_tensor(x))[:, None]
+    xy = cameras.get_image_pixels(cam.image_sizes[0, 0])[None]
+
+    _, directions = benchmark(lambda: cameras.get_rays(cam, xy))
+    assert directions.shape == (1, 3840 * 2160, 3)
+    xy_projected = cameras.project(cam, directions)
+    assert float(xnp.abs(xy_projected - (xy + 0.5)).max()) < 5e-2
+
+
+@pytest.mark.benchmark(group="undistortion", min_rounds=1, max_time=1.0, warmup=False)
+def test_undistortion_4k_benchmark(benchmark):
+    _test_undistortion_4k_benchmark(benchmark, np, lambda x: x)
+
+
+@pytest.mark.extras
+@pytest.mark.benchmark(group="undistortion", min_rounds=1, max_time=1.0, warmup=False)
+def test_undistortion_4k_benchmark_torch(benchmark):
+    import torch
+    _test_undistortion_4k_benchmark(benchmark, torch, torch.from_numpy)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32, bool])
+def test_warp_image_between_cameras_batched(dtype):
+    np.random.seed(42)
+    cam = _build_camera("opencv", np.array([60.0, 60.0, 32.0, 24.0]), np.array([-0.2, 0.05, 0.001, -0.0003, 0.0, 0.0]), image_sizes=np.array([64, 48], dtype=np.int32))
+    other = _build_camera("opencv_fisheye", np.array([60.0, 60.0, 32.0, 24.0]), np.array([0.1, 0.05, 0.0, 0.0, 0.01, 0.001]), image_sizes=np.array([64, 48], dtype=np.int32))
+    cams = type(cam).cat([cam[None], other[None], cam[None]])
+    undistorted_cams = cameras.undistort_camera(cams)
+    images = (np.random.rand(3, 48, 64, 3) * 255).astype(dtype)
+
+    warped = cameras.warp_image_between_cameras(cams, undistorted_cams, images)
+    assert warped.dtype == images.dtype
+    for i in range(len(cams)):
+        expected = cameras.warp_image_between_cameras(cams[i], undistorted_cams[i], images[i])
+        w, h = undistorted_cams.image_sizes[i]
+        np.testing.assert_array_equal(warped[i, :h, :w], expected)
+
+    # Small batches give the same results
+    with mock.patch.object(cameras, "_WARP_BATCH_PIXELS", 1):
+        warped2 = cameras.warp_image_between_cameras(cams, undistorted_cams, list(images))
+    np.testing.assert_array_equal(warped, warped2)
+
+
+@pytest.mark.extras
+def test_warp_image_between_cameras_torch():
+    import torch
+
+    cam = _build_camera("opencv", np.array([60.0, 60.0, 32.0, 24.0]), np.array([-0.2, 0.05, 0.001, -0.0003]), image_sizes=np.array([64, 48], dtype=np.int32))
+    undistorted_cam = cameras.undistort_camera(cam)
+    image = np.random.rand(48, 64, 3).astype(np.float32)
+    expected = cameras.warp_image_between_cameras(cam, undistorted_cam, image)
+    warped = cameras.warp_image_between_cameras(cam, undistorted_cam, torch.from_numpy(image))
+    assert isinstance(warped, torch.Tensor)
+    np.testing.assert_allclose(warped.numpy(), expected, atol=1e-6)
+
+
+def test_unproject_not_cached():
+    cam = _build_camera("opencv", np.array([300.0, 300.0, 160.0, 120.0], dtype=np.float32), np.array([-0.2, 0.05, 0.001, -0.0003], dtype=np.float32), image_sizes=np.array([320, 240], dtype=np.int32))
+    xy = cameras.get_image_pixels(cam.image_sizes)[None].astype(np.float32)
+
+    cameras._remap_cache.clear()
+    _, directions = cameras.unproject(cam[None][:, None], xy)
+    _, directions2 = cameras.unproject(cam[None][:, None], xy)
+    assert len(cameras._remap_cache._data) == 0
+    np.testing.assert_array_equal(directions, directions2)
+    assert not np.shares_memory(directions, directions2)
+    assert directions.flags.writeable
+
+    # The warp grid is cached per camera
+    undistorted_cam = cameras.undistort_camera(cam)
+    grid = cameras._get_warp_grid(cam, undistorted_cam)
+    assert cameras._get_warp_grid(cam, undistorted_cam) is grid
+    assert len(cameras._remap_cache._data) == 1
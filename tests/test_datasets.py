@@ -197,3 +197,137 @@ def test_all_dataset_tested():
             dataset = k[5:-8]
             untested_datasets.remove(dataset)
     assert len(untested_datasets) == 0, f"Untested datasets: {untested_datasets}"
+
+
+@pytest.mark.parametrize("num_workers,executor", [(2, "thread"), (2, "process")])
+def test_dataset_load_features_parallel(colmap_dataset_path, num_workers, executor):
+    from nerfbaselines.datasets import load_dataset, dataset_load_features
+
+    dataset = load_dataset(colmap_dataset_path, split="train", load_features=False)
+    serial = dataset_load_features(dict(dataset, cameras=dataset["cameras"].replace()), num_workers=0)  # type: ignore
+    parallel = dataset_load_features(dataset, num_workers=num_workers, executor=executor, prefetch=1)
+
+    assert len(parallel["images"]) == len(serial["images"])
+    for a, b in zip(parallel["images"], serial["images"]):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(parallel["cameras"].image_sizes, serial["cameras"].image_sizes)
+    np.testing.assert_array_equal(parallel["cameras"].intrinsics, serial["cameras"].intrinsics)
+
+
+def test_dataset_load_features_cache(colmap_dataset_path, tmp_path):
+    from nerfbaselines.datasets import load_dataset, dataset_load_features
+
+    with mock.patch("nerfbaselines.datasets._cache.NB_PREFIX", str(tmp_path / "prefix")):
+        def load(cache):
+            dataset = load_dataset(colmap_dataset_path, split="train", load_features=False)
+            return dataset_load_features(dataset, supported_camera_models=frozenset(("pinhole",)), cache=cache)
+
+        expected = load(cache=False)
+        first = load(cache=True)
+        assert len(os.listdir(tmp_path / "prefix" / "cache" / "datasets")) == 1
+
+        with mock.patch("nerfbaselines.datasets._common._load_image", side_effect=AssertionError("should load from cache")):
+            cached = load(cache=True)
+
+        for loaded in (first, cached):
+            assert loaded["image_paths"] == expected["image_paths"]
+            assert loaded["image_paths_root"] == expected["image_paths_root"]
+            assert isinstance(loaded["images"][0], np.memmap)
+            for a, b in zip(loaded["images"], expected["images"]):
+                np.testing.assert_array_equal(a, b)
+            np.testing.assert_array_equal(loaded["cameras"].camera_models, expected["cameras"].camera_models)
+            np.testing.assert_allclose(loaded["cameras"].intrinsics, expected["cameras"].intrinsics)
+            np.testing.assert_array_equal(loaded["cameras"].image_sizes, expected["cameras"].image_sizes)
+
+        # Changing the images invalidates the cache
+        for path in expected["image_paths"]:
+            os.utime(colmap_dataset_path / "images" / os.path.basename(path), ns=(0, 0))
+        load(cache=True)
+        assert len(os.listdir(tmp_path / "prefix" / "cache" / "datasets")) == 2
+
+
+def test_dataset_load_features_lazy(colmap_dataset_path):
+    import pickle
+    from nerfbaselines.datasets import load_dataset, dataset_index_select, LazyImages
+
+    supported_camera_models = frozenset(("pinhole",))
+    expected = load_dataset(colmap_dataset_path, split="train", supported_camera_models=supported_camera_models)
+    dataset = load_dataset(colmap_dataset_path, split="train", supported_camera_models=supported_camera_models, lazy=True)
+    assert isinstance(dataset["images"], LazyImages)
+    assert dataset["image_paths"] == expected["image_paths"]
+    np.testing.assert_array_equal(dataset["cameras"].image_sizes, expected["cameras"].image_sizes)
+    np.testing.assert_allclose(dataset["cameras"].intrinsics, expected["cameras"].intrinsics)
+    np.testing.assert_array_equal(dataset["cameras"].camera_models, expected["cameras"].camera_models)
+    assert len(dataset["images"]) == len(expected["images"])
+    for a, b in zip(dataset["images"], expected["images"]):
+        np.testing.assert_array_equal(a, b)
+
+    # Only the last images are kept in memory
+    assert len(dataset["images"]._cache) == min(16, len(expected["images"]))  # type: ignore
+
+    # Index select and pickling keep the sequence lazy
+    dataset_slice = dataset_index_select(dataset, [2, 0])
+    assert isinstance(dataset_slice["images"], LazyImages)
+    dataset_slice = pickle.loads(pickle.dumps(dataset_slice))
+    assert len(dataset_slice["images"]) == 2
+    np.testing.assert_array_equal(dataset_slice["images"][0], expected["images"][2])
+    np.testing.assert_array_equal(dataset_slice["images"][-1], expected["images"][0])
+    with pytest.raises(IndexError):
+        dataset_slice["images"][2]
+
+
+def test_colmap_read_points3D_binary_arrays(tmp_path):
+    from nerfbaselines.datasets import _colmap_utils as colmap_utils
+
+    points3D = {
+        i * 3 + 5: colmap_utils.Point3D(
+            i * 3 + 5, np.random.rand(3), np.random.randint(0, 255, (3,)), float(np.random.rand()),
+            np.random.randint(0, 10, (i % 4,)), np.random.randint(0, 7, (i % 4,)))
+        for i in range(13)
+    }
+    colmap_utils.write_points3D_binary(points3D, str(tmp_path / "points3D.bin"))
+    colmap_utils.write_points3D_text(points3D, str(tmp_path / "points3D.txt"))
+
+    arrays = colmap_utils.read_points3D_binary_arrays(str(tmp_path / "points3D.bin"))
+    np.testing.assert_array_equal(arrays.ids, list(points3D.keys()))
+    np.testing.assert_array_equal(arrays.xyz, [p.xyz for p in points3D.values()])
+    np.testing.assert_array_equal(arrays.rgb, [p.rgb for p in points3D.values()])
+    np.testing.assert_array_equal(arrays.error, [p.error for p in points3D.values()])
+    np.testing.assert_array_equal(np.diff(arrays.track_offsets), [len(p.image_ids) for p in points3D.values()])
+
+    text_arrays = colmap_utils.points3D_dict_to_arrays(colmap_utils.read_points3D_text(str(tmp_path / "points3D.txt")))
+    for name in colmap_utils.Points3DArrays._fields:
+        np.testing.assert_allclose(getattr(text_arrays, name), getattr(arrays, name))
+
+    # The dict API is a view over the arrays
+    loaded = colmap_utils.read_points3D_binary(str(tmp_path / "points3D.bin"))
+    assert list(loaded.keys()) == list(points3D.keys())
+    for k, p in points3D.items():
+        np.testing.assert_array_equal(loaded[k].xyz, p.xyz)
+        np.testing.assert_array_equal(loaded[k].rgb, p.rgb)
+        assert loaded[k].error == p.error
+        np.testing.assert_array_equal(loaded[k].image_ids, p.image_ids)
+        np.testing.assert_array_equal(loaded[k].point2D_idxs, p.point2D_idxs)
+
+
+def test_colmap_images_points3D_indices(colmap_dataset_path):
+    from nerfbaselines.datasets import _colmap_utils as colmap_utils
+    from nerfbaselines.datasets.colmap import load_colmap_dataset
+
+    sparse_path = colmap_dataset_path / "sparse" / "0"
+    points3D = colmap_utils.read_points3D_binary(str(sparse_path / "points3D.bin"))
+    point_ids = list(points3D.keys())[::-1]
+    points3D = {k: points3D[k] for k in point_ids}
+    colmap_utils.write_points3D_binary(points3D, str(sparse_path / "points3D.bin"))
+    images = colmap_utils.read_images_binary(str(sparse_path / "images.bin"))
+    images = {k: img._replace(point3D_ids=np.array([point_ids[j % len(point_ids)] if j % 3 else -1 for j in range(k, k + len(img.xys))])) for k, img in images.items()}
+    colmap_utils.write_images_binary(images, str(sparse_path / "images.bin"))
+
+    dataset = load_colmap_dataset(str(colmap_dataset_path), split=None, features=frozenset(("points3D_xyz", "images_points3D_indices")))
+    assert dataset["points3D_xyz"] is not None
+    np.testing.assert_allclose(dataset["points3D_xyz"], [p.xyz for p in points3D.values()], rtol=1e-6)
+    assert dataset["images_points3D_indices"] is not None
+    ptmap = {point3D_id: i for i, point3D_id in enumerate(points3D.keys())}
+    for image, indices in zip(images.values(), dataset["images_points3D_indices"]):
+        assert indices.dtype == np.int32
+        np.testing.assert_array_equal(indices, [ptmap[x] for x in image.point3D_ids if x != -1])
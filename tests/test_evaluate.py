@@ -1,8 +1,10 @@
 import sys
+import base64
 from unittest import mock
 import pytest
 import os
 import json
+from typing import cast
 import numpy as np
 from pathlib import Path
 import tarfile
@@ -82,3 +84,256 @@ def test_evaluate_command_extras(tmp_path, mock_torch):
         results = json.load(f)
         assert "ssim" in results["metrics"]
         assert "lpips" in results["metrics"]
+
+
+def test_evaluate_command_batched(tmp_path):
+    from nerfbaselines.cli import _evaluate
+
+    args = ["nerfbaselines", "evaluate", str(tmp_path / "predictions"), "-o", str(tmp_path / "results.json"), "--batched"]
+    with mock.patch.object(sys, "argv", args), \
+            mock.patch.object(_evaluate, "evaluate") as evaluate_mock:
+        import nerfbaselines.cli
+
+        with pytest.raises(SystemExit) as excinfo:
+            nerfbaselines.cli.main()
+        assert excinfo.value.code == 0
+    evaluate_mock.assert_called_once()
+    assert evaluate_mock.call_args.kwargs["batched"] is True
+
+
+def _fake_lpips(a, b):
+    return np.abs(a - b).mean((-3, -2, -1))
+
+
+def test_evaluate_batched(tmp_path):
+    from nerfbaselines import metrics
+
+    _generate_predictions(tmp_path / "predictions")
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips):
+        results = evaluate(str(tmp_path / "predictions"), output=str(tmp_path / "results.json"), batched=False)
+        results_batched = evaluate(str(tmp_path / "predictions"), output=str(tmp_path / "results-batched.json"), batched=True)
+    assert set(results["metrics_raw"].keys()) == set(results_batched["metrics_raw"].keys())
+    for k, v in results["metrics_raw"].items():
+        values = np.frombuffer(base64.b64decode(v), dtype="<f4")
+        values_batched = np.frombuffer(base64.b64decode(results_batched["metrics_raw"][k]), dtype="<f4")
+        assert len(values) == 100
+        np.testing.assert_allclose(values_batched, values, rtol=1e-6, atol=1e-6, err_msg=k)
+
+
+@pytest.mark.parametrize("archive_type", ["zip", "tar.gz"])
+def test_evaluate_archive_streaming(tmp_path, archive_type):
+    import zipfile
+    import random
+    from nerfbaselines import metrics
+
+    _generate_predictions(tmp_path / "predictions")
+    # The members are stored out of order (the evaluation must still follow the sorted order)
+    files = sorted(x for x in (tmp_path / "predictions").glob("**/*") if x.is_file())
+    random.Random(42).shuffle(files)
+    archive_path = str(tmp_path / f"predictions.{archive_type}")
+    if archive_type == "zip":
+        with zipfile.ZipFile(archive_path, "w") as zip:
+            for file in files:
+                zip.write(file, arcname=file.relative_to(tmp_path / "predictions").as_posix())
+    else:
+        with tarfile.open(archive_path, "w:gz") as tar:
+            for file in files:
+                tar.add(file, arcname="./" + file.relative_to(tmp_path / "predictions").as_posix())
+
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips):
+        results = evaluate(str(tmp_path / "predictions"), output=str(tmp_path / "results.json"))
+        with mock.patch("tempfile.TemporaryDirectory", side_effect=AssertionError("The archive was extracted")):
+            results_archive = evaluate(archive_path, output=str(tmp_path / "results-archive.json"))
+    assert results_archive["predictions_sha256"] == results["predictions_sha256"]
+    assert results_archive["ground_truth_sha256"] == results["ground_truth_sha256"]
+    assert results_archive["metrics_raw"] == results["metrics_raw"]
+    assert results_archive["metrics"] == results["metrics"]
+
+    # The images stored out of the sorted order do not fit the buffer,
+    # the archive is hashed again (reading a single image per pass)
+    from nerfbaselines import evaluation
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips), \
+            mock.patch("nerfbaselines.io._PREDICTIONS_BUFFER_MEMORY", 1), \
+            mock.patch.object(evaluation, "get_predictions_sha", wraps=evaluation.get_predictions_sha) as get_predictions_sha:
+        results_archive = evaluate(archive_path, output=str(tmp_path / "results-archive-2.json"))
+    assert get_predictions_sha.called == (archive_type == "tar.gz")
+    assert results_archive["predictions_sha256"] == results["predictions_sha256"]
+    assert results_archive["ground_truth_sha256"] == results["ground_truth_sha256"]
+    assert results_archive["metrics_raw"] == results["metrics_raw"]
+
+
+def test_evaluate_all_batches():
+    from typeguard import suppress_type_checks
+    from nerfbaselines import evaluation
+    from nerfbaselines import new_dataset, Cameras
+
+    np.random.seed(42)
+    shapes = [(16, 12, 3)] * 3 + [(15, 12, 3)] * 2 + [(16, 12, 3)] * 3
+    preds = [{"color": np.random.randint(0, 255, shape, dtype=np.uint8)} for shape in shapes]
+    gts = [np.random.randint(0, 255, shape, dtype=np.uint8) for shape in shapes]
+    with suppress_type_checks():
+        dataset = new_dataset(
+            cameras=cast(Cameras, None),
+            image_paths=[f"{i}.png" for i in range(len(shapes))],
+            images=gts,
+            metadata={"color_space": "srgb", "background_color": np.array([0, 0, 0], dtype=np.uint8)})
+
+    protocol = evaluation.DefaultEvaluationProtocol()
+    batch_sizes = []
+    evaluate_batch = protocol.evaluate_batch
+
+    def _evaluate_batch(predictions, dataset):
+        batch_sizes.append(len(predictions))
+        return evaluate_batch(predictions, dataset)
+
+    from nerfbaselines import metrics
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips), \
+            mock.patch.object(protocol, "evaluate_batch", _evaluate_batch), \
+            suppress_type_checks():
+        # Batched evaluation is opt-in
+        expected = list(evaluation._evaluate_all(protocol, preds, dataset))
+        assert batch_sizes == []
+        out = list(evaluation._evaluate_all(protocol, preds, dataset, batched=True))
+        assert batch_sizes == [3, 2, 3]
+
+        # Batches are bounded by the memory budget
+        batch_sizes.clear()
+        with mock.patch.object(evaluation, "_EVALUATE_BATCH_MEMORY", 2 * 4 * 2 * 16 * 12 * 3):
+            out_small = list(evaluation._evaluate_all(protocol, preds, dataset, batched=True))
+        assert batch_sizes == [2, 1, 2, 2, 1]
+
+    # Protocols not implementing `evaluate_batch` are evaluated one by one
+    class _Protocol(evaluation.DefaultEvaluationProtocol):
+        def evaluate_batch(self, predictions, dataset):
+            raise NotImplementedError()
+
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips), \
+            suppress_type_checks():
+        assert list(evaluation._evaluate_all(_Protocol(), preds, dataset, batched=True)) == expected
+
+    assert len(out) == len(expected) == len(out_small) == len(shapes)
+    for a, b, c in zip(expected, out, out_small):
+        assert a.keys() == b.keys() == c.keys()
+        for k in a:
+            np.testing.assert_allclose(b[k], a[k], rtol=1e-6, err_msg=k)
+            np.testing.assert_allclose(c[k], a[k], rtol=1e-6, err_msg=k)
+
+
+def test_render_all_images_multiple_methods(tmp_path):
+    import time
+    from nerfbaselines import new_cameras, new_dataset
+    from nerfbaselines.evaluation import render_all_images
+    from nerfbaselines.utils import CancellationToken, CancelledException
+    from nerfbaselines.backends import zero_copy
+    from nerfbaselines.backends._common import current_backend_options
+
+    contexts = []
+
+    def _render(delay, calls, camera, options=None):
+        del options
+        time.sleep(delay)
+        CancellationToken.cancel_if_requested()
+        contexts.append((CancellationToken.current, current_backend_options().zero_copy))
+        calls.append(int(camera.intrinsics[2]))
+        return {"color": np.full((5, 6, 3), int(camera.intrinsics[2]), dtype=np.uint8)}
+
+    calls_fast, calls_slow = [], []
+    method_fast = mock.MagicMock()
+    method_fast.render.side_effect = lambda *args, **kwargs: _render(0.001, calls_fast, *args, **kwargs)
+    method_slow = mock.MagicMock()
+    method_slow.render.side_effect = lambda *args, **kwargs: _render(0.02, calls_slow, *args, **kwargs)
+    method_fast.get_info.return_value = method_slow.get_info.return_value = {}
+    num_images = 12
+    dataset = new_dataset(
+        images=[np.zeros((5, 6, 3), dtype=np.uint8) for _ in range(num_images)],
+        image_paths=[f"{i}.png" for i in range(num_images)],
+        cameras=new_cameras(
+            poses=np.eye(4)[None, :3, :4].repeat(num_images, axis=0),
+            intrinsics=np.array([[5, 5, i, 2] for i in range(num_images)], dtype=np.float32),
+            camera_models=np.zeros(num_images, dtype=np.int32),
+            image_sizes=np.array([[6, 5]] * num_images, dtype=np.int32),
+        ),
+        metadata={"evaluation_protocol": "default"})
+
+    token = CancellationToken()
+    with token, zero_copy():
+        outputs = list(render_all_images([method_fast, method_slow], dataset, output=str(tmp_path / "output")))
+    # The render threads use the cancellation token and the backend options of the caller
+    assert contexts == [(token, True)] * num_images
+
+    # The images are distributed across the methods, but yielded and saved in order
+    assert sorted(calls_fast + calls_slow) == list(range(num_images))
+    assert len(calls_fast) > len(calls_slow) > 0
+    assert [int(x["color"][0, 0, 0]) for x in outputs] == list(range(num_images))
+    for i in range(num_images):
+        assert np.array(Image.open(tmp_path / "output" / "color" / f"{i}.png"))[0, 0, 0] == i
+
+    # Rendering can be cancelled
+    token = CancellationToken()
+    with token, pytest.raises(CancelledException):
+        for i, _ in enumerate(render_all_images([method_fast, method_slow], dataset, output=str(tmp_path / "output2"))):
+            if i == 1:
+                token.cancel()
+    assert len(contexts) < 2 * num_images
+
+
+def test_render_and_evaluate_all(tmp_path):
+    from nerfbaselines import metrics, new_cameras, new_dataset
+    from nerfbaselines.evaluation import render_all_images, _render_and_evaluate_all, DefaultEvaluationProtocol
+
+    np.random.seed(42)
+    num_images = 12
+    # Images of different sizes are evaluated in different batches, 
+    # the file names are not sorted (0, 1, 10, 11, 2, ...)
+    sizes = [(16, 12)] * 3 + [(15, 12)] * 4 + [(16, 12)] * 5
+    predictions = [np.random.randint(0, 255, (h, w, 3), dtype=np.uint8) for w, h in sizes]
+    dataset = new_dataset(
+        images=[np.random.randint(0, 255, (h, w, 3), dtype=np.uint8) for w, h in sizes],
+        image_paths=[f"{i}.png" for i in range(num_images)],
+        cameras=new_cameras(
+            poses=np.eye(4)[None, :3, :4].repeat(num_images, axis=0),
+            intrinsics=np.array([[5, 5, 3, i] for i in range(num_images)], dtype=np.float32),
+            camera_models=np.zeros(num_images, dtype=np.int32),
+            image_sizes=np.array(sizes, dtype=np.int32),
+        ),
+        metadata={"evaluation_protocol": "default", "color_space": "srgb", "background_color": np.array([0, 0, 0], dtype=np.uint8)})
+    method = mock.MagicMock()
+    method.get_info.return_value = {}
+    method.render.side_effect = lambda camera, options=None: {"color": predictions[int(camera.intrinsics[3])]}
+
+    rendered = []
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips), \
+            mock.patch("nerfbaselines.io.datetime") as mock_datetime:
+        mock_datetime.utcnow.return_value.isoformat.return_value = "2024-01-01T00:00:00"
+        list(render_all_images(method, dataset, output=str(tmp_path / "predictions.tar.gz")))
+        expected = evaluate(str(tmp_path / "predictions.tar.gz"), output=str(tmp_path / "results.json"), evaluation_protocol=DefaultEvaluationProtocol())
+
+        out, _ = _render_and_evaluate_all(method, dataset, 
+                                          str(tmp_path / "predictions2.tar.gz"), str(tmp_path / "results2.json"),
+                                          evaluation_protocol=DefaultEvaluationProtocol(),
+                                          on_prediction=lambda i, pred: rendered.append(i))
+    assert rendered == list(range(num_images))
+    assert (tmp_path / "predictions2.tar.gz").exists()
+    assert out == expected
+    with open(tmp_path / "results.json", "r") as f, open(tmp_path / "results2.json", "r") as f2:
+        assert json.load(f) == json.load(f2)
+
+    # If the files arriving out of order do not fit the buffer, the saved files are hashed
+    from nerfbaselines import evaluation
+    with mock.patch.object(metrics, "lpips", _fake_lpips), \
+            mock.patch.object(metrics, "lpips_vgg", _fake_lpips), \
+            mock.patch("nerfbaselines.io._PREDICTIONS_BUFFER_MEMORY", 0), \
+            mock.patch.object(evaluation, "get_predictions_sha", wraps=evaluation.get_predictions_sha) as get_predictions_sha, \
+            mock.patch("nerfbaselines.io.datetime") as mock_datetime:
+        mock_datetime.utcnow.return_value.isoformat.return_value = "2024-01-01T00:00:00"
+        out, _ = _render_and_evaluate_all(method, dataset, 
+                                          str(tmp_path / "predictions3.tar.gz"), str(tmp_path / "results3.json"),
+                                          evaluation_protocol=DefaultEvaluationProtocol())
+    get_predictions_sha.assert_called_once()
+    assert out == expected
@@ -107,3 +107,44 @@ def test_load_and_save_trajectory(tmp_path):
         json.dumps(round_floats(data2), indent=2, sort_keys=True) == 
         json.dumps(round_floats(orig), indent=2, sort_keys=True)
     )
+
+
+def test_save_predictions_pipeline(tmp_path):
+    import tarfile
+    from unittest import mock
+    import numpy as np
+    from nerfbaselines import io, new_cameras, new_dataset
+
+    num_images = 9
+    dataset = new_dataset(
+        images=[np.random.randint(0, 255, (5, 6, 3), dtype=np.uint8) for _ in range(num_images)],
+        image_paths=[f"{i}.png" for i in range(num_images)],
+        cameras=new_cameras(
+            poses=np.eye(4)[None, :3, :4].repeat(num_images, axis=0),
+            intrinsics=np.array([[5, 5, 3, 2]] * num_images, dtype=np.float32),
+            camera_models=np.zeros(num_images, dtype=np.int32),
+            image_sizes=np.array([[6, 5]] * num_images, dtype=np.int32),
+            nears_fars=np.array([[0.1, 10]] * num_images, dtype=np.float32),
+        ),
+        metadata={"evaluation_protocol": "default"})
+    predictions = [{
+        "color": np.random.randint(0, 255, (5, 6, 3), dtype=np.uint8),
+        "depth": np.random.rand(5, 6).astype(np.float32),
+    } for _ in range(num_images)]
+
+    def _read_members(path):
+        with tarfile.open(path, "r:gz") as tar:
+            return [(x.name, tar.extractfile(x).read()) for x in tar.getmembers() if x.name != "info.json"]  # type: ignore
+
+    with mock.patch.object(io, "_SAVE_PREDICTIONS_WORKERS", 1):
+        out = list(io._save_predictions_iterate(str(tmp_path / "serial.tar.gz"), iter(predictions), dataset))
+    assert [id(x) for x in out] == [id(x) for x in predictions]
+    with mock.patch.object(io, "_SAVE_PREDICTIONS_WORKERS", 4):
+        out = list(io._save_predictions_iterate(str(tmp_path / "parallel.tar.gz"), iter(predictions), dataset))
+    assert [id(x) for x in out] == [id(x) for x in predictions]
+
+    # The archive members are written in the same order
+    members = _read_members(tmp_path / "parallel.tar.gz")
+    assert members == _read_members(tmp_path / "serial.tar.gz")
+    assert [x[0] for x in members[:5]] == ["gt-color/0.png", "color/0.png", "cameras/0.npz", "depth/0.bin", "depth-rgb/0.png"]
+    assert len(members) == 5 * num_images
@@ -1,6 +1,7 @@
 import importlib.resources
 import sys
 from typing import cast
+from unittest import mock
 import numpy as np
 import pytest
 from nerfbaselines.metrics import torchmetrics_ssim, dmpix_ssim
@@ -81,6 +82,54 @@ def test_dmpix_ssim(kernel_size, sigma):
     np.testing.assert_allclose(ssim, reference_ssim, atol=1e-5, rtol=0)
 
 
+def _rowwise_gaussian_filter(kernel_size=11, sigma=1.5):
+    # Original (row-by-row) implementation of the dm_pix Gaussian blur
+    hw = kernel_size // 2
+    shift = (2 * hw - kernel_size + 1) / 2
+    f_i = ((np.arange(kernel_size) - hw + shift) / sigma) ** 2
+    filt = np.exp(-0.5 * f_i)
+    filt /= np.sum(filt)
+
+    def filter_fn_vmap(x):
+        return np.stack([np.convolve(y, filt, mode="valid") for y in x], 0)
+
+    def filter_fn_y(z):
+        z_flat = np.moveaxis(z, -3, -1).reshape((-1, z.shape[-3]))
+        z_filtered_shape = ((z.shape[-4],) if z.ndim == 4 else ()) + (z.shape[-2], z.shape[-1], -1)
+        return np.moveaxis(filter_fn_vmap(z_flat).reshape(z_filtered_shape), -1, -3)
+
+    def filter_fn_x(z):
+        z_flat = np.moveaxis(z, -2, -1).reshape((-1, z.shape[-2]))
+        z_filtered_shape = ((z.shape[-4],) if z.ndim == 4 else ()) + (z.shape[-3], z.shape[-1], -1)
+        return np.moveaxis(filter_fn_vmap(z_flat).reshape(z_filtered_shape), -1, -2)
+
+    return lambda z: filter_fn_y(filter_fn_x(z))
+
+
+@pytest.mark.parametrize("kernel_size", [None, 3, 4])
+@pytest.mark.parametrize("sigma", [None, 0.5])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("use_cv2", [True, False])
+def test_dmpix_ssim_rowwise_filter(kernel_size, sigma, dtype, use_cv2):
+    np.random.seed(42)
+    a = (np.random.rand(3, 47, 41, 3) * 0.9 + 0.05).astype(dtype)
+    b = (np.random.rand(3, 47, 41, 3) * 0.9 + 0.05).astype(dtype)
+    kwargs = {}
+    if kernel_size is not None:
+        kwargs["kernel_size"] = kernel_size
+    if sigma is not None:
+        kwargs["sigma"] = sigma
+
+    reference_ssim = dmpix_ssim(a, b, filter_fn=_rowwise_gaussian_filter(**kwargs), **kwargs)
+    if use_cv2:
+        pytest.importorskip("cv2")
+        ssim = dmpix_ssim(a, b, **kwargs)
+    else:
+        with mock.patch.dict(sys.modules, {"cv2": None}):
+            ssim = dmpix_ssim(a, b, **kwargs)
+    np.testing.assert_allclose(ssim, reference_ssim, atol=1e-7, rtol=0)
+
+
 @pytest.mark.filterwarnings("ignore::UserWarning:torchvision")
 @pytest.mark.parametrize("metric", ["torchmetrics_ssim", "dmpix_ssim", "ssim", "mse", "mae", "psnr"])
 def test_metric(metric):
@@ -132,6 +181,96 @@ def test_psnr():
         np.testing.assert_allclose(val, val2, atol=1e-5, rtol=0)
 
 
+@pytest.mark.parametrize("batch_shape", [(), (3,), (2, 2)])
+def test_compute_image_metrics(batch_shape):
+    np.random.seed(42)
+    # Values outside of [0, 1] are clipped by all metrics
+    a = np.random.rand(*batch_shape, 33, 38, 3) * 1.2 - 0.1
+    b = np.random.rand(*batch_shape, 33, 38, 3) * 1.2 - 0.1
+    a_copy, b_copy = a.copy(), b.copy()
+
+    out = metrics.compute_image_metrics(a, b, run_lpips=False)
+    assert set(out.keys()) == {"psnr", "ssim", "mae", "mse"}
+    for name in ("psnr", "ssim", "mae", "mse"):
+        assert np.shape(out[name]) == batch_shape, name
+    np.testing.assert_array_equal(out["mse"], metrics.mse(a, b))
+    np.testing.assert_array_equal(out["psnr"], metrics.psnr(a, b))
+    np.testing.assert_allclose(out["mae"], metrics.mae(a, b), atol=1e-7, rtol=0)
+    np.testing.assert_array_equal(out["ssim"], metrics.ssim(a, b))
+
+    # Inputs are not modified
+    np.testing.assert_array_equal(a, a_copy)
+    np.testing.assert_array_equal(b, b_copy)
+
+    # Different shape raises error
+    with pytest.raises(Exception):
+        metrics.compute_image_metrics(a, b[..., :-1, :], run_lpips=False)
+
+
+def test_compute_image_metrics_lpips():
+    np.random.seed(42)
+    a = np.random.rand(2, 33, 38, 3)
+    b = np.random.rand(2, 33, 38, 3)
+    lpips_inputs = []
+
+    def lpips(x, y):
+        lpips_inputs.append((x, y))
+        return np.zeros(x.shape[:-3], dtype=np.float32)
+
+    with mock.patch.object(metrics, "lpips", lpips):
+        out = metrics.compute_image_metrics(a, b)
+    np.testing.assert_array_equal(out["lpips"], np.zeros((2,), dtype=np.float32))
+
+    # LPIPS receives the normalized inputs which are not normalized (copied) again
+    x, y = lpips_inputs[0]
+    assert x.dtype == np.float32 and y.dtype == np.float32
+    assert metrics._normalize_input(x) is x
+    assert metrics._normalize_input(y) is y
+    np.testing.assert_array_equal(x, a.astype(np.float32))
+
+
+@pytest.mark.extras
+def test_lpips_mini_batches():
+    import torch
+
+    batch_sizes = []
+
+    class FakeNet:
+        def forward(self, a, b):
+            batch_sizes.append(len(a))
+            return (a - b).abs().mean((1, 2, 3))
+
+    np.random.seed(42)
+    a = np.random.rand(2, 3, 16, 12, 3).astype(np.float32)
+    b = np.random.rand(2, 3, 16, 12, 3).astype(np.float32)
+    ta = metrics._lpips_prepare_input(a, torch.device("cpu"))
+    tb = metrics._lpips_prepare_input(b, torch.device("cpu"))
+    assert ta.shape == (6, 3, 16, 12)
+    expected = np.abs(a - b).mean((-3, -2, -1)) * 2
+    out = metrics._lpips_forward(ta, tb, FakeNet(), (2, 3))
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+    assert batch_sizes == [6]
+
+    batch_sizes.clear()
+    out = metrics._lpips_forward(ta, tb, FakeNet(), (2, 3), batch_size=4)
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+    assert batch_sizes == [4, 2]
+
+    # The batch size is bounded by the memory budget
+    with mock.patch.object(metrics, "_LPIPS_BATCH_MEMORY", 4096 * 16 * 12 * 4):
+        assert metrics._get_lpips_batch_size("vgg", 16, 12) == 4
+        assert metrics._get_lpips_batch_size("vgg", 1000, 1000) == 1
+
+
+@pytest.mark.benchmark(group="metrics", min_rounds=1, max_time=2.0, warmup=False)
+def test_compute_image_metrics_1080p_benchmark(benchmark):
+    np.random.seed(42)
+    a = np.random.rand(1, 1080, 1920, 3).astype(np.float32)
+    b = np.random.rand(1, 1080, 1920, 3).astype(np.float32)
+    out = benchmark(lambda: metrics.compute_image_metrics(a, b, run_lpips=False))
+    assert out["psnr"].shape == (1,)
+
+
 @pytest.mark.extras
 @pytest.mark.filterwarnings("ignore:The parameter 'pretrained' is deprecated since 0.13")
 @pytest.mark.filterwarnings("ignore:Importing `spectral_angle_mapper` from `torchmetrics.functional` was deprecated")
@@ -1,11 +1,14 @@
 import pytest
 import os
+import sys
 from functools import partial
 import threading
 import pytest
 import time
 from time import sleep
 import gc
+import socket
+import struct
 from unittest import mock
 try:
     from typeguard import typeguard_ignore  # type: ignore
@@ -232,6 +235,49 @@ def test_rpc_backend_yield():
     assert len(worker._instances) == 0
 
 
+@pytest.mark.parametrize("prefetch", [1, 2, 3, 8])
+def test_rpc_backend_yield_prefetch(prefetch):
+    from nerfbaselines.backends._rpc import RPCWorker, RPCBackend
+    worker = RPCWorker()
+    worker.handle = handle = mock.MagicMock(side_effect=worker.handle)
+    backend = RPCBackend(protocol=MockProtocol(worker))
+    inst = backend.static_call(f"{_TestObject.__module__}:{_TestObject.__name__}", 1)
+    handle.reset_mock()
+
+    with backends.iterator_prefetch(prefetch):
+        iterator = inst.test_iter()
+    assert list(iterator) == list(range(5))
+    # 5 items and StopIteration
+    assert handle.call_count == (6 + prefetch - 1) // prefetch
+    assert len(worker._instances) == 1
+
+    # Errors are raised after the pulled items
+    handle.reset_mock()
+    out = []
+    with backends.iterator_prefetch(prefetch):
+        iterator = inst.test_iter_interrupt()
+    with pytest.raises(RuntimeError):
+        for i in iterator:
+            out.append(i)
+    assert out == list(range(5))
+    del iterator
+    gc.collect()
+    assert len(worker._instances) == 1
+
+    # The batches are limited by the size of the items
+    handle.reset_mock()
+    with mock.patch("nerfbaselines.backends._rpc._ITERATOR_PREFETCH_MAX_BYTES", 1), \
+            mock.patch.object(_TestObject, "test_iter", lambda self: iter([b"ab"] * 5)):
+        with backends.iterator_prefetch(prefetch):
+            iterator = inst.test_iter()
+        assert list(iterator) == [b"ab"] * 5
+    assert handle.call_count == 6
+
+    with pytest.raises(ValueError):
+        with backends.iterator_prefetch(0):
+            pass
+
+
 @typeguard_ignore
 def test_rpc_backend_cancel():
     from nerfbaselines.backends._rpc import RPCWorker, RPCBackend
@@ -275,6 +321,158 @@ def test_rpc_backend_cancel():
     gc.collect()
     assert len(worker._instances) == 0
 
+@typeguard_ignore
+def test_rpc_backend_async():
+    from nerfbaselines.backends._rpc import RPCWorker, RPCBackend
+    worker = RPCWorker()
+    backend = RPCBackend(protocol=MockProtocol(worker))
+
+    future = backend.static_call_async(f"{_test_function.__module__}:{_test_function.__name__}", 1, 2)
+    assert future.result() == 3
+
+    inst = backend.static_call_async(f"{_TestObject.__module__}:{_TestObject.__name__}", 1).result()
+    future = backend.instance_call_async(inst.__nb_virtual_instance__.id, "test_method", 5, c=3)
+    assert future.result() == 1
+
+    # Errors are raised when the result is requested
+    future = backend.instance_call_async(inst.__nb_virtual_instance__.id, "test_raise")
+    assert isinstance(future.exception(), ValueError)
+    with pytest.raises(ValueError):
+        future.result()
+    assert not backend._pending
+
+    # SimpleBackend returns finished futures
+    simple_backend = SimpleBackend()
+    future = simple_backend.static_call_async(f"{_test_function.__module__}:{_test_function.__name__}", 1, 2)
+    assert future.done()
+    assert future.result() == 3
+
+
+def _test_function_array(i, delay=0.0):
+    import numpy as np
+    sleep(delay)
+    return np.full((256, 512, 3), i, dtype=np.float32)
+
+
+@typeguard_ignore
+def test_remote_process_rpc_backend_async():
+    import numpy as np
+    from nerfbaselines.backends._rpc import RemoteProcessRPCBackend
+    from nerfbaselines.backends._transport_protocol import TransportProtocol as MessageProtocol
+
+    fn = f"{_test_function_array.__module__}:{_test_function_array.__name__}"
+    protocol = MessageProtocol()
+    with RemoteProcessRPCBackend(protocol=protocol) as backend:
+        # Warmup
+        backend.static_call(fn, 0)
+        assert backend._rpc_backend is not None
+
+        # Multiple requests in flight, the results are matched by the request ID
+        futures = [backend.static_call_async(fn, i, 0.01) for i in range(12)]
+        for i, future in enumerate(futures):
+            out = future.result()
+            assert out.shape == (256, 512, 3)
+            np.testing.assert_array_equal(out, i)
+        assert not backend._rpc_backend._pending
+
+        # Concurrent synchronous calls from multiple threads
+        outs = {}
+        def _call(i):
+            outs[i] = backend.static_call(fn, i)
+        threads = [threading.Thread(target=_call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(outs.keys()) == list(range(8))
+        for i, out in outs.items():
+            np.testing.assert_array_equal(out, i)
+
+        # Errors are propagated to the corresponding future
+        future_error = backend.static_call_async(f"{_test_function_exception.__module__}:{_test_function_exception.__name__}")
+        future = backend.static_call_async(fn, 3)
+        with pytest.raises(Exception):
+            future_error.result()
+        np.testing.assert_array_equal(future.result(), 3)
+
+        # Synchronous calls still work (and use the shared memory)
+        np.testing.assert_array_equal(backend.static_call(fn, 4), 4)
+
+
+@typeguard_ignore
+def test_remote_process_rpc_backend_undeserializable_reply():
+    import numpy as np
+    from nerfbaselines.backends._rpc import RemoteProcessRPCBackend
+    from nerfbaselines.backends._transport_protocol import TransportProtocol as MessageProtocol
+
+    fn = f"{_test_function_array.__module__}:{_test_function_array.__name__}"
+    bad_fn = f"{_test_function.__module__}:{_test_function.__name__}"
+    with RemoteProcessRPCBackend(protocol=MessageProtocol()) as backend:
+        backend.static_call(fn, 0)
+        assert backend._rpc_backend is not None
+        protocol = backend._rpc_backend._protocol
+        receive = protocol.receive
+
+        def _receive(*args, **kwargs):
+            # The reply is fully received, but it cannot be deserialized
+            # (e.g., an exception class which only exists in the worker environment)
+            msg = receive(*args, **kwargs)
+            if isinstance(msg.get("result"), str) and msg["result"] == "bad":
+                raise RuntimeError("Cannot be deserialized")
+            return msg
+
+        with mock.patch.object(protocol, "receive", _receive):
+            # Received by the calling thread
+            with pytest.raises(RuntimeError, match="Cannot be deserialized"):
+                backend.static_call(bad_fn, "ba", "d")
+            np.testing.assert_array_equal(backend.static_call(fn, 1), 1)
+
+            # Received by the receiver thread, the thread keeps running
+            futures = [backend.static_call_async(fn, 2, 0.05), backend.static_call_async(bad_fn, "ba", "d"), backend.static_call_async(fn, 3)]
+            np.testing.assert_array_equal(futures[0].result(timeout=10), 2)
+            with pytest.raises(RuntimeError, match="Cannot be deserialized"):
+                futures[1].result(timeout=10)
+            np.testing.assert_array_equal(futures[2].result(timeout=10), 3)
+            np.testing.assert_array_equal(backend.static_call(fn, 4), 4)
+        assert not backend._rpc_backend._pending
+
+
+@typeguard_ignore
+def test_remote_process_rpc_backend_tracing(tmp_path):
+    import json
+    from nerfbaselines.backends._rpc import RemoteProcessRPCBackend
+    from nerfbaselines.backends._transport_protocol import TransportProtocol as MessageProtocol
+
+    fn = f"{_test_function_array.__module__}:{_test_function_array.__name__}"
+    with RemoteProcessRPCBackend(protocol=MessageProtocol()) as backend:
+        backend.static_call(fn, 0)
+        with backends.rpc_tracing(str(tmp_path / "trace.json")) as tracer:
+            for i in range(3):
+                backend.static_call(fn, i, 0.01)
+            futures = [backend.static_call_async(fn, i) for i in range(4)]
+            for future in futures:
+                future.result()
+
+        # Calls outside of the context are not recorded
+        backend.static_call(fn, 0)
+
+    stats = tracer.get_histograms()[fn]
+    assert stats["count"] == 7
+    assert 0.01 <= stats["max"] and stats["min"] <= stats["p50"] <= stats["p99"] <= stats["max"]
+    assert stats["execute"] > 0
+    assert stats["bytes_in"] >= 256 * 512 * 3 * 4
+    assert stats["shm_bytes"] >= 7 * 256 * 512 * 3 * 4
+    assert stats["socket_bytes"] == 0 and stats["socket_fallbacks"] == 0
+    assert fn in tracer.format_summary()
+
+    with open(tmp_path / "trace.json", "r") as f:
+        trace = json.load(f)
+    names = [x["name"] for x in trace["traceEvents"] if x["ph"] == "X"]
+    assert names.count(fn) == 14
+    assert names.count("execute") == 7
+    assert names.count("serialize") == 7
+
+
 def test_simple_backend_static_function():
     backend = SimpleBackend()
 
@@ -370,6 +568,128 @@ def test_remote_process_rpc_backend_cancel():
     assert duration < 5.0
 
 
+def _test_function_pid():
+    return os.getpid()
+
+
+@typeguard_ignore
+def test_remote_process_rpc_backend_worker_pool(tmp_path, monkeypatch):
+    from nerfbaselines.backends._rpc import RemoteProcessRPCBackend, _get_worker_pool_path
+    from nerfbaselines.backends._transport_protocol import TransportProtocol
+
+    if sys.platform == "win32":
+        pytest.skip("Worker pool is not supported on Windows")
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL", "1")
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_DIR", str(tmp_path / "pool"))
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_IDLE_TIMEOUT", "3")
+    fn = f"{_test_function_pid.__module__}:{_test_function_pid.__name__}"
+
+    with RemoteProcessRPCBackend(protocol=TransportProtocol()) as backend:
+        pid = backend.static_call(fn)
+        assert backend._worker_process is not None
+    pool_path = _get_worker_pool_path(*backend._get_worker_pool_key())
+    assert os.path.exists(pool_path)
+
+    # The second backend attaches to the running worker
+    with RemoteProcessRPCBackend(protocol=TransportProtocol()) as backend:
+        assert backend.static_call(fn) == pid
+        assert backend._worker_process is None
+        assert backend.static_call(f"{_test_function.__module__}:{_test_function.__name__}", 1, 2) == 3
+
+    # The worker exits after the idle timeout
+    for _ in range(100):
+        if not os.path.exists(pool_path):
+            break
+        time.sleep(0.1)
+    assert not os.path.exists(pool_path)
+
+
+def test_worker_pool_key_environment(monkeypatch):
+    from nerfbaselines.backends._rpc import RemoteProcessRPCBackend
+
+    backend = RemoteProcessRPCBackend()
+    key = backend._get_worker_pool_key()
+    # Variables not affecting the worker
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_IDLE_TIMEOUT", "5")
+    monkeypatch.setenv("_NERFBASELINES_TEST_UNRELATED", "1")
+    assert backend._get_worker_pool_key() == key
+
+    # Variables affecting the registry, the imports, or the devices
+    for name in ("NERFBASELINES_REGISTER", "PYTHONPATH", "NERFBASELINES_PREFIX", "CUDA_VISIBLE_DEVICES"):
+        with monkeypatch.context() as m:
+            m.setenv(name, "/nonexistent-test-value")
+            assert backend._get_worker_pool_key() != key, name
+
+
+@typeguard_ignore
+def test_remote_process_rpc_backend_worker_pool_not_connected(tmp_path, monkeypatch):
+    from nerfbaselines.backends import _rpc
+    from nerfbaselines.backends._transport_protocol import TransportProtocol
+
+    if sys.platform == "win32":
+        pytest.skip("Worker pool is not supported on Windows")
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL", "1")
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_DIR", str(tmp_path / "pool"))
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_IDLE_TIMEOUT", "1")
+    # The pool worker accepts the session, but never connects
+    monkeypatch.setattr(_rpc, "_attach_pool_worker", lambda *args, **kwargs: True)
+    monkeypatch.setattr(_rpc, "_WORKER_POOL_CONNECT_TIMEOUT", 0.5)
+
+    with _rpc.RemoteProcessRPCBackend(protocol=TransportProtocol()) as backend:
+        assert backend.static_call(f"{_test_function.__module__}:{_test_function.__name__}", 1, 2) == 3
+        assert backend._worker_process is not None
+
+
+def test_worker_pool_directory_validation(tmp_path, monkeypatch):
+    from nerfbaselines.backends._rpc import _get_worker_pool_path
+
+    if sys.platform == "win32":
+        pytest.skip("Worker pool is not supported on Windows")
+    path = tmp_path / "pool"
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_DIR", str(path))
+    pool_path = _get_worker_pool_path("test")
+    assert pool_path is not None and os.path.dirname(pool_path) == str(path)
+    assert os.stat(path).st_mode & 0o777 == 0o700
+
+    # Directory accessible to other users
+    os.chmod(path, 0o755)
+    assert _get_worker_pool_path("test") is None
+    os.chmod(path, 0o700)
+    assert _get_worker_pool_path("test") is not None
+
+    # Directory owned by another user
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    assert _get_worker_pool_path("test") is None
+    monkeypatch.undo()
+
+    # Symlink to a directory
+    os.symlink(path, tmp_path / "link")
+    monkeypatch.setenv("NERFBASELINES_WORKER_POOL_DIR", str(tmp_path / "link"))
+    assert _get_worker_pool_path("test") is None
+
+    # XDG_RUNTIME_DIR is preferred over the temporary directory
+    monkeypatch.delenv("NERFBASELINES_WORKER_POOL_DIR")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(path))
+    pool_path = _get_worker_pool_path("test")
+    assert pool_path is not None and os.path.dirname(pool_path) == str(path / "nerfbaselines")
+
+
+def test_worker_pool_handshake_messages():
+    from nerfbaselines.backends._rpc import _worker_pool_send, _worker_pool_recv, _WORKER_POOL_MAX_MESSAGE_SIZE
+
+    a, b = socket.socketpair()
+    with a, b:
+        message = {"message": "session", "configuration": {"authkey": b"\x00\x01", "port": 1, "pipe_name": "a"}, "cwd": "/"}
+        _worker_pool_send(a, message)
+        assert _worker_pool_recv(b) == message
+
+        # Oversized messages are rejected before reading them
+        a.sendall(struct.pack("!I", _WORKER_POOL_MAX_MESSAGE_SIZE + 1))
+        with pytest.raises(EOFError):
+            _worker_pool_recv(b)
+
+
 @typeguard_ignore
 def test_remote_process_rpc_backend_dead_process():
     from nerfbaselines.backends._rpc import RemoteProcessRPCBackend
@@ -597,3 +597,67 @@ def test_transport_protocol_allocator(benchmark, image_dtype, zero_copy):
 
     if exc:
         raise exc[0]
+
+
+def _make_render(height=1080, width=1920):
+    # Smooth float32 RGBA render with a constant background
+    y, x = np.meshgrid(np.linspace(0, 1, height, dtype=np.float32), np.linspace(0, 1, width, dtype=np.float32), indexing="ij")
+    color = np.ones((height, width, 4), dtype=np.float32)
+    color[..., 0] = 0.5 + 0.5 * np.sin(8 * x)
+    color[..., 1] = 0.5 + 0.5 * np.cos(6 * y)
+    color[..., 2] = x * y
+    color[: height // 3] = 1.0
+    return color
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires python3.8 or higher")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+@pytest.mark.benchmark(group="rpc-codec")
+@pytest.mark.parametrize("codec", [None, "zlib", "lz4"])
+def test_transport_protocol_codec(benchmark, monkeypatch, codec):
+    from nerfbaselines.backends._transport_protocol import TransportProtocol, _get_codec
+    import threading
+
+    if codec == "lz4":
+        pytest.importorskip("lz4")
+    monkeypatch.setenv("NERFBASELINES_PROTOCOL", "tcp")
+    message = {"color": _make_render()}
+    raw_size = message["color"].nbytes
+    wire_size = raw_size
+    if codec is not None:
+        wire_size = len(_get_codec(codec)[0](message["color"]))
+    benchmark.extra_info["raw_size"] = raw_size
+    benchmark.extra_info["wire_size"] = wire_size
+
+    p1 = TransportProtocol(shm_size=0, codec=codec)
+    p1.start_host()
+    p2 = TransportProtocol(**p1.get_worker_configuration())
+    exc = []
+
+    def handle_client():
+        try:
+            p2.connect_worker()
+            while True:
+                msg = p2.receive()
+                if msg is False: break
+                p2.send(message)
+        except Exception as e:
+            exc.append(e)
+    thread = threading.Thread(target=handle_client)
+    thread.start()
+    p1.wait_for_worker()
+    assert p1.protocol_name.endswith(f"-{codec}") == (codec is not None)
+
+    def _measure():
+        p1.send(True)
+        out = p1.receive()
+        assert isinstance(out, dict)
+    benchmark(_measure)
+    p1.send(False)
+    thread.join()
+
+    p1.close()
+    p2.close()
+
+    if exc:
+        raise exc[0]
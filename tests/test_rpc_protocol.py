@@ -234,3 +234,106 @@ def test_protocol_establish_host_first(with_echo_protocol):
         out = echo_protocol.receive()
         assert np.array_equal(dummy_data, out["data"])
         del out
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_shm_ring_allocator():
+    from multiprocessing import shared_memory
+    from nerfbaselines.backends._transport_protocol import _allocator
+
+    shm = shared_memory.SharedMemory(create=True, size=1024)
+    allocator = _allocator(shm, segment_size=1024, max_size=1024)
+    try:
+        a = allocator.allocate(400)[0]
+        b = allocator.allocate(400)[0]
+        assert allocator.acquire(a) and allocator.acquire(b)
+        allocator.reset()
+        assert allocator.get_stats()["in_use"] == 896
+
+        # The pool is exhausted
+        assert allocator.allocate(400) is None
+        assert allocator.get_stats()["fallbacks"] == 1
+
+        # The ring wraps around after the oldest allocation is released
+        allocator.release(a)
+        c = allocator.allocate(400)[0]
+        assert c == 0
+        allocator.reset()
+        # The unused allocation is only returned to the ring after the older ones
+        assert allocator.get_stats()["in_use"] == 896
+        allocator.release(b)
+        assert allocator.get_stats()["in_use"] == 0
+
+        # Buffers already allocated in the shared memory are located
+        arr = allocator.allocate_ndarray((10, 10), "float32")
+        location = allocator.get_allocation_offset(memoryview(arr).cast("B"))
+        assert location is not None
+        assert allocator.acquire(location + 64)
+        allocator.reset()
+        assert allocator.get_stats()["in_use"] == 448
+        allocator.release(location + 64)
+        assert allocator.get_stats()["in_use"] == 0
+        del arr
+    finally:
+        allocator.close()
+        shm.unlink()
+
+
+@timeout(8)
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_protocol_shm_leases(with_echo_protocol):
+    from nerfbaselines.backends._transport_protocol import TransportProtocol
+    import numpy as np
+
+    with with_echo_protocol(TransportProtocol(shm_size=1024*1024, shm_pool_size=64*1024*1024)) as echo_protocol:
+        outputs = []
+        inputs = []
+        for _ in range(4):
+            # The arrays do not fit the initial segment, the pool has to grow
+            data = np.random.rand(512, 1024)
+            echo_protocol.send({"data": data})
+            inputs.append(data)
+            outputs.append(echo_protocol.receive(zero_copy=True)["data"])
+
+        # All leased buffers are still valid
+        for data, out in zip(inputs, outputs):
+            np.testing.assert_array_equal(data, out)
+        stats = echo_protocol.get_stats()
+        assert stats["fallbacks"] == 0
+        assert stats["segments"] > 1
+        del outputs, out
+
+    # Exhausted pool falls back to the socket
+    with with_echo_protocol(TransportProtocol(shm_size=1024*1024, shm_pool_size=1024*1024)) as echo_protocol:
+        data = np.random.rand(512, 1024)
+        echo_protocol.send({"data": data})
+        out = echo_protocol.receive()["data"]
+        np.testing.assert_array_equal(data, out)
+        assert echo_protocol.get_stats()["fallbacks"] == 1
+        del out
+
+
+@timeout(4)
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+@pytest.mark.parametrize("protocol_type", ["tcp", "pipe"])
+def test_protocol_codec(with_echo_protocol, monkeypatch, protocol_type):
+    from nerfbaselines.backends._transport_protocol import TransportProtocol
+    import numpy as np
+
+    monkeypatch.setenv("NERFBASELINES_PROTOCOL", protocol_type)
+    with with_echo_protocol(TransportProtocol(shm_size=0, codec="zlib"), host_first=True) as echo_protocol:
+        # The codec is only used for TCP connections
+        assert echo_protocol.protocol_name.endswith("-zlib") == (protocol_type == "tcp")
+
+        # Compressible, incompressible, and small buffers
+        data = np.zeros((256, 256, 4), dtype=np.float32)
+        data[..., :3] = np.linspace(0, 1, 256, dtype=np.float32)[:, None, None]
+        data2 = np.random.rand(256, 256)
+        data3 = np.arange(16, dtype=np.uint8)
+        echo_protocol.send({"data": data, "data2": data2, "data3": data3})
+        out = echo_protocol.receive()
+        np.testing.assert_array_equal(data, out["data"])
+        np.testing.assert_array_equal(data2, out["data2"])
+        np.testing.assert_array_equal(data3, out["data3"])
+        assert out["data"].flags.writeable
+        del out
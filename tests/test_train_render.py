@@ -358,8 +358,8 @@ def test_train_command_undistort(tmp_path, mock_extras):
         registry.pop("_test", None)
 
 
-@pytest.mark.parametrize("output_type", ["folder", "tar"])
-def test_render_command(tmp_path, output_type):
+@pytest.mark.parametrize(("output_type", "num_workers"), [("folder", 1), ("tar", 1), ("folder", 2)])
+def test_render_command(tmp_path, output_type, num_workers, caplog):
     metrics._LPIPS_CACHE.clear()
     metrics._LPIPS_GPU_AVAILABLE = None
     sys.modules.pop("nerfbaselines._metrics_lpips", None)
@@ -396,7 +396,9 @@ def test_render_command(tmp_path, output_type):
         else:
             output = tmp_path / "output2.tar.gz"
         assert render_command.callback is not None
-        render_command.callback(str(tmp_path / "output" / "checkpoint-13"), str(tmp_path / "data"), str(output), "train", "python")
+        render_command.callback(str(tmp_path / "output" / "checkpoint-13"), str(tmp_path / "data"), str(output), "train", "python", num_workers=num_workers)
+        # The python backend renders in the current process with a single worker
+        assert ("Multiple workers are not supported with the python backend" in caplog.text) == (num_workers > 1)
 
         assert output.exists()
         if output_type == "folder":
@@ -54,3 +54,270 @@ def test_build_static_viewer(tmp_path):
     assert (tmp_path/"v1"/"index.html").exists()
     assert (tmp_path/"v1"/"viewer.js").exists()
     assert (tmp_path/"v1"/"third-party"/"three.module.js").exists()
+
+
+def test_viewer_render_websocket_coalescing():
+    import json
+    from nerfbaselines.viewer._httpserver import ViewerBackend
+    from nerfbaselines.viewer._websocket import ConnectionClosed
+
+    def request(thread, **kwargs):
+        return json.dumps({
+            "thread": thread,
+            "pose": np.eye(4)[:3].tolist(),
+            "intrinsics": [10, 10, 5, 5],
+            "image_size": [10, 10],
+            "output_type": "color",
+            **kwargs,
+        })
+
+    class FakeWebSocket:
+        def __init__(self, batches):
+            self.batches = list(batches)
+            self.buffer = []
+            self.sent = []
+
+        def receive(self, timeout=None):
+            if not self.buffer:
+                if timeout is not None:
+                    return None
+                if not self.batches:
+                    raise ConnectionClosed()
+                self.buffer.extend(self.batches.pop(0))
+            return self.buffer.pop(0)
+
+        def send(self, data):
+            self.sent.append(data)
+
+    rendered = []
+    backend = ViewerBackend(None, None, info={}, datasets={})
+    backend._render_fn = lambda _, **kwargs: (rendered.append(kwargs) or b"frame", 0.1)
+    ws = FakeWebSocket([
+        [request(1)],
+        [request(2), request(3), request(4, stream="video"), request(5)],
+    ])
+    with pytest.raises(ConnectionClosed):
+        backend.handle_render_websocket(ws)
+
+    def parse(data):
+        if isinstance(data, str):
+            return json.loads(data)
+        length = int.from_bytes(data[:4], "big")
+        return json.loads(data[4:4 + length])
+
+    replies = [parse(x) for x in ws.sent]
+    assert [(x["thread"], x["status"]) for x in replies] == [
+        (1, "ok"), (2, "superseded"), (3, "superseded"), (4, "ok"), (5, "ok")]
+    assert len(rendered) == 3
+
+
+def test_viewer_render_websocket_progressive():
+    import json
+    import struct
+    from nerfbaselines.viewer._httpserver import ViewerBackend, _ProgressiveRendering
+
+    rendered = []
+    backend = ViewerBackend(None, None, info={}, datasets={})
+    # Rendering takes 4ms per pixel
+    backend._render_fn = lambda _, **kwargs: (rendered.append(kwargs) or b"frame", 0.004 * kwargs["image_size"][0] * kwargs["image_size"][1])
+
+    def render(pose_offset, **kwargs):
+        pose = np.eye(4)[:3]
+        pose[0, 3] = pose_offset
+        out = backend.handle_render_websocket_message({
+            "thread": 1,
+            "pose": pose.tolist(),
+            "intrinsics": [10, 10, 5, 5],
+            "image_size": [10, 10],
+            "output_type": "color",
+            **kwargs,
+        }, progressive=progressive)
+        length, = struct.unpack("!I", out[:4])
+        return json.loads(out[4:4 + length])
+
+    progressive = _ProgressiveRendering()
+
+    # Without timings, the first frame is rendered at the full resolution
+    assert render(0, progressive=True)["scale"] == 1.0
+    assert rendered[-1]["image_size"] == [10, 10]
+
+    # While the camera moves, the resolution meets the target frame time (0.1s)
+    assert render(1, progressive=True)["scale"] == 0.5
+    assert rendered[-1]["image_size"] == [5, 5]
+    np.testing.assert_allclose(rendered[-1]["intrinsics"], [5, 5, 2.5, 2.5])
+
+    # Once the camera is idle, the frame is refined
+    assert render(1, progressive=True)["scale"] == 1.0
+    assert rendered[-1]["image_size"] == [10, 10]
+
+    # Non-progressive requests are always rendered at the requested resolution
+    assert "scale" not in render(2)
+    assert rendered[-1]["image_size"] == [10, 10]
+
+
+def test_viewer_render_cache():
+    from unittest import mock
+    from nerfbaselines.viewer import Viewer
+
+    model = mock.MagicMock()
+    model.get_info.return_value = {"supported_outputs": ("color", "depth")}
+    calls = []
+
+    def render(camera, options):
+        calls.append(options["outputs"])
+        h, w = camera.image_sizes[::-1]
+        out = {}
+        if "color" in options["outputs"]:
+            out["color"] = np.full((h, w, 3), 128, dtype=np.uint8)
+        if "depth" in options["outputs"]:
+            out["depth"] = np.ones((h, w), dtype=np.float32)
+        return out
+
+    model.render.side_effect = render
+    viewer = Viewer(model=model, render_cache_size=2 * 16 * 16 * 4)
+
+    def render_frame(x=0.0, **kwargs):
+        pose = np.eye(4, dtype=np.float32)[:3]
+        pose[0, 3] = x
+        kwargs = {"output_type": "color", "split_output_type": None, **kwargs}
+        return viewer._render(pose=pose, image_size=(16, 16), intrinsics=[16, 16, 8, 8],
+                              split_percentage=0.5, split_tilt=0, format="PNG", **kwargs)
+
+    frame = render_frame()
+    assert calls == [("color",)]
+
+    # Switching the output type only renders the missing outputs
+    render_frame(output_type="depth")
+    render_frame(output_type="color")
+    render_frame(output_type="depth", split_output_type="color")
+    assert calls == [("color",), ("depth",)]
+    # The cached outputs are not modified by the split view
+    assert render_frame() == frame
+
+    # A different pose is rendered, the least recently used entry is evicted
+    render_frame(1.0)
+    assert calls[2:] == [("color",)]
+    render_frame()
+    assert calls[3:] == [("color",)]
+
+    # The cache is discarded when the model changes
+    viewer.clear_render_cache()
+    render_frame()
+    assert calls[4:] == [("color",)]
+
+    # The cache is disabled by default (the model can change during training)
+    viewer = Viewer(model=model)
+    render_frame()
+    render_frame()
+    assert calls[5:] == [("color",), ("color",)]
+
+
+def test_viewer_update_encodes_in_background():
+    import io
+    from unittest import mock
+    from PIL import Image
+    from nerfbaselines.viewer import Viewer
+
+    model = mock.MagicMock()
+    model.get_info.return_value = {"supported_outputs": ("color",)}
+    model.render.side_effect = lambda camera, options: {
+        "color": np.full((*camera.image_sizes[::-1], 3), camera.poses[0, 3] * 10, dtype=np.uint8)}
+    viewer = Viewer(model=model, render_cache_size=0)
+    try:
+        for i in range(10):
+            pose = np.eye(4, dtype=np.float32)[:3]
+            pose[0, 3] = i
+            viewer._request_queue.put({
+                "feedid": f"feed-{i}", "pose": pose, "image_size": (16, 8), "intrinsics": [16, 16, 8, 4],
+                "output_type": "color", "split_output_type": None, "split_percentage": 0.5, "split_tilt": 0,
+                "format": "PNG"})
+        for _ in range(10):
+            viewer.update()
+
+        results = {}
+        for _ in range(10):
+            out = viewer._output_queue.get(timeout=10)
+            assert out["type"] == "result"
+            assert out["render_time"] >= 0
+            results[out["feedid"]] = out["result"]
+    finally:
+        viewer.close()
+
+    for i in range(10):
+        with Image.open(io.BytesIO(results[f"feed-{i}"])) as img:
+            frame = np.array(img)
+        assert frame.shape == (8, 16, 3)
+        assert (frame == i * 10).all()
+
+
+def test_viewer_frame_channel():
+    from nerfbaselines.viewer._frame_channel import FrameChannel
+
+    channel = FrameChannel.create(num_slots=2, slot_size=16)
+    if channel is None:
+        pytest.skip("Shared memory is not supported")
+    reader = FrameChannel.attach(channel.get_spec())
+    try:
+        slot1 = channel.write(b"frame1")
+        slot2 = channel.write(b"frame2")
+        assert slot1 is not None and slot2 is not None and slot1 != slot2
+        # All slots are full
+        assert channel.write(b"frame3") is None
+        assert reader.read(slot1, 6) == b"frame1"
+        slot3 = channel.write(b"frame3")
+        assert slot3 == slot1
+        # Frames larger than a slot are not written
+        assert channel.write(b"x" * 17) is None
+        assert reader.read(slot2, 6) == b"frame2"
+        assert reader.read(slot3, 6) == b"frame3"
+    finally:
+        reader.close()
+        channel.close()
+
+
+def test_viewer_render_fn_multiple_threads():
+    import queue
+    import threading
+    from nerfbaselines.viewer._httpserver import _make_render_fn
+    from nerfbaselines.viewer._frame_channel import FrameChannel
+
+    request_queue = queue.Queue()
+    output_queue = queue.Queue()
+    channel = FrameChannel.create(num_slots=2, slot_size=64)
+
+    def serve():
+        # Answer the requests in the reverse order to test the demultiplexing
+        requests = [request_queue.get() for _ in range(8)]
+        for req in reversed(requests):
+            frame = f"frame-{req['index']}".encode("utf8")
+            slot = channel.write(frame) if channel is not None else None
+            output_queue.put({
+                "type": "result",
+                "feedid": req["feedid"],
+                **({"result": frame} if slot is None else {"result_slot": slot, "result_size": len(frame)}),
+                "render_time": 0.1,
+            })
+        output_queue.put({"type": "end"})
+
+    server_thread = threading.Thread(target=serve, daemon=True)
+    server_thread.start()
+    results = {}
+    try:
+        with _make_render_fn(request_queue, output_queue, channel.get_spec() if channel is not None else None) as render_fn:
+            def run(index):
+                results[index] = render_fn(None, index=index)
+
+            threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+            assert not any(thread.is_alive() for thread in threads)
+
+            # The viewer was closed
+            with pytest.raises(SystemExit):
+                render_fn(None, index=8)
+    finally:
+        if channel is not None:
+            channel.close()
+    assert results == {i: (f"frame-{i}".encode("utf8"), 0.1) for i in range(8)}